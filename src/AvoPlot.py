@@ -21,31 +21,120 @@
 This module contains the main script for running AvoPlot.
 """
 
+import sys
 import optparse
 
 import avoplot
-from avoplot.gui import  main
+from avoplot import file_loaders
+from avoplot import headless
+
 
 def __parse_cmd_line():
     """
     Function parses the command line input and returns a tuple 
     of (options, args).
     """
-    usage = ("Usage: %prog [options]")
+    usage = ("Usage: %prog [options]\n"
+             "       %prog --render [rendering options] FILE [FILE ...]")
         
     parser = optparse.OptionParser(usage, version=avoplot.VERSION)
+    
+    parser.add_option("--render", action="store_true", default=False,
+                      help="Plot each of the data files given as arguments "
+                      "straight to an image file, without starting the GUI")
+    
+    render_opts = optparse.OptionGroup(parser, "Rendering options", 
+                                       "These are only used with --render")
+    render_opts.add_option("-o", "--output-dir", dest="output_dir",
+                           help="Directory to save the images in (defaults to "
+                           "the directories of the data files)")
+    render_opts.add_option("-f", "--format", dest="output_format", 
+                           type="choice", default="png",
+                           choices=headless.OUTPUT_FORMATS,
+                           help="Image format to save (%s). Default is "
+                           "png"%', '.join(headless.OUTPUT_FORMATS))
+    loader_names = file_loaders.get_loader_names()
+    render_opts.add_option("-l", "--loader", dest="loader_name",
+                           type="choice", choices=loader_names,
+                           help="Name of the file loader to use (%s). Chosen "
+                           "automatically by default"%', '.join(["'%s'"%n 
+                                                        for n in loader_names]))
+    render_opts.add_option("-x", "--xcol", dest="xcol",
+                           help="Column to use for the x data, by name "
+                           "(A, B ...) or title. Default is the first column")
+    render_opts.add_option("-y", "--ycol", dest="ycols", action="append",
+                           help="Column to plot against the x data. May be "
+                           "given several times. Default is all other numeric "
+                           "columns")
+    render_opts.add_option("-s", "--style", dest="style", default="-",
+                           help="Matplotlib format string for the lines, "
+                           "e.g. 'r.'")
+    render_opts.add_option("-t", "--title", dest="title",
+                           help="Title of the plots (defaults to the file "
+                           "names)")
+    render_opts.add_option("--size", dest="figsize", type="float", nargs=2,
+                           default=(8.0, 6.0), metavar="WIDTH HEIGHT",
+                           help="Size of the images in inches. Default is 8 6")
+    render_opts.add_option("--dpi", dest="dpi", type="int", default=100,
+                           help="Resolution of the images. Default is 100")
+    render_opts.add_option("-j", "--processes", dest="processes", type="int",
+                           help="Number of files to render in parallel "
+                           "(defaults to the number of CPUs)")
+    parser.add_option_group(render_opts)
 
     (options, args) = parser.parse_args()
+    
+    if options.render and not args:
+        parser.error("--render requires at least one data file")
 
     return (options, args)
 
 
+def __render(options, args):
+    """
+    Renders the data files in args to image files without starting the GUI,
+    and returns the exit status for the script.
+    """
+    render_options = headless.RenderOptions(output_dir=options.output_dir,
+                                            output_format=options.output_format,
+                                            loader_name=options.loader_name,
+                                            xcol=options.xcol,
+                                            ycols=options.ycols,
+                                            style=options.style,
+                                            title=options.title,
+                                            figsize=options.figsize,
+                                            dpi=options.dpi)
+    failures = []
+    
+    def print_result(result):
+        filename, output_filename, error = result
+        if error is None:
+            print "%s -> %s"%(filename, output_filename)
+        else:
+            print >>sys.stderr, "Failed to render %s (%s)"%(filename, error)
+            failures.append(filename)
+    
+    headless.render_files(args, render_options, processes=options.processes,
+                          callback=print_result)
+    
+    if failures:
+        print >>sys.stderr, "%d of %d files could not be rendered"%(len(failures),
+                                                                    len(args))
+        return 1
+    return 0
+    
+
 if __name__ == '__main__':
     
     #parse any command line args
     options, args = __parse_cmd_line()
     
-    #create and run the wx app    
+    if options.render:
+        sys.exit(__render(options, args))
+    
+    #create and run the wx app (the gui is only imported here, so that 
+    #rendering doesn't need it)
+    from avoplot.gui import main
     app = main.AvoPlotApp(options, args)
     app.MainLoop()
 
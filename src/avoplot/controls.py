@@ -71,8 +71,8 @@ class AvoPlotControlPanelBase(wx.ScrolledWindow):
     def on_display(self):
         """
         This method will be called each time the control panel is displayed i.e.
-        every time that the element that the control panel operates on is 
-        selected. It can be overridden by subclasses in order to perform 
+        the first time that its tab is shown after the element that the control
+        panel operates on is selected. It can be overridden by subclasses in order to perform 
         processing before it is displayed (for example updating lists of 
         available data series etc.)
         """
@@ -30,6 +30,11 @@ changes the name of the element and generates an AvoPlotElementRenameEvent. Both
 the plots panel and the navigation panel handle this event and use it to update 
 their appearance. Adding and deleting elements works in a similar way.
 
+To avoid swamping the GUI when lots of elements are changed at once, the events
+are not delivered individually. Instead they are collected by the event bus 
+and delivered once the event loop is idle, as a single AvoPlotTreeChangedEvent
+carrying a TreeDiff which summarises all the changes.
+
 """
 import avoplot
 from avoplot import controls, ordered_set
@@ -42,6 +47,130 @@ AvoPlotElementRenameEvent, EVT_AVOPLOT_ELEM_RENAME = wx.lib.newevent.NewEvent()
 AvoPlotElementDeleteEvent, EVT_AVOPLOT_ELEM_DELETE = wx.lib.newevent.NewEvent()
 AvoPlotElementAddEvent, EVT_AVOPLOT_ELEM_ADD = wx.lib.newevent.NewEvent()
 
+#event carrying a TreeDiff of all the element events since the last one
+AvoPlotTreeChangedEvent, EVT_AVOPLOT_TREE_CHANGED = wx.lib.newevent.NewEvent()
+
+
+class TreeDiff(object):
+    """
+    Summary of a batch of element events (add, delete, rename and select). The
+    added, deleted and renamed attributes are ordered sets of the elements
+    which were added, deleted and renamed, in the order that the events 
+    occurred. selected is the last element to be selected, or None. 
+    
+    The events are coalesced so that the diff only describes the net change:
+    elements which were added and then deleted within the batch do not appear
+    at all, added elements are not also listed as renamed, and deleted 
+    elements are not listed as renamed or selected. Changes should be applied
+    in the order deleted, added, renamed, selected.
+    """
+    def __init__(self):
+        self.added = ordered_set.OrderedSet()
+        self.deleted = ordered_set.OrderedSet()
+        self.renamed = ordered_set.OrderedSet()
+        self.selected = None
+    
+    
+    def add_event(self, evnt):
+        """
+        Adds an element event to the diff.
+        """
+        el = evnt.element
+        
+        if isinstance(evnt, AvoPlotElementAddEvent):
+            self.added.add(el)
+        
+        elif isinstance(evnt, AvoPlotElementDeleteEvent):
+            self.renamed.discard(el)
+            if el in self.added:
+                #the element was never seen - so no need to report it at all
+                self.added.discard(el)
+            else:
+                self.deleted.add(el)
+            if el is self.selected:
+                self.selected = None
+        
+        elif isinstance(evnt, AvoPlotElementRenameEvent):
+            if el not in self.added:
+                self.renamed.add(el)
+        
+        elif isinstance(evnt, AvoPlotElementSelectEvent):
+            self.selected = el
+    
+    
+    def is_empty(self):
+        """
+        Returns True if the diff does not contain any changes.
+        """
+        return not (self.added or self.deleted or self.renamed or 
+                    self.selected is not None)
+
+
+
+class EventBus(object):
+    """
+    Collects the element events posted by the root of the element tree and 
+    delivers them to the top level window as a single AvoPlotTreeChangedEvent 
+    (carrying a TreeDiff) once the event loop is idle. This means that adding
+    thousands of elements only causes the GUI to be updated once.
+    """
+    def __init__(self):
+        self.__diff = None
+    
+    
+    def post(self, evnt):
+        """
+        Adds an element event to the current batch, and schedules the batch to 
+        be delivered when the event loop is next idle.
+        """
+        if self.__diff is None:
+            self.__diff = TreeDiff()
+            avoplot.call_on_idle(self.flush)
+            wx.WakeUpIdle()
+        
+        self.__diff.add_event(evnt)
+    
+    
+    def flush(self):
+        """
+        Delivers the current batch of events (if there is one). The event is
+        processed immediately (rather than posted) so that the GUI has handled
+        any deleted elements before their _destroy() methods are called.
+        """
+        diff = self.__diff
+        self.__diff = None
+        
+        if diff is None or diff.is_empty():
+            return
+        
+        top_window = wx.GetApp().GetTopWindow()
+        if not top_window:
+            #the main window has been destroyed
+            return
+        
+        top_window.GetEventHandler().ProcessEvent(AvoPlotTreeChangedEvent(diff=diff))
+
+#all element events are sent through this bus
+event_bus = EventBus()
+
+
+
+#matches names ending in a numeric suffix, e.g. "series (2)"
+_name_suffix_regex = re.compile(r'^(.*?)\s*\(([0-9]+)\)$')
+
+
+def split_name(name):
+    """
+    Splits an element name into a tuple (base_name, suffix), where suffix is 
+    the integer n if the name ends in '(n)', or None otherwise. For example
+    "series (2)" gives ("series", 2).
+    """
+    match = _name_suffix_regex.match(name)
+    if match is None:
+        return name, None
+    return match.group(1), int(match.group(2))
+
+
 
 def new_id():
     """
@@ -69,7 +198,22 @@ class AvoPlotElementBase(object):
         self.__parent_element = None
         #child_elements set needs to be ordered otherwise series can be displayed
         #in  a differemt order to that which they were created in
-        self.__child_elements = ordered_set.OrderedSet([])
+        self.__child_elements = ordered_set.CompactOrderedSet()
+        
+        #index of the names of the child elements, so that set_name() can find
+        #a unique name without having to look at all the siblings. This holds
+        #the number of children with each name, the number of children using
+        #each numeric suffix of each base name, and the highest suffix in use
+        #for each base name. These are only created when the first child is 
+        #added, since most elements don't have any children
+        self.__child_name_counts = None
+        self.__child_suffixes = None
+        self.__child_max_suffix = None
+        
+        #cache of the results of get_ancestor(), keyed by class. This is 
+        #cleared whenever the element (or one of its ancestors) is reparented
+        self.__ancestor_cache = None
+        
         self.__alive = True
         self.set_name(name)
     
@@ -85,10 +229,11 @@ class AvoPlotElementBase(object):
         assert el != self.__parent_element
         
         self.__child_elements.add(el)
+        self.__index_child_name(el.get_name())
         
-        #send the element delete event
+        #send the element add event
         evt = AvoPlotElementAddEvent(element=el)
-        wx.PostEvent(wx.GetApp().GetTopWindow(), evt)
+        self._post_event(evt)
     
     
     def _remove_child_element(self, el):
@@ -97,6 +242,63 @@ class AvoPlotElementBase(object):
         child.
         """
         self.__child_elements.remove(el)
+        self.__unindex_child_name(el.get_name())
+    
+    
+    def __index_child_name(self, name):
+        """
+        Adds a child element's name to the index of child names.
+        """
+        if self.__child_name_counts is None:
+            self.__child_name_counts = {}
+            self.__child_suffixes = {}
+            self.__child_max_suffix = {}
+        
+        self.__child_name_counts[name] = self.__child_name_counts.get(name, 0) + 1
+        
+        base_name, suffix = split_name(name)
+        if suffix is not None:
+            suffixes = self.__child_suffixes.setdefault(base_name, {})
+            suffixes[suffix] = suffixes.get(suffix, 0) + 1
+            if suffix > self.__child_max_suffix.get(base_name, 0):
+                self.__child_max_suffix[base_name] = suffix
+    
+    
+    def __unindex_child_name(self, name):
+        """
+        Removes a child element's name from the index of child names.
+        """
+        count = self.__child_name_counts[name] - 1
+        if count:
+            self.__child_name_counts[name] = count
+        else:
+            del self.__child_name_counts[name]
+        
+        base_name, suffix = split_name(name)
+        if suffix is not None:
+            suffixes = self.__child_suffixes[base_name]
+            suffixes[suffix] -= 1
+            if not suffixes[suffix]:
+                del suffixes[suffix]
+                if not suffixes:
+                    del self.__child_suffixes[base_name]
+                    del self.__child_max_suffix[base_name]
+                elif suffix == self.__child_max_suffix[base_name]:
+                    #only need to search the remaining suffixes if the 
+                    #highest one was removed
+                    self.__child_max_suffix[base_name] = max(suffixes)
+    
+    
+    def __get_unique_child_name(self, name):
+        """
+        Returns name if none of the child elements have that name, otherwise
+        returns name with '(n)' appended, where n is one more than the highest
+        suffix currently in use for that name.
+        """
+        if not self.__child_name_counts or not self.__child_name_counts.has_key(name):
+            return name
+        
+        return ''.join([name, ' (%d)'%(self.__child_max_suffix.get(name, 1) + 1)])
     
     
     def delete(self):
@@ -110,7 +312,7 @@ class AvoPlotElementBase(object):
         self.__alive = False
         #recursively call delete on all child elements
         while self.__child_elements:
-            el = list(self.__child_elements)[-1]
+            el = self.__child_elements.last()
             el.delete()
             
         #destroy self - setting parent to None should bring the ref-count
@@ -119,7 +321,7 @@ class AvoPlotElementBase(object):
         
         #send the element delete event
         evt = AvoPlotElementDeleteEvent(element=self)
-        wx.PostEvent(wx.GetApp().GetTopWindow(), evt)
+        self._post_event(evt)
         
         avoplot.call_on_idle(self._destroy)
     
@@ -133,11 +335,32 @@ class AvoPlotElementBase(object):
         method should make sure that they call the base class's method too.
         """
         for p in self.get_control_panels():
-            if p.is_initialised():
+            #the control panel may already have been destroyed along with its
+            #page in the control panel notebook
+            if p.is_initialised() and p:
                 p.Destroy()
         self.__control_panels = []
         
     
+    def _post_event(self, evnt):
+        """
+        Posts an AvoPlot element event (one of the events defined at the top of
+        this module). Events are passed up the element tree and are posted to 
+        the event bus by the root element. This gives elements the 
+        chance to hold back the events of their children (for example, see
+        avoplot.subplots.AvoPlotSubplotBase.batch()). Subclasses that override
+        this method should call the base class's method to actually post the 
+        event.
+        
+        The root element posts the events to the event bus, which delivers 
+        them to the GUI in batches (see EventBus).
+        """
+        if self.__parent_element is not None:
+            self.__parent_element._post_event(evnt)
+        else:
+            event_bus.post(evnt)
+    
+    
     def get_control_panels(self):
         """
         Returns a list of control panel objects (instances of 
@@ -161,8 +384,9 @@ class AvoPlotElementBase(object):
     
     def get_child_elements(self):
         """
-        Returns a list of child elements (instances of AvoPlotElementBase or its
-        subclasses).
+        Returns an ordered set (an ordered_set.CompactOrderedSet) of the child 
+        elements (instances of AvoPlotElementBase or its subclasses), in the 
+        order that they were added.
         """
         return self.__child_elements
     
@@ -181,6 +405,54 @@ class AvoPlotElementBase(object):
         """
         return self.__parent_element
     
+    
+    def get_ancestor(self, cls):
+        """
+        Returns the closest ancestor of the element which is an instance of 
+        cls, or None if the element is not (yet) connected to such an ancestor.
+        Raises RuntimeError if the root element is reached without finding an
+        instance of cls. Results are cached, so repeated lookups are O(1) 
+        until the element or one of its ancestors is reparented.
+        """
+        if self.__ancestor_cache is None:
+            self.__ancestor_cache = {}
+        
+        try:
+            return self.__ancestor_cache[cls]
+        except KeyError:
+            pass
+        
+        parent = self.__parent_element
+        if parent is None or isinstance(parent, cls):
+            ancestor = parent
+        elif isinstance(parent, AvoPlotSession):
+            #sanity check - the session is the root of the element tree
+            raise RuntimeError("Reached the root element before an %s "
+                               "instance was found." % cls.__name__)
+        else:
+            #this also caches the result in the parent, so that siblings don't
+            #have to search the tree again
+            ancestor = parent.get_ancestor(cls)
+        
+        self.__ancestor_cache[cls] = ancestor
+        return ancestor
+    
+    
+    def _clear_ancestor_cache(self):
+        """
+        Clears the cached results of get_ancestor() for this element and all 
+        of its descendants.
+        """
+        #a child can only have cached an ancestor other than this element if
+        #it found it by searching through this element's cache - so if our 
+        #cache is empty there is nothing to clear in the children either
+        if not self.__ancestor_cache:
+            return
+        
+        self.__ancestor_cache = None
+        for child in self.__child_elements:
+            child._clear_ancestor_cache()
+    
        
     def add_control_panel(self, panel):
         """
@@ -206,38 +478,21 @@ class AvoPlotElementBase(object):
         an AvoPlotElementRenameEvent.
         """ 
         name = str(name)
-               
+        
         #if the parent of this element already has a child with this name
-        #then append a number to the end of it
-        if self.__parent_element is not None:
-            sibling_names = []
-            for c in self.__parent_element.get_child_elements():
-                if c == self:
-                    continue
-                sibling_names.append(c.get_name())
-            
-            if sibling_names.count(name) > 0:
-                current_indices = [1]
-                #this name is already in use - find what the 
-                #highest index of current use is (don't want to go back to
-                #lower numbers if some intermediate tab is closed)
-
-                for n in sibling_names:
-                    if not n.startswith(name):
-                        continue
-                    n = n[len(name):].strip()
-                    
-                    if n:
-                        match = re.match(r'\(([0-9]+)\)', n)
-                        if match:
-                            current_indices.append(int(match.groups()[0]))
-                                                
-                name = ''.join([name, ' (%d)'%(max(current_indices) + 1)])
+        #then append a number to the end of it. Note that we don't go back to 
+        #lower numbers if some intermediate tab is closed.
+        parent = self.__parent_element
+        if parent is not None:
+            parent.__unindex_child_name(self.__name)
+            name = parent.__get_unique_child_name(name)
+            parent.__index_child_name(name)
+        
         self.__name = name
         
         #send an element rename event
         evt = AvoPlotElementRenameEvent(element=self)
-        wx.PostEvent(wx.GetApp().GetTopWindow(), evt)
+        self._post_event(evt)
     
     
     def set_parent_element(self, parent):
@@ -253,6 +508,7 @@ class AvoPlotElementBase(object):
             self.__parent_element._remove_child_element(self)
         
         self.__parent_element = parent
+        self._clear_ancestor_cache()
         
         if parent is not None:
             self.__parent_element._add_child_element(self)
@@ -269,7 +525,7 @@ class AvoPlotElementBase(object):
         if self.__alive:
             #fire an element selected event
             evt = AvoPlotElementSelectEvent(element=self)
-            wx.PostEvent(wx.GetApp().GetTopWindow(), evt)
+            self._post_event(evt)
             #wx.Yield()
     
     
@@ -15,15 +15,13 @@
 #You should have received a copy of the GNU General Public License
 #along with AvoPlot.  If not, see <http://www.gnu.org/licenses/>.
 
-from matplotlib.patches import Rectangle
+from matplotlib.patches import Rectangle, Polygon
 from matplotlib.transforms import blended_transform_factory
 from matplotlib.colors import colorConverter
-from matplotlib.pylab import date2num
 
 from wx.lib.buttons import GenBitmapToggleButton as GenBitmapToggleButton
 import wx
 import numpy
-import datetime
 
 class DataRangeSelectionPanel(wx.Panel):
     
@@ -47,27 +45,32 @@ class DataRangeSelectionPanel(wx.Panel):
         self.h_select_button = GenBitmapToggleButton(self, wx.ID_ANY, wx.ArtProvider.GetBitmap("avoplot_hselect",wx.ART_BUTTON))
         self.v_select_button = GenBitmapToggleButton(self, wx.ID_ANY, wx.ArtProvider.GetBitmap("avoplot_vselect",wx.ART_BUTTON))
         self.rect_select_button = GenBitmapToggleButton(self, wx.ID_ANY, wx.ArtProvider.GetBitmap("avoplot_rectselect",wx.ART_BUTTON))
+        self.lasso_select_button = GenBitmapToggleButton(self, wx.ID_ANY, wx.ArtProvider.GetBitmap("avoplot_lassoselect",wx.ART_BUTTON))
         
         self.all_select_button.SetToolTipString("Entire series")
         self.h_select_button.SetToolTipString("Horizontal selection")
         self.v_select_button.SetToolTipString("Vertical selection")
         self.rect_select_button.SetToolTipString("Rectangular selection")
+        self.lasso_select_button.SetToolTipString("Lasso selection")
         
         hsizer.AddSpacer(5)
         hsizer.Add(self.all_select_button, 0)
         hsizer.Add(self.h_select_button, 0, wx.LEFT, border=2)
         hsizer.Add(self.v_select_button, 0, wx.LEFT, border=2)
         hsizer.Add(self.rect_select_button, 0, wx.LEFT, border=2)
+        hsizer.Add(self.lasso_select_button, 0, wx.LEFT, border=2)
         hsizer.AddSpacer(5)
         
         wx.EVT_BUTTON(self, self.all_select_button.GetId(), self.on_allselect)
         wx.EVT_BUTTON(self, self.h_select_button.GetId(), self.on_hselect)
         wx.EVT_BUTTON(self, self.v_select_button.GetId(), self.on_vselect)
         wx.EVT_BUTTON(self, self.rect_select_button.GetId(), self.on_rectselect)
+        wx.EVT_BUTTON(self, self.lasso_select_button.GetId(), self.on_lassoselect)
         
         
         self.all_select_button.SetValue(True)
         self.selection_tool = EntireSeriesSelectionTool(self.series)
+        self.__live_callback = None
         
         vsizer.AddSpacer(5)
         vsizer.Add(hsizer, 0, wx.ALIGN_CENTER_HORIZONTAL)
@@ -85,6 +88,29 @@ class DataRangeSelectionPanel(wx.Panel):
         self.selection_tool.enable_selection() 
         
     
+    def set_live_callback(self, callback):
+        """
+        Sets a function (taking no args) to be called whenever the selection 
+        changes, including while the user is still dragging out a new 
+        selection region (so it may get called at mouse-move rate). Set to None
+        to disable.
+        """
+        self.__live_callback = callback
+        self.selection_tool.live_callback = callback
+    
+    
+    def __start_tool(self, tool_class):
+        """
+        Creates a new selection tool of type tool_class and enables it.
+        """
+        self.selection_tool = tool_class(self.series)
+        self.selection_tool.live_callback = self.__live_callback
+        self.selection_tool.enable_selection()
+        
+        if self.__live_callback is not None:
+            self.__live_callback()
+    
+    
     def __disable_all_except(self, button_to_keep):
         """
         De-selects all the selection buttons except the one passed as an arg.
@@ -92,7 +118,8 @@ class DataRangeSelectionPanel(wx.Panel):
         self.selection_tool.disable_selection()
         
         for b in [self.all_select_button, self.h_select_button, 
-                  self.v_select_button, self.rect_select_button]:
+                  self.v_select_button, self.rect_select_button,
+                  self.lasso_select_button]:
             
             if b != button_to_keep:
                 b.SetValue(False)
@@ -100,20 +127,27 @@ class DataRangeSelectionPanel(wx.Panel):
     
     def get_selection(self):
         """
-        Returns a numpy array which is a mask where 0 == data not selected and 
-        1 == data selected. The length of the mask will be equal to that of the
-        series.
+        Returns a DataSelection object representing the selected data points. 
+        Use its get_mask() method if you need a mask array where 
+        0 == data not selected and 1 == data selected.
         """
         return self.selection_tool.get_current_selection()
     
     
+    def is_selection_in_progress(self):
+        """
+        Returns True if the user is still dragging out a new selection region,
+        False otherwise.
+        """
+        return self.selection_tool.is_selection_in_progress()
+    
+    
     def on_allselect(self, evnt):
         """
         Callback handler for the "select all" button.
         """
         self.__disable_all_except(self.all_select_button)
-        self.selection_tool = EntireSeriesSelectionTool(self.series)
-        self.selection_tool.enable_selection()
+        self.__start_tool(EntireSeriesSelectionTool)
     
     
     def on_hselect(self, evnt):
@@ -126,8 +160,7 @@ class DataRangeSelectionPanel(wx.Panel):
             return
         
         self.__disable_all_except(self.h_select_button)
-        self.selection_tool = HorizontalSelectionTool(self.series)
-        self.selection_tool.enable_selection()
+        self.__start_tool(HorizontalSelectionTool)
         
     
     def on_vselect(self, evnt):
@@ -140,8 +173,7 @@ class DataRangeSelectionPanel(wx.Panel):
             return
         
         self.__disable_all_except(self.v_select_button)
-        self.selection_tool = VerticalSelectionTool(self.series)
-        self.selection_tool.enable_selection()
+        self.__start_tool(VerticalSelectionTool)
     
     
     def on_rectselect(self, evnt):
@@ -154,8 +186,20 @@ class DataRangeSelectionPanel(wx.Panel):
             return
         
         self.__disable_all_except(self.rect_select_button)
-        self.selection_tool = RectSelectionTool(self.series)
-        self.selection_tool.enable_selection()   
+        self.__start_tool(RectSelectionTool)
+    
+    
+    def on_lassoselect(self, evnt):
+        """
+        Callback handler for the "lasso select" button.
+        """
+        if not self.lasso_select_button.GetValue():
+            self.all_select_button.SetValue(True)
+            self.on_allselect(None)
+            return
+        
+        self.__disable_all_except(self.lasso_select_button)
+        self.__start_tool(LassoSelectionTool)
         
 
 def get_selection_box_colour(series):
@@ -170,12 +214,141 @@ def get_selection_box_colour(series):
 
 
 
+def merge_intervals(intervals):
+    """
+    Merges a list of (low, high) closed intervals into the smallest equivalent
+    list of non-overlapping intervals, sorted in ascending order.
+    """
+    merged = []
+    for low, high in sorted(intervals):
+        if merged and low <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+    return merged
+
+
+
+class DataSelection(object):
+    def __init__(self, length, ranges=None, indices=None):
+        """
+        Represents a selection of data points from a data series containing 
+        length points. The selection is stored compactly, either as a list of
+        non-overlapping, ascending (start, stop) index ranges (where stop is not
+        included in the range), or as a sorted array of unique indices. 
+        Only one of ranges and indices should be specified - if neither are, 
+        then the selection is empty.
+        """
+        assert ranges is None or indices is None, ("Only one of ranges and "
+                                                   "indices may be specified")
+        self.__length = length
+        self.__indices = None
+        self.__ranges = None
+        
+        if indices is not None:
+            self.__indices = numpy.asarray(indices, dtype='int')
+        else:
+            if ranges is None:
+                ranges = []
+            self.__ranges = [(int(start), int(stop)) for start, stop in ranges 
+                             if stop > start]
+    
+    
+    @classmethod
+    def all(cls, length):
+        """
+        Returns a DataSelection object with all length points selected.
+        """
+        return cls(length, ranges=[(0, length)])
+    
+    
+    def __len__(self):
+        """
+        Returns the number of selected data points.
+        """
+        if self.__ranges is not None:
+            return sum([stop - start for start, stop in self.__ranges])
+        return len(self.__indices)
+    
+    
+    def get_series_length(self):
+        """
+        Returns the total number of points in the series that the selection was
+        made from.
+        """
+        return self.__length
+    
+    
+    def get_ranges(self):
+        """
+        Returns a list of non-overlapping, ascending (start, stop) index ranges
+        which make up the selection (stop is not included in the range).
+        """
+        if self.__ranges is None:
+            if len(self.__indices) == 0:
+                self.__ranges = []
+            else:
+                #find the places where the indices are not consecutive
+                breaks = numpy.where(numpy.diff(self.__indices) != 1)[0] + 1
+                starts = self.__indices[numpy.concatenate(([0], breaks))]
+                stops = self.__indices[numpy.concatenate((breaks - 1, 
+                                                          [len(self.__indices) - 1]))] + 1
+                self.__ranges = zip(starts.tolist(), stops.tolist())
+        return self.__ranges
+    
+    
+    def get_indices(self):
+        """
+        Returns a sorted array of the indices of the selected data points.
+        """
+        if self.__indices is None:
+            if not self.__ranges:
+                self.__indices = numpy.array([], dtype='int')
+            else:
+                self.__indices = numpy.concatenate([numpy.arange(start, stop) 
+                                                    for start, stop in self.__ranges])
+        return self.__indices
+    
+    
+    def get_mask(self):
+        """
+        Returns a mask array where 1 == selected data point and 0 == not 
+        selected data point. 
+        """
+        mask = numpy.zeros(self.__length, dtype='int')
+        if self.__ranges is not None:
+            for start, stop in self.__ranges:
+                mask[start:stop] = 1
+        else:
+            mask[self.__indices] = 1
+        return mask
+    
+    
+    def take(self, values):
+        """
+        Returns the elements of the array values which are in the selection. If
+        the selection is a single contiguous range, then this is a view of 
+        values rather than a copy.
+        """
+        if self.__ranges is not None:
+            if len(self.__ranges) == 1:
+                start, stop = self.__ranges[0]
+                return values[start:stop]
+            if not self.__ranges:
+                return values[:0]
+            return numpy.concatenate([values[start:stop] 
+                                      for start, stop in self.__ranges])
+        return values[self.__indices]
+
+
+
 class SelectionToolBase:
     def __init__(self, series):
         """
         Base class for selection tools. Must be subclassed.
         """
         self.series = series
+        self.live_callback = None
     
     
     def disable_selection(self):
@@ -187,6 +360,14 @@ class SelectionToolBase:
     
     def enable_selection(self):
         pass
+    
+    
+    def is_selection_in_progress(self):
+        """
+        Returns True if the user is still dragging out a new selection region,
+        False otherwise.
+        """
+        return False
 
 
 
@@ -195,20 +376,42 @@ class EntireSeriesSelectionTool(SelectionToolBase):
     Tool for selecting the entire series.
     """
     def get_current_selection(self):
-        return numpy.ones(len(self.series.get_raw_data()[0]))
+        return DataSelection.all(self.series.get_length())
     
 
+def select_in_intervals(index, length, intervals):
+    """
+    Returns a DataSelection object representing all the points whose values 
+    lie within any of the (low, high) closed intervals. index should be an 
+    avoplot.indexing.SortedIndex of the values and length is the number of 
+    points in the series.
+    """
+    ranges = [index.get_range(low, high) for low, high in merge_intervals(intervals)]
+    
+    if index.is_sorted():
+        return DataSelection(length, ranges=ranges)
+    
+    #the ranges are positions in the sorted values - map them back to the
+    #indices of the original values
+    order = index.get_sort_order()
+    idxs = [order[start:stop] for start, stop in ranges]
+    if not idxs:
+        return DataSelection(length)
+    return DataSelection(length, indices=numpy.sort(numpy.concatenate(idxs)))
+
+
 class SelectorBase(object):
     def __init__(self, series, cursor_style, callback=None):
         self.series = series
         self.callback = callback
-        xdata, ydata = self.series.get_data()
-        if len(xdata) > 1:
-            self._centre_x = xdata[0] + (xdata[-1] - xdata[0])/2 #calculation must be supported for datetime objects
-            self._centre_y = ydata[0] + (ydata[-1] - ydata[0])/2
-        elif len(xdata) == 1:
-            self._centre_x = xdata[0]
-            self._centre_y = ydata[0]
+        n = self.series.get_length()
+        if n > 1:
+            x_first, y_first = self.series.get_data_point(0)
+            x_last, y_last = self.series.get_data_point(n - 1)
+            self._centre_x = x_first + (x_last - x_first)/2 #calculation must be supported for datetime objects
+            self._centre_y = y_first + (y_last - y_first)/2
+        elif n == 1:
+            self._centre_x, self._centre_y = self.series.get_data_point(0)
         else:
             self._centre_x = 0
             self._centre_y = 0
@@ -219,6 +422,8 @@ class SelectorBase(object):
 
         self.cids=[]
         self.current_selection = []
+        self.in_progress_selection = None
+        self.live_callback = None
         self.selection_markers = []
         self.cursor_hline = None
         self.cursor_vline = None
@@ -357,6 +562,25 @@ class SelectorBase(object):
         self.update()
         
         self.current_selection = []
+        self.in_progress_selection = None
+        self.notify_selection_changed()
+    
+    
+    def is_selection_in_progress(self):
+        """
+        Returns True if the user is still dragging out a new selection region,
+        False otherwise.
+        """
+        return self.in_progress_selection is not None
+    
+    
+    def notify_selection_changed(self):
+        """
+        Calls the live callback function (if one has been set) to notify it 
+        that the selection has changed.
+        """
+        if self.live_callback is not None:
+            self.live_callback()
         
     
     
@@ -374,6 +598,8 @@ class SelectorBase(object):
     
     
     def on_release(self, evnt):
+        self.notify_selection_changed()
+        
         #run any callback function
         if self.callback is not None:
             self.callback(self.current_selection, self.selection_markers)
@@ -449,17 +675,27 @@ class SelectorBase(object):
 class PointSelector(SelectorBase):
     
     def on_click(self, event):
-        xdata, ydata = self.series.get_data()
         
         if self.cursor_style == 'vertical':
-            data_loc = numpy.argmin(numpy.fabs(xdata - event.xdata))
+            data_loc = self.series.find_nearest_x(event.xdata)
+            x = self.series.get_data_point(data_loc)[0]
         
-            l = self.ax.axvline(xdata[data_loc], linewidth=2)
+            l = self.ax.axvline(x, linewidth=2)
             
             self.selection_markers.append(l)
             self.current_selection.append((data_loc, -1, data_loc, -1))
+        
+        elif self.cursor_style == 'cross':
+            data_loc = self.series.find_nearest_point(event.xdata, event.ydata)
+            x, y = self.series.get_data_point(data_loc)
+            
+            l, = self.ax.plot([x], [y], 'o', markersize=10, markerfacecolor='none',
+                              markeredgewidth=2)
+            
+            self.selection_markers.append(l)
+            self.current_selection.append((data_loc, data_loc, data_loc, data_loc))
         else:
-            raise NotImplementedError("non-vertical point selection is yet to be implemented")
+            raise NotImplementedError("horizontal point selection is yet to be implemented")
         
         super(PointSelector, self).on_click(event)
         
@@ -511,44 +747,34 @@ class SpanSelector(SelectorBase):
         
     def get_current_selection(self):
         """
-        Returns a mask array where 1 == selected data point and 0 == not 
-        selected data point. 
+        Returns a DataSelection object representing the data points which are
+        within the current selection. For horizontal and vertical selections 
+        the selected points are found using binary searches of the series' 
+        sorted x and y indexes, so for x-sorted data horizontal selections are
+        returned as index ranges. Rectangular selections use the series' grid
+        index.
         """    
-        xdata, ydata = self.series.get_data()
-        selection_mask = numpy.zeros(len(xdata),dtype='int')
-        
-        #if xdata are datetimes, then need to convert them to numbers
-        #first
-        if len(xdata)>0 and type(xdata[0]) is datetime.datetime:
-            xdata = numpy.array([date2num(d) for d in xdata])
-        
-        #if ydata are datetimes, then need to convert them to numbers
-        #first
-        if len(ydata)>0 and type(ydata[0]) is datetime.datetime:
-            ydata = numpy.array([date2num(d) for d in ydata])
-        
-        if self.cursor_style == 'cross':
-            for xmin_sel, ymin_sel, xmax_sel, ymax_sel in self.current_selection:
-                tmp_mask = numpy.where(numpy.logical_and(numpy.logical_and(xdata >= xmin_sel, 
-                                                                           xdata <= xmax_sel),
-                                                         numpy.logical_and(ydata >= ymin_sel,
-                                                                           ydata <= ymax_sel)))
-
-                selection_mask[tmp_mask] = 1
-                
-        elif self.cursor_style == 'horizontal':
-            for xmin_sel, ymin_sel, xmax_sel, ymax_sel in self.current_selection:
-                tmp_mask = numpy.where(numpy.logical_and(xdata >= xmin_sel, 
-                                                         xdata <= xmax_sel))
-                selection_mask[tmp_mask] = 1
+        n = self.series.get_length()
         
-        else:
-            for xmin_sel, ymin_sel, xmax_sel, ymax_sel in self.current_selection:
-                tmp_mask = numpy.where(numpy.logical_and(ydata >= ymin_sel, 
-                                                         ydata <= ymax_sel))
-                selection_mask[tmp_mask] = 1
+        #include the region that the user is currently dragging out (if any)
+        rects = list(self.current_selection)
+        if self.in_progress_selection is not None:
+            rects.append(self.in_progress_selection)
         
-        return selection_mask
+        if self.cursor_style == 'horizontal':
+            return select_in_intervals(self.series.get_x_index(), n,
+                                       [(xmin_sel, xmax_sel) for xmin_sel, ymin_sel, xmax_sel, ymax_sel 
+                                        in rects])
+        
+        elif self.cursor_style == 'vertical':
+            return select_in_intervals(self.series.get_y_index(), n,
+                                       [(ymin_sel, ymax_sel) for xmin_sel, ymin_sel, xmax_sel, ymax_sel 
+                                        in rects])
+        
+        #for rectangular selections, use the series' spatial index so that 
+        #only the points near to the selected rectangles get tested
+        grid_index = self.series.get_grid_index()
+        return DataSelection(n, indices=grid_index.indices_in_rects(rects))
     
     
     def on_release(self, event):
@@ -565,6 +791,7 @@ class SpanSelector(SelectorBase):
         ymin,ymax = sorted([ymin, ymax])
         
         self.current_selection.append((xmin, ymin, xmax, ymax))
+        self.in_progress_selection = None
         
         print "selected ",(xmin, ymin, xmax, ymax)
         
@@ -598,8 +825,12 @@ class SpanSelector(SelectorBase):
         if self.cursor_style in ('vertical', 'cross'):
             cur_rect.set_y(min_y)
             cur_rect.set_height(max_y-min_y)
+        
+        self.in_progress_selection = (min_x, min_y, max_x, max_y)
 
         super(SpanSelector,self).on_move(event)
+        
+        self.notify_selection_changed()
 
 
 
@@ -628,4 +859,90 @@ class RectSelectionTool(SpanSelector, SelectionToolBase):
         Tool for selecting rectangular regions of data series.
         """        
         SelectionToolBase.__init__(self, series)
-        SpanSelector.__init__(self, series, 'cross', callback=callback)
\ No newline at end of file
+        SpanSelector.__init__(self, series, 'cross', callback=callback)
+
+
+
+class LassoSelectionTool(SelectorBase, SelectionToolBase):
+    def __init__(self, series, callback=None):
+        """
+        Tool for selecting freeform (lasso) regions of data series. The user
+        draws around the region to be selected with the mouse button held 
+        down.
+        """
+        SelectionToolBase.__init__(self, series)
+        SelectorBase.__init__(self, series, 'cross', callback=callback)
+        self.rect_colour = get_selection_box_colour(series)
+        self.__vertices = []
+    
+    
+    def on_click(self, event):
+        """
+        Callback handler for mouse click events in the axis. Starts a new
+        lasso polygon.
+        """
+        self.__vertices = [(event.xdata, event.ydata)]
+        
+        self.selection_markers.append(Polygon(self.__vertices, closed=True,
+                                              facecolor=self.rect_colour,
+                                              edgecolor=self.rect_colour,
+                                              alpha=0.35,
+                                              animated=True))
+        self.ax.add_patch(self.selection_markers[-1])
+    
+    
+    def on_move(self, event):
+        """
+        Event handler for mouse move events. Adds a vertex to the current 
+        lasso polygon if the mouse button is down.
+        """
+        if self.press_x is None:
+            super(LassoSelectionTool, self).on_move(event)
+            return
+        
+        self.__vertices.append((event.xdata, event.ydata))
+        self.selection_markers[-1].set_xy(self.__vertices)
+        self.in_progress_selection = self.__vertices
+        
+        super(LassoSelectionTool, self).on_move(event)
+        
+        self.notify_selection_changed()
+    
+    
+    def on_release(self, event):
+        """
+        Event handler for mouse click release events. Closes the current lasso
+        polygon and adds it to the selection.
+        """
+        self.current_selection.append(self.__vertices)
+        self.__vertices = []
+        self.in_progress_selection = None
+        
+        self.press_x = None
+        self.press_y = None
+        
+        super(LassoSelectionTool, self).on_release(event)
+    
+    
+    def get_current_selection(self):
+        """
+        Returns a DataSelection object representing the data points which are
+        within the current selection. The points are found by testing only the
+        points near to each lasso polygon (found using the series' grid index)
+        for whether they are inside it.
+        """
+        polygons = list(self.current_selection)
+        if self.in_progress_selection is not None:
+            polygons.append(self.in_progress_selection)
+        
+        grid_index = self.series.get_grid_index()
+        selected = [grid_index.indices_in_polygon(v) for v in polygons]
+        
+        n = self.series.get_length()
+        if not selected:
+            return DataSelection(n)
+        
+        if len(selected) == 1:
+            return DataSelection(n, indices=selected[0])
+        
+        return DataSelection(n, indices=numpy.unique(numpy.concatenate(selected)))
@@ -61,7 +61,7 @@ class RectRegionSelect:
         
         #disable the pan and zoom controls
         self.figure.enable_pan_and_zoom_tools(False)
-        self.canvas.draw()
+        self.figure.update()
         
 
     def disable_selection(self):
@@ -22,6 +22,7 @@ from matplotlib.backends.backend_wxagg import FigureCanvasWxAgg
 from matplotlib.backends.backend_wx import NavigationToolbar2Wx
 from matplotlib.figure import Figure
 import matplotlib.colors
+import avoplot
 from avoplot import core
 from avoplot import controls
 from avoplot.gui import widgets
@@ -102,6 +103,7 @@ class AvoPlotFigure(core.AvoPlotElementBase, wx.ScrolledWindow):
         self._is_zoomed = False
         self._is_panned = False
         self._picking_enabled = True
+        self.__redraw_pending = False
         
         #set up the scroll bars in case the figure gets too small
         wx.ScrolledWindow.__init__(self, parent, wx.ID_ANY)
@@ -114,7 +116,6 @@ class AvoPlotFigure(core.AvoPlotElementBase, wx.ScrolledWindow):
         #TODO - this may cause problems when it comes to printing/saving the
         #figure.
         self._mpl_figure = Figure(figsize=(4, 2))
-        self._mpl_figure.set_picker(5)
         
         #set figure background to white
         self._mpl_figure.set_facecolor((1, 1, 1))
@@ -153,19 +154,62 @@ class AvoPlotFigure(core.AvoPlotElementBase, wx.ScrolledWindow):
         free the figure window.
         """
         core.AvoPlotElementBase._destroy(self)
+        
+        #prevent any pending redraws from accessing the destroyed canvas
+        self.__redraw_pending = False
+        self.canvas = None
         self.Destroy()
     
     
     def update(self):
         """
-        Redraws the entire figure.
+        Redraws the entire figure. Note that the figure is not redrawn straight
+        away, instead it is marked as needing a redraw and the drawing is done 
+        once the event loop is idle (see avoplot.call_on_idle). This means that 
+        lots of calls to update() in quick succession (e.g. from a spin control)
+        only cost a single redraw. Use draw_now() if you need the figure to be
+        redrawn immediately.
         """
         if self.canvas is None:
             raise RuntimeError, "update() called before finalise()"
         
+        if not self.__redraw_pending:
+            self.__redraw_pending = True
+            avoplot.call_on_idle(self.__redraw_if_pending)
+            
+            #make sure that an idle event actually gets sent
+            wx.WakeUpIdle()
+    
+    
+    def draw_now(self):
+        """
+        Redraws the entire figure immediately, cancelling any pending redraw
+        requested by update().
+        """
+        if self.canvas is None:
+            raise RuntimeError, "draw_now() called before finalise()"
+        
+        self.__redraw_pending = False
         self.canvas.draw()
     
     
+    def is_redraw_pending(self):
+        """
+        Returns True if update() has been called since the figure was last
+        drawn, False otherwise.
+        """
+        return self.__redraw_pending
+    
+    
+    def __redraw_if_pending(self):
+        """
+        Called (via avoplot.call_on_idle) once the event loop is idle to do the 
+        redraw requested by update().
+        """
+        if self.__redraw_pending and self.canvas is not None:
+            self.draw_now()
+    
+    
     def is_zoomed(self):
         """
         Returns True if the zoom tool is selected, False otherwise.
@@ -273,8 +317,7 @@ class AvoPlotFigure(core.AvoPlotElementBase, wx.ScrolledWindow):
             ax.autoscale_view()
          
         #show the changes    
-        self.canvas.draw()
-        self.canvas.gui_repaint()
+        self.update()
  
     
     def zoom(self):
@@ -0,0 +1,474 @@
+#Copyright (C) Nial Peters 2013
+#
+#This file is part of AvoPlot.
+#
+#AvoPlot is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#AvoPlot is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with AvoPlot.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The file_loaders module reads data files into FileContents objects, which hold
+the columns of data in the file. It does not depend on wx, so it is used both
+by the "From file" plugin and by the headless renderer.
+"""
+
+import re
+import string
+import datetime
+import warnings
+import mimetypes
+import StringIO
+import numpy
+
+
+try:
+    import magic
+    have_magic = True
+    
+    try:
+        magic.Magic()
+    except Exception, e:
+        warnings.warn(("Your python-magic installation seems to be broken. "
+                      "Error message was \'%s\'. Using mimetypes module instead."%e.args))
+        have_magic = False
+        
+except ImportError:
+    have_magic = False
+
+
+__available_loaders = []
+
+class InvalidDataTypeError(TypeError):
+    pass
+
+def register_loader(loader_instance):
+    __available_loaders.append(loader_instance)
+
+
+def get_loader_names():
+    """
+    Returns a list of the names of the available file loaders.
+    """
+    return [l.name for l in __available_loaders]
+
+
+def load_file(filename, loader_name=None):
+    """
+    Loads filename and returns a FileContents object. If loader_name is None
+    then the first loader which can load the file is used, otherwise the
+    loader called loader_name is used.
+    """
+    with open(filename,'rb') as ifp:
+        s = ifp.read()
+    ifp = StringIO.StringIO(s)
+    
+    if loader_name is not None:
+        #use the requested loader without testing whether it can load the file
+        for loader in __available_loaders:
+            if loader.name == loader_name:
+                return loader.load(filename, ifp)
+        raise IOError('No file loader called \'%s\''%loader_name)
+    
+    flag=False
+    for loader in __available_loaders:
+        
+        flag = loader.test(filename, ifp)
+        if flag:
+            break
+    if flag:
+        return loader.load(filename, ifp)
+    raise IOError('Cannot load the file %s'%filename)
+
+
+class FileLoaderBase:
+    
+    name = "File loader"
+    
+    def test(self, filename, ifp):
+        return False
+    
+    def load(self,filename, ifp):
+        raise NotImplementedError
+
+
+class FileContents:
+    def __init__(self, filename, columns, header=None, comment_symbols=[], skipped_rows=[], footer=None):
+        self.filename = filename
+        self.header = header
+        self.__columns = columns
+        self.comment_symbols = comment_symbols
+        self.skipped_rows = skipped_rows
+        self.footer = footer
+           
+        #build mapping between column names and indices
+        self.__col_name_mapping = {}
+        for c in range(len(self.__columns)):
+            self.__col_name_mapping[self.get_col_name(c)] = c
+    
+    
+    def get_col_name(self, n):
+        quotient=n+1 #want n=1 to yield 'A'
+        indx = []
+        while quotient > 0:  
+            quotient = n // 26
+            remainder = n % 26        
+            indx.append(remainder)
+            n = quotient
+        for i in range(1,len(indx)):
+            indx[i] -= 1        
+        return ''.join([string.ascii_uppercase[i] for i in reversed(indx)])
+    
+    
+    def get_column_by_index(self, idx):
+        return self.__columns[idx]
+    
+    
+    def get_column_by_name(self, name):
+        idx = self.__col_name_mapping[name]
+        return self.get_column_by_index(idx)
+    
+    
+    def get_number_of_columns(self):
+        return len(self.__columns)
+    
+    
+    def get_number_of_rows(self):
+        return self.__columns[0].get_number_of_rows()
+    
+    
+    def get_columns(self):
+        return self.__columns
+    
+    
+    def print_summary(self):
+        print "\n\n----------------------------------------"
+        print "Comment symbols = %s"%self.comment_symbols
+        print "File has %s columns of data"%len(self.columns)
+        #print "Data is on lines %s-%s"%(start_idx,end_idx)
+        print "Invalid data on lines %s"%[i for i,l in self.skipped_rows]
+        for i,c in enumerate(self.columns):
+            print "Column %d title = \'%s\', datatype = %s"%(i,c.title, c.get_data_type())
+            
+        print "----------------------------------------\n"
+
+
+class ColumnData:
+    def __init__(self, raw_data, title=''):
+        self.raw_data = raw_data
+        self.d_type = None
+        self.data = None
+        self.title = title
+    
+    def get_data_mask(self):
+        return self.get_data().mask
+
+    
+    def get_number_of_rows(self):
+        return len(self.raw_data)
+    
+    
+    def get_data_type(self):
+        if self.d_type is not None:
+            return self.d_type
+        
+        #first see if it is a float
+        is_float = 0
+        not_float = 0
+        for x in self.raw_data:
+            try:
+                float(x)
+                is_float += 1
+            except ValueError:
+                not_float += 1
+        
+        if is_float > not_float:
+            self.d_type = 'number'
+            return self.d_type
+        
+        self.d_type ='text'
+        
+#        is_time = 0
+#        not_time = 0
+#        for x in self.raw_data:
+#            try:
+#                datetime.datetime.strptime(x,"%H:%M:%S")
+#                is_time += 1
+#            except ValueError:
+#                not_time += 1
+#        if is_time > not_time:
+#            self.d_type = 'time'
+        
+        return self.d_type
+    
+    
+    def set_data_type(self, dtype):
+        old_dtype = self.d_type
+        self.data = None #force re-interpretation of the data
+        self.d_type = dtype
+        d = self.get_data()
+        if len(d) > 0 and numpy.all(d.mask):
+            self.d_type = old_dtype
+            self.data = None
+            raise InvalidDataTypeError
+        
+    
+    
+    def get_data(self):
+        if self.data is not None:
+            return self.data
+        
+        self.data = _converters[self.get_data_type()](self.raw_data)
+        return self.data
+
+
+def _float(s):
+    try:
+        return float(s)
+    except ValueError:
+        return numpy.nan
+        
+        
+def to_float(data):
+    return numpy.ma.masked_invalid([_float(i) for i in data])
+
+
+def to_str(data):
+    return numpy.ma.masked_array(data, mask=numpy.zeros_like(data))
+   
+   
+_converters = {'number':to_float,
+               'text':to_str}
+
+
+def tuple_compare(first, second, element=0):
+    """
+    Compares two tuples based on their values at the index given by element.
+    Use functools.partial() to build comparators for any element value for use
+    in sort() functions.
+    >>> print tuple_compare((1,2),(1,2))
+    0
+    >>> print tuple_compare((1,2),(2,1))
+    -1
+    >>> print tuple_compare((1,2),(2,1),element=1)
+    1
+    """
+    return cmp(first[element], second[element])
+
+
+def multi_sort(*lists):
+    """
+    Sorts multiple lists based on the contents of the first list.
+    >>> print multi_sort([3,2,1],['a','b','c'],['d','e','f'])
+    ([1, 2, 3], ['c', 'b', 'a'], ['f', 'e', 'd'])
+    >>> print multi_sort([3,2,1])
+    ([1, 2, 3],)
+    """
+    l = zip(*lists)
+    l.sort(cmp=tuple_compare)
+    return tuple([list(t) for t in zip(*l)])
+
+
+def is_binary(ifp):
+    """Return true if the given filename is binary. This is done
+    based on finding null bytes in the file - it will only be used
+    when python-magic is not available.
+    """
+    while 1:
+        chunk = ifp.read(2048)
+        if '\0' in chunk: # found null byte
+            return True
+        if len(chunk) < 2048:
+            break # done
+    return False
+
+
+class TextFileLoader(FileLoaderBase):
+    
+    def __init__(self):
+        self.name = "Text file loader"
+        
+        
+    def test(self, filename, ifp):
+        
+        if have_magic:
+            try:
+                file_type = magic.from_buffer(ifp.read(),mime=True)
+            except Exception, e:
+                print e.args
+                return False
+            finally:
+                ifp.seek(0)
+            
+            if file_type.startswith('text/'):
+                return True
+            else:
+                return False
+        else:
+            try:
+                file_type = mimetypes.guess_type(filename)[0]
+                if file_type and file_type.startswith('text/'):
+                    return True
+                else:
+                    if is_binary(ifp):
+                        return False
+                    return True
+            except Exception, e:
+                print e.args
+                return False
+            
+    
+    
+    def load(self, filename,ifp):
+        comment = self.guess_comment_symbol(ifp)
+        n_cols = self.guess_number_of_columns(ifp)
+        start_idx, end_idx, lines_to_skip = self.guess_data_lines(ifp, n_cols, comment)
+        headings = self.guess_column_titles(ifp, n_cols, start_idx, comment)
+        header,columns,footer = self.get_columns(ifp, n_cols, start_idx, end_idx, lines_to_skip, headings)
+        
+        return FileContents(filename, columns, header=header, comment_symbols=[comment], skipped_rows=[(i,l) for i,l in lines_to_skip], footer=footer)
+        
+    
+    
+    def guess_comment_symbol(self, ifp):
+        try:
+            common_choices = ('#',';','%','//')
+            counts = [0,0,0,0]
+            
+            for line in ifp:
+                for i in range(len(counts)):
+                    if line.lstrip().startswith(common_choices[i]):
+                        counts[i] += 1
+                        break
+        finally:
+            ifp.seek(0)
+        if max(counts) == 0:
+            return None
+        return common_choices[counts.index(max(counts))]
+    
+    
+    def guess_number_of_columns(self, ifp):
+        try:
+            col_counts = {}
+            
+            for line in ifp:
+                n_cols = len(line.split())
+                if col_counts.has_key(n_cols):
+                    col_counts[n_cols] += 1
+                else:
+                    col_counts[n_cols] = 1
+            
+            cols, counts = zip(*col_counts.items())
+            counts, cols = multi_sort(counts, cols)
+        finally:
+            ifp.seek(0)
+        
+        return cols[-1]
+    
+    
+    def guess_data_lines(self, ifp, n_cols, comment=None):
+        try:
+            lines = ifp.readlines()
+            lines_to_skip = []
+            start_idx = None
+            end_idx = None
+            for i, line in enumerate(lines):
+                if comment is not None and line.startswith(comment):
+                    if start_idx is not None:
+                        lines_to_skip.append((i,line))
+                    continue
+                if len(line.split()) == n_cols:
+                    if start_idx is None:
+                        start_idx = i
+                    else:
+                        end_idx = i
+                else:
+                    lines_to_skip.append((i,line))
+            if end_idx is None:
+                end_idx = start_idx
+            
+            while lines_to_skip and lines_to_skip[-1][0] >= end_idx:
+                lines_to_skip.pop() #otherwise it will include line=end_idx
+            
+            
+        finally:
+            ifp.seek(0)
+            
+        return start_idx, end_idx, lines_to_skip
+    
+    
+    def get_columns(self, ifp, n_cols, start_idx, end_idx, lines_to_skip, headings):
+        
+        columns = []
+        for i in range(n_cols):
+            columns.append([])
+        
+        lines = ifp.readlines()
+        ifp.seek(0)
+        
+        header = ''.join(lines[:start_idx])
+        
+        if len(lines) == end_idx + 1:
+            footer=''
+        else:
+            footer = ''.join(lines[end_idx+1:])
+        
+        lines = lines[start_idx:end_idx+1]
+        for idx in [i[0]-start_idx for i in reversed(sorted(lines_to_skip, cmp=tuple_compare))]:
+            lines.pop(idx)
+        
+        for line in lines:
+            vals = line.split()
+            
+            for i in range(n_cols):
+                columns[i].append(vals[i])
+
+        return header,[ColumnData(c, title=headings[i]) for i,c in enumerate(columns)],footer
+        
+           
+    def guess_column_titles(self, ifp, n_cols, start_idx, comment_symbol):
+        if start_idx == 0:
+            #there are no column headings - data starts in the first row
+            return ['']*n_cols
+        
+        lines = ifp.readlines()
+        ifp.seek(0)
+        
+        words = lines[start_idx - 1].lstrip(comment_symbol).split()
+        if len(words) == n_cols:
+            return words
+        elif len(words) < n_cols:
+            #it cannot be column titles
+            return ['']*n_cols
+        else:
+            #life is more difficult since the column names might have spaces in them
+            #first check to see if there are a sane number of separators greater than one space
+            line = lines[start_idx - 1].strip().lstrip(comment_symbol).lstrip()
+            
+            seps = re.findall(r' {2,}| ?[\t\n\r\f\v]+', line)
+            
+            if len(seps) != n_cols - 1:
+                return ['']*n_cols
+
+            names = []
+            for s in seps:
+                name,line = line.split(s, 1)
+                names.append(name)
+            names.append(line)
+            
+            if len(names) == n_cols:
+                return names
+            else:
+                return ['']*n_cols
+
+
+
+register_loader(TextFileLoader())
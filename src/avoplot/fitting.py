@@ -19,6 +19,9 @@ import math
 import scipy.optimize
 import scipy.stats
 import collections
+import threading
+import multiprocessing
+import cPickle as pickle
 
 
 def get_fitting_tools():
@@ -33,27 +36,654 @@ class FittingError(Exception):
 
 
 
+class FittingCancelled(FittingError):
+    """
+    Exception raised when a fit running in a FitJob is cancelled
+    """
+    pass
+
+
+#holds the cancel event of the FitJob (if any) running in the current thread
+_thread_state = threading.local()
+
+
+def check_cancelled():
+    """
+    Raises FittingCancelled if the FitJob running in the current thread has 
+    been cancelled. Fitting tools should call this regularly during long fits
+    (for example in the error function passed to the optimiser) so that they 
+    can be cancelled. Does nothing if the fit is not running in a FitJob.
+    """
+    cancel_event = getattr(_thread_state, 'cancel_event', None)
+    if cancel_event is not None and cancel_event.is_set():
+        raise FittingCancelled("The fit was cancelled.")
+
+
+
+class FitJob(threading.Thread):
+    def __init__(self, fitting_tool, xdata, ydata, on_finished, on_failed=None):
+        """
+        Runs fit_model(fitting_tool, xdata, ydata) in a background thread. Call
+        start() to start the fit. When the fit completes on_finished(job, 
+        result) is called, where result is the (FitModel, fit_params) tuple
+        returned by fit_model(). If the fit fails (or is cancelled) then on_failed(job, 
+        exception) is called instead. Note that both callbacks are called from
+        the background thread - so GUI code should use wx.CallAfter.
+        """
+        super(FitJob, self).__init__()
+        self.daemon = True
+        
+        self.fitting_tool = fitting_tool
+        self.xdata = xdata
+        self.ydata = ydata
+        
+        self.__on_finished = on_finished
+        self.__on_failed = on_failed
+        self.__cancel_event = threading.Event()
+    
+    
+    def cancel(self):
+        """
+        Requests that the fit be cancelled. The fit will stop the next time the
+        fitting tool calls check_cancelled().
+        """
+        self.__cancel_event.set()
+    
+    
+    def is_cancelled(self):
+        """
+        Returns True if cancel() has been called, False otherwise.
+        """
+        return self.__cancel_event.is_set()
+    
+    
+    def run(self):
+        _thread_state.cancel_event = self.__cancel_event
+        try:
+            try:
+                check_cancelled()
+                result = self.do_fit()
+                check_cancelled()
+            finally:
+                _thread_state.cancel_event = None
+        
+        except Exception, e:
+            if self.__on_failed is not None:
+                self.__on_failed(self, e)
+            return
+        
+        self.__on_finished(self, result)
+    
+    
+    def do_fit(self):
+        """
+        Runs the fit (in the background thread) and returns the result. 
+        Subclasses may override this to run a different kind of fit.
+        """
+        return fit_model(self.fitting_tool, self.xdata, self.ydata)
+
+
+
+class BatchFitJob(FitJob):
+    def __init__(self, fitting_tool, datasets, on_finished, on_failed=None,
+                 processes=None):
+        """
+        Runs batch_fit(fitting_tool, datasets, processes) in a background 
+        thread. The callbacks are as for FitJob, except that the result passed
+        to on_finished is the list returned by batch_fit(). The number of fits
+        completed so far can be found using get_progress().
+        """
+        FitJob.__init__(self, fitting_tool, None, None, on_finished, 
+                        on_failed=on_failed)
+        self.datasets = datasets
+        self.processes = processes
+        self.__n_done = 0
+    
+    
+    def get_progress(self):
+        """
+        Returns a tuple (n_done, n_total) of the number of fits that have been
+        completed and the total number of fits in the batch.
+        """
+        return self.__n_done, len(self.datasets)
+    
+    
+    def __on_progress(self, n_done, n_total):
+        self.__n_done = n_done
+    
+    
+    def do_fit(self):
+        return batch_fit(self.fitting_tool, self.datasets, 
+                         processes=self.processes, 
+                         progress_callback=self.__on_progress)
+
+
+
+class FitModel(object):
+    def __init__(self, func, params, xmin, xmax):
+        """
+        Represents a fitted model. func should be a function with the signature
+        func(params, x) which returns the model (with parameters params) 
+        evaluated at each of the values in the array x. func should be defined 
+        at module level so that the model can be pickled. xmin and xmax are the
+        limits of the x range that the model was fitted over.
+        """
+        self.func = func
+        self.params = params
+        self.xmin = xmin
+        self.xmax = xmax
+    
+    
+    def __call__(self, x):
+        """
+        Returns the model evaluated at each of the values in the array x.
+        """
+        return self.func(self.params, numpy.asarray(x, dtype='float'))
+    
+    
+    def get_x_range(self):
+        """
+        Returns a tuple (xmin, xmax) of the x range that the model was fitted
+        over.
+        """
+        return self.xmin, self.xmax
+    
+    
+    def evaluate(self, n_points, xmin=None, xmax=None):
+        """
+        Returns a tuple (x, y) of arrays of the model evaluated at n_points 
+        evenly spaced x values between xmin and xmax (which default to the 
+        range that the model was fitted over).
+        """
+        if xmin is None:
+            xmin = self.xmin
+        if xmax is None:
+            xmax = self.xmax
+        
+        x = numpy.linspace(xmin, xmax, n_points)
+        return x, self(x)
+
+
+
+def linear_model(p, x):
+    """
+    Straight line model: y = p[0] * x + p[1]
+    """
+    return p[0] * x + p[1]
+
+
+
+def gaussian_model(p, x):
+    """
+    Gaussian model with parameters p = (amplitude, mean, sigma, y_offset)
+    """
+    return p[0] * numpy.exp(-(x - p[1])**2 / (2.0 * p[2]**2)) + p[3]
+
+
+
+def gaussian_jacobian(p, x):
+    """
+    Jacobian of gaussian_model with respect to its parameters. Returns an
+    array of shape (len(x), 4).
+    """
+    dx = x - p[1]
+    e = numpy.exp(-dx**2 / (2.0 * p[2]**2))
+    jac = numpy.empty((len(x), 4), dtype='float')
+    jac[:, 0] = e
+    jac[:, 1] = p[0] * e * dx / p[2]**2
+    jac[:, 2] = p[0] * e * dx**2 / p[2]**3
+    jac[:, 3] = 1.0
+    return jac
+
+
+
+def lorentzian_model(p, x):
+    """
+    Lorentzian model with parameters p = (amplitude, centre, hwhm, y_offset)
+    """
+    g2 = p[2]**2
+    return p[0] * g2 / ((x - p[1])**2 + g2) + p[3]
+
+
+
+def lorentzian_jacobian(p, x):
+    """
+    Jacobian of lorentzian_model with respect to its parameters. Returns an
+    array of shape (len(x), 4).
+    """
+    dx = x - p[1]
+    g2 = p[2]**2
+    denom = dx**2 + g2
+    jac = numpy.empty((len(x), 4), dtype='float')
+    jac[:, 0] = g2 / denom
+    jac[:, 1] = 2.0 * p[0] * g2 * dx / denom**2
+    jac[:, 2] = 2.0 * p[0] * p[2] * dx**2 / denom**2
+    jac[:, 3] = 1.0
+    return jac
+
+
+
+def exp_decay_model(p, x):
+    """
+    Exponential decay model with parameters p = (amplitude, decay_constant,
+    y_offset): y = p[0] * exp(-x / p[1]) + p[2]
+    """
+    return p[0] * numpy.exp(-x / p[1]) + p[2]
+
+
+
+def exp_decay_jacobian(p, x):
+    """
+    Jacobian of exp_decay_model with respect to its parameters. Returns an
+    array of shape (len(x), 3).
+    """
+    e = numpy.exp(-x / p[1])
+    jac = numpy.empty((len(x), 3), dtype='float')
+    jac[:, 0] = e
+    jac[:, 1] = p[0] * e * x / p[1]**2
+    jac[:, 2] = 1.0
+    return jac
+
+
+
+def shifted_model(p, x):
+    """
+    Model which evaluates another model with its x origin shifted. The
+    parameters are p = (func, x_offset, func_params) and the result is
+    func(func_params, x - x_offset). This allows models to be fitted to data
+    with a large x offset (e.g. dates) without losing precision.
+    """
+    func, x_offset, func_params = p
+    return func(func_params, x - x_offset)
+
+
+
+def tabulated_model(p, x):
+    """
+    Model which linearly interpolates the tabulated values p = (xdata, ydata).
+    Used to wrap fitting tools which only return a fit curve.
+    """
+    return numpy.interp(x, p[0], p[1])
+
+
+
+def fit_model(fitting_tool, xdata, ydata, bootstrap=True):
+    """
+    Fits the data using the fitting tool and returns a tuple (FitModel, 
+    fit_params). Fitting tools which only implement the fit() method (and not
+    fit_model()) are supported by tabulating the fit curve that they return.
+    
+    If bootstrapping is turned on for the fitting tool (see 
+    FittingToolBase.set_bootstrap()) and bootstrap is True, then confidence
+    intervals are added to the fit parameters (see add_confidence_intervals()).
+    """
+    try:
+        model, fit_params = fitting_tool.fit_model(xdata, ydata)
+    except NotImplementedError:
+        fit_x, fit_y, fit_params = fitting_tool.fit(xdata, ydata)
+        fit_x = numpy.asarray(fit_x, dtype='float')
+        fit_y = numpy.asarray(fit_y, dtype='float')
+        order = numpy.argsort(fit_x)
+        model = FitModel(tabulated_model, (fit_x[order], fit_y[order]),
+                         fit_x[order[0]], fit_x[order[-1]])
+    
+    if bootstrap and fitting_tool.bootstrap_samples > 0:
+        xdata = numpy.asarray(xdata, dtype='float')
+        ydata = numpy.asarray(ydata, dtype='float')
+        samples = fitting_tool.bootstrap(xdata, ydata, model, 
+                                         fitting_tool.bootstrap_samples)
+        fit_params = add_confidence_intervals(fit_params, samples, 
+                                              fitting_tool.confidence_level)
+    
+    return model, fit_params
+
+
+
+def add_confidence_intervals(fit_params, samples, confidence_level):
+    """
+    Returns a copy of fit_params with confidence intervals added. samples 
+    should be an array of shape (n_samples, len(fit_params) - 1) of bootstrap
+    estimates of the fit parameters. Each (name, value) entry of fit_params 
+    becomes a (name, value, (lower, upper)) entry, where lower and upper are
+    the limits of the confidence_level percent interval (found from the 
+    percentiles of the samples). The title of the fit parameters is updated to
+    say that they include confidence intervals.
+    """
+    samples = numpy.asarray(samples, dtype='float')
+    if samples.ndim != 2 or len(samples) < 2:
+        raise FittingError("Too few bootstrap fits succeeded to estimate "
+                           "confidence intervals.")
+    
+    tail = (100.0 - confidence_level) / 2.0
+    lower, upper = numpy.percentile(samples, [tail, 100.0 - tail], axis=0)
+    
+    title = fit_params[0][0]
+    new_params = [("%s (%g%% bootstrap confidence intervals)"%(title, 
+                                                            confidence_level), 
+                   '')]
+    for i, param in enumerate(fit_params[1:]):
+        new_params.append((param[0], param[1], (lower[i], upper[i])))
+    
+    return new_params
+
+
+
+def get_fit_cache_key(data_version, ranges, fitting_tool):
+    """
+    Returns a hashable key identifying a fit of the (start, stop) index ranges
+    of version data_version of a data series' data using the fitting tool. Two
+    fits with the same key will give the same result, so the key can be used
+    to cache fit results.
+    """
+    return (data_version, tuple(ranges), fitting_tool.__class__.__name__,
+            fitting_tool.name, fitting_tool.get_parameters(), 
+            fitting_tool.bootstrap_samples, fitting_tool.confidence_level)
+
+
+
+def _batch_fit_worker(args):
+    """
+    Runs a single fit of a batch. This is run in the worker processes of 
+    batch_fit() and so must be defined at module level. Exceptions are
+    returned (as FittingErrors, which can always be pickled) rather than
+    raised so that one failed fit does not abort the whole batch.
+    """
+    fitting_tool, xdata, ydata = args
+    try:
+        return fit_model(fitting_tool, xdata, ydata)
+    except Exception, e:
+        return FittingError(str(e))
+
+
+
+def batch_fit(fitting_tool, datasets, processes=None, progress_callback=None):
+    """
+    Fits each of the (xdata, ydata) tuples in datasets using the fitting tool
+    and returns a list (in the same order as datasets) of the results. Each
+    result is either a (FitModel, fit_params) tuple or, if that fit failed, a
+    FittingError instance.
+    
+    The fits are distributed across a pool of processes - one per CPU unless
+    processes is specified. If the fitting tool cannot be pickled (and so 
+    cannot be sent to the worker processes) or there is only one fit to do, 
+    then the fits are run in the current process instead.
+    
+    If progress_callback is specified, then progress_callback(n_done, n_total)
+    is called each time a fit completes. check_cancelled() is called between
+    fits, and the pool is terminated if the batch is cancelled.
+    """
+    n_total = len(datasets)
+    tasks = [(fitting_tool, xdata, ydata) for xdata, ydata in datasets]
+    
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, n_total)
+    
+    if processes > 1:
+        try:
+            pickle.dumps(fitting_tool, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            processes = 1
+    
+    if processes <= 1:
+        results = []
+        for task in tasks:
+            check_cancelled()
+            results.append(_batch_fit_worker(task))
+            if progress_callback is not None:
+                progress_callback(len(results), n_total)
+        return results
+    
+    return _run_in_pool(_batch_fit_worker, tasks, processes, progress_callback)
+
+
+
+def _run_in_pool(func, tasks, processes, progress_callback=None, 
+                 initializer=None, initargs=()):
+    """
+    Returns a list of func(task) for each of the tasks, computed by a pool of
+    processes. The pool is created with the initializer and initargs 
+    specified. check_cancelled() is called while waiting for results and the 
+    pool is terminated if the job is cancelled. progress_callback(n_done, 
+    n_total) is called (if specified) each time a result is received.
+    """
+    n_total = len(tasks)
+    results = []
+    
+    #send the tasks to the workers in chunks to keep the overheads down, but
+    #make sure each process gets several chunks so that the load is balanced
+    chunksize = max(1, n_total // (4 * processes))
+    
+    pool = multiprocessing.Pool(processes, initializer, initargs)
+    try:
+        result_iter = pool.imap(func, tasks, chunksize)
+        while len(results) < n_total:
+            check_cancelled()
+            try:
+                results.append(result_iter.next(timeout=0.1))
+            except multiprocessing.TimeoutError:
+                continue
+            if progress_callback is not None:
+                progress_callback(len(results), n_total)
+        pool.close()
+    
+    finally:
+        pool.terminate()
+        pool.join()
+    
+    return results
+
+
+
+#holds the data being bootstrapped in the bootstrap_fit() worker processes
+_bootstrap_data = None
+
+
+def _init_bootstrap_worker(fitting_tool, xdata, fitted_ydata, residuals):
+    """
+    Initialises a bootstrap_fit() worker process. The data is sent to each
+    worker just once, rather than with every task.
+    """
+    global _bootstrap_data
+    _bootstrap_data = (fitting_tool, xdata, fitted_ydata, residuals)
+
+
+
+def _bootstrap_worker(seed, data=None):
+    """
+    Fits one bootstrap resample of the data (the data initialised by 
+    _init_bootstrap_worker(), unless data is specified). The resample is 
+    generated from seed. Returns a list of the values of the fit parameters,
+    or None if the fit failed.
+    """
+    if data is None:
+        data = _bootstrap_data
+    fitting_tool, xdata, fitted_ydata, residuals = data
+    
+    rand = numpy.random.RandomState(seed)
+    ydata = fitted_ydata + residuals[rand.randint(0, len(residuals), 
+                                                  len(residuals))]
+    try:
+        model, fit_params = fit_model(fitting_tool, xdata, ydata, 
+                                      bootstrap=False)
+    except Exception:
+        return None
+    
+    return [p[1] for p in fit_params[1:]]
+
+
+
+def bootstrap_fit(fitting_tool, xdata, ydata, model, n_samples, processes=None):
+    """
+    Estimates the distribution of the fit parameters by refitting n_samples
+    bootstrap resamples of the data, and returns an array of shape 
+    (n_successful_fits, n_params) of the fit parameter values. model is the
+    FitModel fitted to the original data.
+    
+    The resamples are made by adding residuals (resampled with replacement) of
+    the original fit to the fitted model (a "residual bootstrap"). This keeps 
+    the x values fixed, so the fits are all of the same form as the original.
+    
+    The refits are distributed across a pool of processes - one per CPU 
+    unless processes is specified. check_cancelled() is called between fits.
+    """
+    fitted_ydata = model(xdata)
+    residuals = ydata - fitted_ydata
+    data = (fitting_tool, xdata, fitted_ydata, residuals)
+    seeds = numpy.random.randint(0, 2**31 - 1, n_samples).tolist()
+    
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, n_samples)
+    
+    #worker processes (e.g. of a batch fit) cannot have pools of their own
+    if multiprocessing.current_process().daemon:
+        processes = 1
+    
+    if processes > 1:
+        try:
+            pickle.dumps(fitting_tool, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            processes = 1
+    
+    if processes <= 1:
+        results = []
+        for seed in seeds:
+            check_cancelled()
+            results.append(_bootstrap_worker(seed, data))
+    else:
+        results = _run_in_pool(_bootstrap_worker, seeds, processes, 
+                               initializer=_init_bootstrap_worker, 
+                               initargs=data)
+    
+    return numpy.array([r for r in results if r is not None], dtype='float')
+
+
+
+def least_squares_fit(func, jac, p0, xdata, ydata, bounds=None):
+    """
+    Fits func(p, x) to the data using a non-linear least squares method and
+    returns the best fit parameters. jac(p, x) should return the Jacobian of
+    func with respect to the parameters as an array of shape (len(x), len(p)).
+    bounds can be a tuple (lower, upper) of arrays of limits on the parameter
+    values.
+
+    If scipy.optimize.least_squares is available (scipy >= 0.17) then it is
+    used and the bounds are respected. Otherwise scipy.optimize.leastsq is used
+    and the bounds are only used to constrain the initial guess. Either way,
+    check_cancelled() is called on every iteration.
+    """
+    def errfunc(p, x, y):
+        check_cancelled()
+        return func(p, x) - y
+
+    def jacfunc(p, x, y):
+        check_cancelled()
+        return jac(p, x)
+
+    p0 = numpy.asarray(p0, dtype='float')
+
+    if bounds is not None:
+        lower = numpy.asarray(bounds[0], dtype='float')
+        upper = numpy.asarray(bounds[1], dtype='float')
+        p0 = numpy.clip(p0, lower, upper)
+    else:
+        lower, upper = -numpy.inf, numpy.inf
+
+    if hasattr(scipy.optimize, 'least_squares'):
+        result = scipy.optimize.least_squares(errfunc, p0, jac=jacfunc,
+                                              bounds=(lower, upper),
+                                              args=(xdata, ydata))
+        if not result.success:
+            raise FittingError("Fit did not converge: %s"%result.message)
+        return result.x
+
+    p1, success = scipy.optimize.leastsq(errfunc, p0, args=(xdata, ydata),
+                                         Dfun=jacfunc)
+
+    if success not in (1,2,3,4):
+        raise FittingError("Fit did not converge.")
+
+    return p1
+
+
+
 class FittingToolBase:
     def __init__(self, name):
         """
-        Base class for fitting tools - must be subclassed.
+        Base class for fitting tools - must be subclassed. Subclasses should 
+        override the fit_model() method (older tools may override fit() 
+        instead).
         
         * name - a string describing the type of fit, this will be displayed in 
                  the drop-down menu.
         """
         
         self.name = name
+        self.bootstrap_samples = 0
+        self.confidence_level = 95.0
+    
+    
+    def set_bootstrap(self, n_samples, confidence_level=95.0):
+        """
+        Turns on bootstrap estimation of confidence intervals for the fit 
+        parameters. Each fit is followed by n_samples refits of resampled 
+        data (see the bootstrap() method), and the confidence_level percent 
+        confidence intervals of the parameters are added to the fit_params 
+        returned by fit_model() (the module level function). Set n_samples to
+        zero to turn bootstrapping off.
+        """
+        self.bootstrap_samples = int(n_samples)
+        self.confidence_level = float(confidence_level)
+    
+    
+    def bootstrap(self, xdata, ydata, model, n_samples):
+        """
+        Returns an array of shape (n_samples, n_params) of bootstrap estimates
+        of the fit parameters (the values in fit_params, excluding the title),
+        where model is the FitModel fitted to the data. By default this refits
+        resampled data using a pool of processes (see bootstrap_fit()), but 
+        tools which can compute the refits more efficiently should override 
+        it. Failed refits may be left out of the returned array.
+        """
+        return bootstrap_fit(self, xdata, ydata, model, n_samples)
+    
+    
+    def fit_model(self, xdata, ydata):
+        """
+        Fits the data and returns a tuple (FitModel, fit_params), where 
+        fit_params is a list of (name, value) tuples to be displayed to the 
+        user. The first entry in fit_params should be a (title, '') tuple.
+        """
+        raise NotImplementedError("Subclasses should override the fit_model method of FittingToolBase")
         
         
+    def get_parameters(self):
+        """
+        Returns a tuple of the settings of the tool which affect the results of
+        its fits (other than its class and name). This is used to identify 
+        repeat fits in the fit cache (see get_fit_cache_key()). Tools with 
+        settings should override this - the returned tuple must be hashable.
+        """
+        return ()
+    
+    
     def fit(self, xdata, ydata):
-        raise NotImplementedError("Subclasses should override the fit method of FittingToolBase")
+        """
+        Fits the data and returns a tuple (fit_x_data, fit_y_data, fit_params)
+        with the fitted model evaluated at 2000 points across the range of 
+        xdata.
+        """
+        model, fit_params = self.fit_model(xdata, ydata)
+        fit_x_data, fit_y_data = model.evaluate(2000)
+        return fit_x_data, fit_y_data, fit_params
 
 
 class LinearFittingTool(FittingToolBase):
     def __init__(self):
         FittingToolBase.__init__(self, 'Linear')
     
-    def fit(self, xdata, ydata):
+    def fit_model(self, xdata, ydata):
         if len(xdata) != len(ydata):
             raise FittingError("Lengths of xdata and ydata must match")
         
@@ -67,88 +697,342 @@ class LinearFittingTool(FittingToolBase):
                       ("Std. Error", std_err)
                       ]
         
-        fit_y_data = slope * xdata + intercept
+        model = FitModel(linear_model, (slope, intercept), numpy.min(xdata), 
+                         numpy.max(xdata))
+        
+        return model, fit_params
+    
+    
+    def bootstrap(self, xdata, ydata, model, n_samples):
+        """
+        Overrides the base class method to compute the bootstrap regressions 
+        directly. Since the x values are the same in every resample, the 
+        regressions of a whole block of resamples can be computed with a 
+        single matrix product, rather than refitting each one separately.
+        """
+        n = len(xdata)
+        if n < 3:
+            raise FittingError("Need at least 3 points to bootstrap a linear fit")
+        
+        fitted_ydata = model(xdata)
+        residuals = ydata - fitted_ydata
+        
+        x_mean = xdata.mean()
+        x_centred = xdata - x_mean
+        ss_x = numpy.dot(x_centred, x_centred)
+        
+        #process the resamples in blocks to limit the memory used
+        block_size = max(1, min(n_samples, 10000000 // n))
+        samples = []
         
-        return xdata, fit_y_data, fit_params
+        for start in range(0, n_samples, block_size):
+            check_cancelled()
+            n_block = min(block_size, n_samples - start)
+            
+            resampled_y = fitted_ydata + residuals[numpy.random.randint(0, n, (n_block, n))]
+            y_mean = resampled_y.mean(axis=1)
+            
+            slopes = numpy.dot(resampled_y, x_centred) / ss_x
+            intercepts = y_mean - slopes * x_mean
+            
+            ss_y = ((resampled_y - y_mean[:, numpy.newaxis])**2).sum(axis=1)
+            r_squared = numpy.clip(slopes**2 * ss_x / ss_y, 0.0, 1.0)
+            
+            #as scipy.stats.linregress
+            std_errs = numpy.sqrt((1.0 - r_squared) * ss_y / ss_x / (n - 2))
+            t = numpy.sqrt(r_squared * (n - 2) / numpy.maximum(1.0 - r_squared, 1e-20))
+            p_values = 2.0 * scipy.stats.t.sf(t, n - 2)
+            
+            samples.append(numpy.column_stack((slopes, intercepts, r_squared, 
+                                               p_values, std_errs)))
+        
+        return numpy.concatenate(samples)
 
 
 
-class GaussianFittingTool(FittingToolBase):
+class LeastSquaresFittingToolBase(FittingToolBase):
+    def __init__(self, name, model_func, jacobian_func, shift_x=False):
+        """
+        Base class for fitting tools which fit a non-linear model using 
+        least_squares_fit(). model_func(p, x) and jacobian_func(p, x) should
+        be module level functions. Subclasses must override the 
+        get_initial_guess() and get_fit_params() methods and may override the
+        get_bounds() method.
+        
+        If shift_x is True then the model is fitted to x - min(xdata) rather
+        than to x, which keeps models such as exponentials well conditioned
+        for data with a large x offset (e.g. dates).
+        """
+        FittingToolBase.__init__(self, name)
+        self.model_func = model_func
+        self.jacobian_func = jacobian_func
+        self.shift_x = shift_x
+    
+    
+    def get_initial_guess(self, xdata, ydata):
+        """
+        Returns an array of initial guesses of the model parameters for the 
+        (shifted) xdata and ydata.
+        """
+        raise NotImplementedError("Subclasses should override the get_initial_guess method of LeastSquaresFittingToolBase")
+    
+    
+    def get_bounds(self, xdata, ydata):
+        """
+        Returns a tuple (lower, upper) of arrays of limits on the model 
+        parameters, or None if the parameters are unbounded.
+        """
+        return None
+    
+    
+    def get_fit_params(self, p, x_offset):
+        """
+        Returns the list of (name, value) tuples to be displayed to the user 
+        for the best fit parameters p. x_offset is the shift that was applied
+        to the xdata before fitting (zero if shift_x is False).
+        """
+        raise NotImplementedError("Subclasses should override the get_fit_params method of LeastSquaresFittingToolBase")
+    
+    
+    def fit_model(self, xdata, ydata, p0=None):
+        """
+        Fits the model to the data and returns a tuple (FitModel, fit_params).
+        The initial guess of the parameters p0 is found using 
+        get_initial_guess() unless it is specified.
+        """
+        if len(xdata) != len(ydata):
+            raise FittingError("Lengths of xdata and ydata must match")
+        
+        xdata = numpy.asarray(xdata, dtype='float')
+        ydata = numpy.asarray(ydata, dtype='float')
+        
+        xmin = numpy.min(xdata)
+        xmax = numpy.max(xdata)
+        
+        if self.shift_x:
+            x_offset = xmin
+            xdata = xdata - x_offset
+        else:
+            x_offset = 0.0
+        
+        if p0 is None:
+            p0 = self.get_initial_guess(xdata, ydata)
+        
+        if len(xdata) < len(p0):
+            raise FittingError("xdata and ydata need to contain at least %d "
+                               "elements each"%len(p0))
+        
+        p1 = least_squares_fit(self.model_func, self.jacobian_func, p0, xdata,
+                               ydata, bounds=self.get_bounds(xdata, ydata))
+        
+        if self.shift_x:
+            model = FitModel(shifted_model, (self.model_func, x_offset, p1), 
+                             xmin, xmax)
+        else:
+            model = FitModel(self.model_func, p1, xmin, xmax)
+        
+        return model, self.get_fit_params(p1, x_offset)
+
+
+
+def _peak_guess(xdata, ydata):
+    """
+    Returns a tuple (amplitude, centre, width, y_offset) of rough estimates of
+    the parameters of a single peak in the data.
+    """
+    weights = ydata - numpy.average(ydata)
+    weights[numpy.where(weights <0)]=0 
+    if weights.sum() > 0:
+        centre = numpy.average(xdata,weights=weights)
+    else:
+        centre = xdata[numpy.argmax(ydata)]
+    
+    #use the y value furthest from the peak as a guess of y offset
+    data_midpoint = (xdata[-1] + xdata[0])/2.0
+    if centre > data_midpoint:
+        y_offset = ydata[0]        
+    else:
+        y_offset = ydata[-1]
+    
+    #take the weighted spread of the data as an estimate of the width
+    variance = numpy.dot(numpy.abs(ydata), (xdata-centre)**2)/numpy.abs(ydata).sum()  # Fast and numerically precise    
+    width = math.sqrt(variance) or (numpy.max(xdata) - numpy.min(xdata)) or 1.0
+    
+    return max(ydata), centre, width, y_offset
+
+
+
+class GaussianFittingTool(LeastSquaresFittingToolBase):
     def __init__(self):
-        FittingToolBase.__init__(self, 'Gaussian')
+        LeastSquaresFittingToolBase.__init__(self, 'Gaussian', gaussian_model,
+                                             gaussian_jacobian)
     
     
-    def fit(self, xdata, ydata):
-        return self.fit_gaussian(xdata, ydata)
+    def get_initial_guess(self, xdata, ydata):
+        return numpy.array(_peak_guess(xdata, ydata))
+    
+    
+    def get_bounds(self, xdata, ydata):
+        #sigma must be positive
+        return ([-numpy.inf, -numpy.inf, 0.0, -numpy.inf], 
+                [numpy.inf, numpy.inf, numpy.inf, numpy.inf])
+    
+    
+    def get_fit_params(self, p, x_offset):
+        return [('Gaussian Fit Parameters',''),
+                ('Amplitude', p[0]),
+                ('Mean',p[1]),
+                ('Std. Dev.', p[2]),
+                ('FWHM', 2.0 * math.sqrt(2.0 * math.log(2.0)) *p[2]),
+                ('Y-offset', p[3])
+                ]
     
         
     def fit_gaussian(self, xdata, ydata, amplitude_guess=None, mean_guess=None, 
                      sigma_guess=None, y_offset_guess=None, plot_fit=True):
         """
-        Fits a gaussian to some data using a least squares fit method. Returns a named tuple
-        of best fit parameters (amplitude, mean, sigma, y_offset).
+        Fits a gaussian to some data using a least squares fit method. Returns
+        a tuple (FitModel, fit_params).
          
         Initial guess values for the fit parameters can be specified as kwargs. Otherwise they
         are estimated from the data.
-         
-        If plot_fit=True then the fit curve is plotted over the top of the raw data and displayed.
         """
-    
         if len(xdata) != len(ydata):
             raise FittingError("Lengths of xdata and ydata must match")
          
         if len(xdata) < 4:
             raise FittingError("xdata and ydata need to contain at least 4 elements each")
-         
+        
+        xdata = numpy.asarray(xdata, dtype='float')
+        ydata = numpy.asarray(ydata, dtype='float')
+        
         # guess some fit parameters - unless they were specified as kwargs
-        if amplitude_guess is None:
-            amplitude_guess = max(ydata)
-         
-        if mean_guess is None:
-            weights = ydata - numpy.average(ydata)
-            weights[numpy.where(weights <0)]=0 
-            mean_guess = numpy.average(xdata,weights=weights)
-                        
-        #use the y value furthest from the maximum as a guess of y offset 
-        if y_offset_guess is None:
-            data_midpoint = (xdata[-1] + xdata[0])/2.0
-            if mean_guess > data_midpoint:
-                yoffset_guess = ydata[0]        
-            else:
-                yoffset_guess = ydata[-1]
-     
-        #find width at half height as estimate of sigma        
-        if sigma_guess is None:      
-            variance = numpy.dot(numpy.abs(ydata), (xdata-mean_guess)**2)/numpy.abs(ydata).sum()  # Fast and numerically precise    
-            sigma_guess = math.sqrt(variance)
-         
-         
-        #put guess params into an array ready for fitting
-        p0 = numpy.array([amplitude_guess, mean_guess, sigma_guess, yoffset_guess])
-     
-        #define the gaussian function and associated error function
-        fitfunc = lambda p, x: p[0]*numpy.exp(-(x-p[1])**2/(2.0*p[2]**2)) + p[3]
-        errfunc = lambda p, x, y: fitfunc(p,x)-y
-        
-        # do the fitting
-        p1, success = scipy.optimize.leastsq(errfunc, p0, args=(xdata,ydata))
-     
-        if success not in (1,2,3,4):
-            raise FittingError("Could not fit Gaussian to data.")
-        
-        xdata = numpy.linspace(xdata[0], xdata[-1], 2000)
-        fit_y_data = [fitfunc(p1, i) for i in xdata]
-         
-        fit_params = [
-                      ('Gaussian Fit Parameters',''),
-                      ('Amplitude', p1[0]),
-                      ('Mean',p1[1]),
-                      ('Std. Dev.', p1[2]),
-                      ('FWHM', 2.0 * math.sqrt(2.0 * math.log(2.0)) *p1[2]),
-                      ('Y-offset', p1[3])
-                      ]
+        p0 = self.get_initial_guess(xdata, ydata)
+        for i, guess in enumerate((amplitude_guess, mean_guess, sigma_guess, 
+                                   y_offset_guess)):
+            if guess is not None:
+                p0[i] = guess
+        
+        return self.fit_model(xdata, ydata, p0=p0)
+
+
+
+class LorentzianFittingTool(LeastSquaresFittingToolBase):
+    def __init__(self):
+        LeastSquaresFittingToolBase.__init__(self, 'Lorentzian', 
+                                             lorentzian_model,
+                                             lorentzian_jacobian)
+    
+    
+    def get_initial_guess(self, xdata, ydata):
+        return numpy.array(_peak_guess(xdata, ydata))
+    
+    
+    def get_bounds(self, xdata, ydata):
+        #hwhm must be positive
+        return ([-numpy.inf, -numpy.inf, 0.0, -numpy.inf], 
+                [numpy.inf, numpy.inf, numpy.inf, numpy.inf])
+    
+    
+    def get_fit_params(self, p, x_offset):
+        return [('Lorentzian Fit Parameters',''),
+                ('Amplitude', p[0]),
+                ('Centre',p[1]),
+                ('HWHM', p[2]),
+                ('FWHM', 2.0 * p[2]),
+                ('Y-offset', p[3])
+                ]
+
+
+
+class ExponentialDecayFittingTool(LeastSquaresFittingToolBase):
+    def __init__(self):
+        LeastSquaresFittingToolBase.__init__(self, 'Exponential Decay', 
+                                             exp_decay_model,
+                                             exp_decay_jacobian, shift_x=True)
+    
+    
+    def get_initial_guess(self, xdata, ydata):
+        #the data is shifted so that it starts at x = 0
+        first = numpy.argmin(xdata)
+        last = numpy.argmax(xdata)
+        y_offset = ydata[last]
+        amplitude = ydata[first] - y_offset
+        decay_constant = (xdata[last] / 3.0) or 1.0
+        return numpy.array([amplitude, decay_constant, y_offset])
+    
+    
+    def get_bounds(self, xdata, ydata):
+        #decay constant must be positive
+        return ([-numpy.inf, 0.0, -numpy.inf], 
+                [numpy.inf, numpy.inf, numpy.inf])
+    
+    
+    def get_fit_params(self, p, x_offset):
+        return [('Exponential Decay Fit Parameters',''),
+                ('Amplitude', p[0]),
+                ('Decay Constant',p[1]),
+                ('Half-life', math.log(2.0) * p[1]),
+                ('Y-offset', p[2]),
+                ('X-origin', x_offset)
+                ]
+
+
+
+class PolynomialFittingTool(FittingToolBase):
+    def __init__(self, degree):
+        """
+        Fits a polynomial of the specified degree. Since the model is linear
+        in its coefficients, the fit is solved directly (in a single linear
+        least squares step) rather than iteratively. The x data is shifted to 
+        start at zero before fitting to keep the problem well conditioned.
+        """
+        FittingToolBase.__init__(self, 'Polynomial (degree %d)'%degree)
+        self.degree = degree
+    
+    
+    def get_parameters(self):
+        return (self.degree,)
+    
+    
+    def fit_model(self, xdata, ydata):
+        if len(xdata) != len(ydata):
+            raise FittingError("Lengths of xdata and ydata must match")
+        
+        if len(xdata) <= self.degree:
+            raise FittingError("xdata and ydata need to contain at least %d "
+                               "elements each"%(self.degree + 1))
+        
+        xdata = numpy.asarray(xdata, dtype='float')
+        ydata = numpy.asarray(ydata, dtype='float')
+        
+        xmin = numpy.min(xdata)
+        xmax = numpy.max(xdata)
+        shifted_x = xdata - xmin
+        
+        check_cancelled()
+        coeffs = numpy.polyfit(shifted_x, ydata, self.degree)
+        check_cancelled()
+        
+        residuals = ydata - numpy.polyval(coeffs, shifted_x)
+        ss_tot = ((ydata - ydata.mean())**2).sum()
+        if ss_tot > 0:
+            r_squared = 1.0 - (residuals**2).sum() / ss_tot
+        else:
+            r_squared = 1.0
+        
+        fit_params = [('Polynomial Fit Parameters',''),
+                      ('X-origin', xmin)]
+        
+        #numpy.polyfit returns the highest power coefficient first
+        for power, c in enumerate(coeffs[::-1]):
+            fit_params.append(('Coeff. x^%d'%power, c))
+        fit_params.append(('R^2', r_squared))
+        
+        model = FitModel(shifted_model, (numpy.polyval, xmin, coeffs), xmin, 
+                         xmax)
         
-        return xdata, fit_y_data, fit_params   
+        return model, fit_params
 
 
 
@@ -156,4 +1040,6 @@ class GaussianFittingTool(FittingToolBase):
 
 #all tools defined in this module must be added to this list in order to be
 #accessible to AvoPlot
-__fitting_tools = [LinearFittingTool(),GaussianFittingTool()]        
\ No newline at end of file
+__fitting_tools = [LinearFittingTool(),GaussianFittingTool(), 
+                   LorentzianFittingTool(), ExponentialDecayFittingTool(),
+                   PolynomialFittingTool(2), PolynomialFittingTool(3)]        
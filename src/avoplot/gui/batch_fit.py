@@ -0,0 +1,350 @@
+#Copyright (C) Nial Peters 2013
+#
+#This file is part of AvoPlot.
+#
+#AvoPlot is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#AvoPlot is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with AvoPlot.  If not, see <http://www.gnu.org/licenses/>.
+"""
+The batch_fit module provides the GUI for fitting the same model to many data
+series at once. The fits themselves are run by fitting.BatchFitJob, which
+spreads them across a pool of processes.
+"""
+import wx
+
+import avoplot
+from avoplot import fitting
+from avoplot import series
+from avoplot import data_selection
+from avoplot import subplots
+from avoplot.gui import dialog
+
+
+def get_fittable_series(fig):
+    """
+    Returns a list of all the XYDataSeries in the XY subplots of the figure
+    (fig should be an avoplot.figure.AvoPlotFigure instance). Fits are not
+    included.
+    """
+    series_list = []
+    for subplot in fig.get_child_elements():
+        if not isinstance(subplot, subplots.AvoPlotXYSubplot):
+            continue
+        for s in subplot.get_child_elements():
+            if (isinstance(s, series.XYDataSeries) and
+                not isinstance(s, series.FitDataSeries)):
+                series_list.append(s)
+    return series_list
+
+
+
+class BatchFitDialog(dialog.AvoPlotDialog):
+    def __init__(self, parent, subplot):
+        """
+        Dialog which allows the user to choose a fitting tool and the data
+        series to apply it to. All the series in the figure that the subplot
+        belongs to are listed, with those in the subplot selected by default.
+        """
+        dialog.AvoPlotDialog.__init__(self, parent, "Batch fit")
+        
+        self.series_list = get_fittable_series(subplot.get_figure())
+        
+        vsizer = wx.BoxSizer(wx.VERTICAL)
+        
+        #fitting tool selection
+        tool_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        tool_sizer.Add(wx.StaticText(self, wx.ID_ANY, "Fit type:"), 0,
+                       wx.ALIGN_CENTER_VERTICAL|wx.RIGHT, border=5)
+        self.fit_type = wx.Choice(self, wx.ID_ANY,
+                                  choices=[ft.name for ft in fitting.get_fitting_tools()])
+        self.fit_type.SetSelection(0)
+        tool_sizer.Add(self.fit_type, 1, wx.EXPAND)
+        vsizer.Add(tool_sizer, 0, wx.EXPAND|wx.ALL, border=5)
+        
+        #series selection
+        sbox = wx.StaticBox(self, wx.ID_ANY, 'Data series')
+        series_static_szr = wx.StaticBoxSizer(sbox, wx.VERTICAL)
+        
+        labels = [': '.join([s.get_subplot().get_name(), s.get_name()])
+                  for s in self.series_list]
+        self.series_checklist = wx.CheckListBox(self, wx.ID_ANY,
+                                                size=(300, 200),
+                                                choices=labels)
+        for i, s in enumerate(self.series_list):
+            self.series_checklist.Check(i, s.get_subplot() is subplot)
+        series_static_szr.Add(self.series_checklist, 1, wx.EXPAND)
+        
+        select_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        select_all_button = wx.Button(self, wx.ID_ANY, "Select All")
+        select_none_button = wx.Button(self, wx.ID_ANY, "Select None")
+        select_sizer.Add(select_all_button, 0)
+        select_sizer.Add(select_none_button, 0, wx.LEFT, border=5)
+        series_static_szr.Add(select_sizer, 0, wx.ALIGN_RIGHT|wx.TOP, border=5)
+        
+        vsizer.Add(series_static_szr, 1, wx.EXPAND|wx.ALL, border=5)
+        
+        #create main buttons for the dialog
+        button_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        cancel_button = wx.Button(self, wx.ID_CANCEL, "Cancel")
+        self.fit_button = wx.Button(self, wx.ID_OK, "Fit")
+        button_sizer.Add(cancel_button, 0, wx.ALIGN_TOP | wx.ALIGN_RIGHT)
+        button_sizer.Add(self.fit_button, 0, wx.ALIGN_TOP | wx.ALIGN_RIGHT|wx.LEFT, border=5)
+        vsizer.Add(button_sizer, 0, wx.ALIGN_BOTTOM | wx.ALIGN_RIGHT | wx.ALL, border=10)
+        
+        wx.EVT_BUTTON(self, select_all_button.GetId(), self.on_select_all)
+        wx.EVT_BUTTON(self, select_none_button.GetId(), self.on_select_none)
+        wx.EVT_CHECKLISTBOX(self, self.series_checklist.GetId(), self.on_check)
+        
+        self.SetSizer(vsizer)
+        vsizer.Fit(self)
+        self.SetAutoLayout(True)
+        self.on_check(None)
+        self.CentreOnParent()
+    
+    
+    def on_select_all(self, evnt):
+        for i in range(len(self.series_list)):
+            self.series_checklist.Check(i, True)
+        self.on_check(None)
+    
+    
+    def on_select_none(self, evnt):
+        for i in range(len(self.series_list)):
+            self.series_checklist.Check(i, False)
+        self.on_check(None)
+    
+    
+    def on_check(self, evnt):
+        """
+        Event handler for the series checkboxes. Only enables the fit button if
+        there is at least one series selected.
+        """
+        self.fit_button.Enable(bool(self.get_selected_series()))
+    
+    
+    def get_fitting_tool(self):
+        """
+        Returns the fitting tool (a fitting.FittingToolBase instance) chosen by
+        the user.
+        """
+        return fitting.get_fitting_tools()[self.fit_type.GetSelection()]
+    
+    
+    def get_selected_series(self):
+        """
+        Returns a list of the data series selected by the user.
+        """
+        return [s for i, s in enumerate(self.series_list)
+                if self.series_checklist.IsChecked(i)]
+
+
+
+class BatchFitResultsDialog(dialog.AvoPlotDialog):
+    def __init__(self, parent, fitting_tool, series_list, results):
+        """
+        Dialog showing a table summarising the results of a batch fit, with
+        one row per data series and one column per fit parameter. results
+        should be the list returned by fitting.batch_fit().
+        """
+        dialog.AvoPlotDialog.__init__(self, parent, "Batch fit results")
+        
+        vsizer = wx.BoxSizer(wx.VERTICAL)
+        
+        n_failed = len([r for r in results if isinstance(r, Exception)])
+        summary = "%s fit to %d series (%d failed)"%(fitting_tool.name,
+                                                    len(results), n_failed)
+        vsizer.Add(wx.StaticText(self, wx.ID_ANY, summary), 0, wx.ALL, border=5)
+        
+        #the parameter names are the same for all the fits - take them from
+        #the first one that succeeded
+        param_names = ["Result"]
+        for r in results:
+            if not isinstance(r, Exception):
+                param_names = [param[0] for param in r[1][1:]]
+                break
+        
+        self.table = wx.ListCtrl(self, wx.ID_ANY, size=(600, 300),
+                                 style=wx.LC_REPORT|wx.BORDER_SUNKEN)
+        
+        for col, heading in enumerate(["Series"] + param_names):
+            self.table.InsertColumn(col, heading)
+        
+        for row, (s, r) in enumerate(zip(series_list, results)):
+            self.table.InsertStringItem(row, s.get_name())
+            if isinstance(r, Exception):
+                self.table.SetStringItem(row, 1, "Failed: %s"%r)
+                continue
+            for col, param in enumerate(r[1][1:]):
+                self.table.SetStringItem(row, col + 1, "%0.3e"%param[1])
+        
+        for col in range(len(param_names) + 1):
+            self.table.SetColumnWidth(col, wx.LIST_AUTOSIZE_USEHEADER)
+        
+        vsizer.Add(self.table, 1, wx.EXPAND|wx.ALL, border=5)
+        
+        button_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        ok_button = wx.Button(self, wx.ID_OK, "Ok")
+        button_sizer.Add(ok_button, 0, wx.ALIGN_TOP | wx.ALIGN_RIGHT)
+        vsizer.Add(button_sizer, 0, wx.ALIGN_BOTTOM | wx.ALIGN_RIGHT | wx.ALL, border=10)
+        
+        self.SetSizer(vsizer)
+        vsizer.Fit(self)
+        self.SetAutoLayout(True)
+        self.CentreOnParent()
+
+
+
+class BatchFitRunner:
+    def __init__(self, parent, fitting_tool, series_list):
+        """
+        Runs a batch fit of the series in series_list in the background (using
+        a fitting.BatchFitJob), showing a progress dialog which allows the
+        batch to be cancelled. Once the fits are complete, the results are
+        plotted as FitDataSeries and a summary of them is displayed.
+        """
+        self.parent = parent
+        self.fitting_tool = fitting_tool
+        self.series_list = series_list
+        self.progress_dialog = None
+        self.job = None
+        
+        #the whole of each series is fitted - record the fit cache keys now in
+        #case the data changes while the fits are running
+        self.cache_keys = [fitting.get_fit_cache_key(s.get_data_version(), 
+                                                     data_selection.DataSelection.all(s.get_length()).get_ranges(), 
+                                                     fitting_tool)
+                           for s in series_list]
+        
+        #only fit the series which don't already have a cached result
+        self.results = [s.get_fit_cache().get(key) 
+                        for s, key in zip(series_list, self.cache_keys)]
+        self.misses = [i for i, r in enumerate(self.results) if r is None]
+        
+        if not self.misses:
+            wx.CallAfter(self.on_finished, [])
+            return
+        
+        datasets = [series_list[i].get_numeric_data() for i in self.misses]
+        
+        self.progress_dialog = wx.ProgressDialog("Batch fit - " +
+                                                 avoplot.PROG_SHORT_NAME,
+                                                 "Fitting %d series..."%len(datasets),
+                                                 maximum=len(datasets),
+                                                 parent=parent,
+                                                 style=wx.PD_CAN_ABORT|wx.PD_APP_MODAL|wx.PD_ELAPSED_TIME)
+        
+        self.job = fitting.BatchFitJob(fitting_tool, datasets,
+                                       lambda j, r: wx.CallAfter(self.on_finished, r),
+                                       lambda j, e: wx.CallAfter(self.on_failed, e))
+        self.job.start()
+        self.__poll_timer = wx.CallLater(100, self.__update_progress)
+    
+    
+    def __update_progress(self):
+        """
+        Updates the progress dialog, and cancels the job if the user has
+        pressed the abort button.
+        """
+        if self.progress_dialog is None:
+            return
+        
+        n_done, n_total = self.job.get_progress()
+        cont = self.progress_dialog.Update(n_done, "Fitted %d of %d series..."
+                                           %(n_done, n_total))
+        if isinstance(cont, tuple):
+            cont = cont[0]
+        
+        if not cont:
+            self.job.cancel()
+        
+        self.__poll_timer.Restart(100)
+    
+    
+    def __close_progress_dialog(self):
+        if self.progress_dialog is None:
+            return
+        self.__poll_timer.Stop()
+        self.progress_dialog.Destroy()
+        self.progress_dialog = None
+    
+    
+    def on_finished(self, results):
+        """
+        Called (in the main thread) when the batch fit completes. results are
+        the results of the fits which were not already cached. Plots the 
+        successful fits (unless they are already plotted) and shows the 
+        results summary.
+        """
+        self.__close_progress_dialog()
+        
+        for i, r in zip(self.misses, results):
+            self.results[i] = r
+        results = self.results
+        
+        #plot all the fits in each subplot in one go, so that each subplot is
+        #only redrawn once
+        by_subplot = {}
+        for s, key, r in zip(self.series_list, self.cache_keys, results):
+            subplot = s.get_subplot()
+            
+            #the series may have been deleted while the fit was running
+            if subplot is None or isinstance(r, Exception):
+                continue
+            
+            if key[0] == s.get_data_version():
+                s.get_fit_cache()[key] = r
+            
+            #don't plot the same fit twice
+            if [c for c in s.get_child_elements() 
+                if isinstance(c, series.FitDataSeries) and c.cache_key == key]:
+                continue
+            
+            by_subplot.setdefault(subplot, []).append((s, key, r))
+        
+        for subplot, fits in by_subplot.items():
+            with subplot.batch():
+                for s, key, (model, fit_params) in fits:
+                    series.FitDataSeries(s, None, None, fit_params, model=model,
+                                         cache_key=key)
+                subplot.update()
+        
+        d = BatchFitResultsDialog(self.parent, self.fitting_tool,
+                                  self.series_list, results)
+        d.ShowModal()
+        d.Destroy()
+    
+    
+    def on_failed(self, exception):
+        """
+        Called (in the main thread) if the batch fit fails or is cancelled.
+        """
+        self.__close_progress_dialog()
+        
+        if not isinstance(exception, fitting.FittingCancelled):
+            wx.MessageBox("Batch fit failed: %s"%exception,
+                          avoplot.PROG_SHORT_NAME, wx.ICON_ERROR)
+
+
+
+def run_batch_fit(subplot):
+    """
+    Asks the user which fitting tool and data series to use, and then runs the
+    batch fit. This is the handler for the "Batch fit" entry in the subplot
+    right-click menu.
+    """
+    parent = subplot.get_figure().parent
+    d = BatchFitDialog(parent, subplot)
+    
+    if d.ShowModal() == wx.ID_OK:
+        BatchFitRunner(parent, d.get_fitting_tool(), d.get_selected_series())
+    
+    d.Destroy()
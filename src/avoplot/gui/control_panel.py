@@ -17,6 +17,7 @@
 
 import wx
 from wx.lib.agw import aui
+import collections
 
 from avoplot import core
 """
@@ -25,11 +26,56 @@ It is created as a dockable frame managed by the AuiManager of the main AvoPlot
 window.
 """
 
+#maximum number of elements for which the layout of the control panels and 
+#the selected page are remembered
+MAX_STORED_LAYOUTS = 64
+
+
+class ControlPanelPage(wx.Panel):
+    """
+    Page of the control panel notebook which holds a single control panel. 
+    Setting up a control panel can be slow, so it is only done the first time
+    that its page is shown (see build()).
+    """
+    def __init__(self, parent, control_panel):
+        super(ControlPanelPage, self).__init__(parent, wx.ID_ANY)
+        self.control_panel = control_panel
+        self.__built = False
+        self.SetSizer(wx.BoxSizer(wx.VERTICAL))
+    
+    
+    def is_built(self):
+        """
+        Returns True if the control panel has been set up and added to the 
+        page, False otherwise.
+        """
+        return self.__built
+    
+    
+    def build(self):
+        """
+        Sets up the control panel (if it has not been already) and adds it to
+        the page.
+        """
+        if self.__built:
+            return
+        
+        if not self.control_panel.is_initialised():
+            self.control_panel.setup(self)
+        
+        self.GetSizer().Add(self.control_panel, 1, wx.EXPAND)
+        self.control_panel.Show(True)
+        self.Layout()
+        self.__built = True
+
+
+
 class ControlPanel(aui.AuiNotebook):
     """
     Notebook control which holds all the controls for the currently selected
     element. Each set of controls (as returned by element.get_control_panels())
-    is added as a new tab in the notebook.
+    is added as a new tab in the notebook. The controls are only set up when
+    their tab is first shown.
     """
     def __init__(self,parent):
         
@@ -43,15 +89,25 @@ class ControlPanel(aui.AuiNotebook):
                                            agwStyle=style)
         
         self._current_element = None
-        self.__layouts = {} #stores the layout of the control panels (keys are IDs)
-        self.__selections = {} #stores the last page selected (keys are IDS)
         
-        core.EVT_AVOPLOT_ELEM_SELECT(self, self.on_element_select)
-        core.EVT_AVOPLOT_ELEM_DELETE(self, self.on_element_delete)
-        core.EVT_AVOPLOT_ELEM_ADD(self, self.on_element_add)
+        #the layout of the control panels and the last page selected for the
+        #most recently used elements (keys are IDs). Layouts are only stored
+        #for elements whose tabs have been rearranged by the user
+        self.__layouts = collections.OrderedDict()
+        self.__selections = collections.OrderedDict()
+        self.__layout_changed = False
+        
+        #notebook pages for the control panels (keys are the ids of the 
+        #control panel objects), and the control panels which have not yet 
+        #been displayed since the current element was selected
+        self.__pages = {}
+        self.__pending_display = set()
+        
+        core.EVT_AVOPLOT_TREE_CHANGED(self, self.on_tree_changed)
     
         aui.EVT_AUINOTEBOOK_PAGE_CHANGING(self, self.GetId(), self.on_page_changing)
         aui.EVT_AUINOTEBOOK_PAGE_CHANGED(self, self.GetId(), self.on_page_changed)
+        aui.EVT_AUINOTEBOOK_DRAG_DONE(self, self.GetId(), self.on_drag_done)
         
         
     def on_page_changing(self, evnt):
@@ -60,22 +116,86 @@ class ControlPanel(aui.AuiNotebook):
         method on the control panel that is being de-selected.
         """
         page_idx = self.GetSelection()
-        page  = self.GetPage(page_idx)
-        page.on_control_panel_inactive()
+        if page_idx >= 0:
+            page  = self.GetPage(page_idx)
+            if page.is_built():
+                page.control_panel.on_control_panel_inactive()
         evnt.Skip()
     
     
     def on_page_changed(self, evnt):
         """
         Event handler for page changed events. Calls the on_control_panel_active()
-        method on the control panel that has been newly selected.
+        method on the control panel that has been newly selected (setting it
+        up first if necessary).
         """
         page_idx = self.GetSelection()
-        page  = self.GetPage(page_idx)
-        page.on_control_panel_active()
+        if page_idx >= 0:
+            page = self.GetPage(page_idx)
+            self.__display_page(page)
+            page.control_panel.on_control_panel_active()
         evnt.Skip()
     
     
+    def on_drag_done(self, evnt):
+        """
+        Event handler for the end of tab drags. Records that the layout of the
+        control panels has been changed, so that it gets stored.
+        """
+        self.__layout_changed = True
+        evnt.Skip()
+    
+    
+    def __display_page(self, page):
+        """
+        Sets up the control panel of the page if necessary, and calls its 
+        on_display() method if it has not been displayed since the current
+        element was selected.
+        """
+        page.build()
+        
+        panel_id = id(page.control_panel)
+        if panel_id in self.__pending_display:
+            self.__pending_display.discard(panel_id)
+            page.control_panel.on_display()
+    
+    
+    def __get_page(self, control_panel):
+        """
+        Returns the notebook page for the control panel, creating it if 
+        necessary.
+        """
+        try:
+            return self.__pages[id(control_panel)]
+        except KeyError:
+            page = ControlPanelPage(self, control_panel)
+            self.__pages[id(control_panel)] = page
+            return page
+    
+    
+    def __store(self, cache, el_id, value):
+        """
+        Stores value in cache (one of the layout or selection caches) as the
+        most recently used entry, discarding the least recently used entries
+        if there are too many.
+        """
+        cache.pop(el_id, None)
+        cache[el_id] = value
+        while len(cache) > MAX_STORED_LAYOUTS:
+            cache.popitem(last=False)
+    
+    
+    def __recall(self, cache, el_id):
+        """
+        Returns the value stored in cache for el_id (marking it as the most 
+        recently used entry), or None if there isn't one.
+        """
+        value = cache.pop(el_id, None)
+        if value is not None:
+            cache[el_id] = value
+        return value
+    
+    
     def reset_control_panels(self):
         """
         Resets the control panels shown in the notebook to those for the 
@@ -87,8 +207,10 @@ class ControlPanel(aui.AuiNotebook):
        
     def set_control_panels(self, element, force=False):
         """
-        Sets the control panels shown in the notebook. 'control_panels' should
-        be a list of AvoPlotControlPanelBase objects.
+        Sets the control panels shown in the notebook to those of element (as
+        returned by element.get_control_panels()). Only the control panel on
+        the selected page is set up and displayed straight away - the others
+        are dealt with when their pages are selected.
         """
         currently_visible = self.IsShown()
 
@@ -98,16 +220,18 @@ class ControlPanel(aui.AuiNotebook):
         self.Show(False)
 
         if self._current_element is not None:
+            el_id = self._current_element.get_avoplot_id()
             
-            #store the control panel layout for this element
-            layout = self.SavePerspective()
-            self.__layouts[self._current_element.get_avoplot_id()] = layout
+            #store the control panel layout for this element (if the user has
+            #changed it - otherwise the default layout is fine)
+            if self.__layout_changed:
+                self.__store(self.__layouts, el_id, self.SavePerspective())
             
             #store which page is currently selected, so that we can restore
             #the selection when this element is selected in the future (note
             #that the current selection is not part of the layout information)
             sel = self.GetSelection()
-            self.__selections[self._current_element.get_avoplot_id()] = sel
+            self.__store(self.__selections, el_id, sel)
 
             while self.GetPageCount():
                 # get rid of the old pages 
@@ -115,32 +239,34 @@ class ControlPanel(aui.AuiNotebook):
                 
                 #need to call this explicitly, since we remove the page rather
                 #then changing it
-                p.on_control_panel_inactive()
+                if p.is_built():
+                    p.control_panel.on_control_panel_inactive()
                 
                 self.RemovePage(0)
                 p.Show(False)
         
+        #all of the new control panels need displaying before they are shown
+        self.__pending_display = set([id(p) for p in control_panels])
+        
         #reverse the order so that plugin-defined panels appear first
         for p in reversed(control_panels):
             #AuiNotebook requires that any pages have the notebook as a parent -
-            #so reparent all the panels to make it so!
-            if not p.is_initialised():
-                p.setup(self)
-            
-            self.AddPage(p, p.get_name())
+            #so the control panels are put inside a page which does
+            self.AddPage(self.__get_page(p), p.get_name())
 
         #only load the saved perspective if there are actually some control panels
         #to arrange. Otherwise when the session element gets selected 
         #(e.g. when the final figure gets closed) then this will try to load an
         #invalid perspective
-        if control_panels and self.__layouts.has_key(element.get_avoplot_id()):
-            self.LoadPerspective(self.__layouts[element.get_avoplot_id()])
+        layout = self.__recall(self.__layouts, element.get_avoplot_id())
+        if control_panels and layout is not None:
+            self.LoadPerspective(layout)
+        self.__layout_changed = False
         
         #Restore the user's previous page selection.
-        if (len(control_panels) > 1 and 
-            self.__selections.has_key(element.get_avoplot_id())):
-            
-            self.SetSelection(self.__selections[element.get_avoplot_id()])
+        sel = self.__recall(self.__selections, element.get_avoplot_id())
+        if len(control_panels) > 1 and sel is not None:
+            self.SetSelection(sel)
         
         self.Thaw()
         
@@ -148,69 +274,69 @@ class ControlPanel(aui.AuiNotebook):
         #really needed in windows
         self.SendSizeEvent()
         
-        #perform any operations needed prior to display
-        for p in reversed(control_panels):
-            p.on_display() 
+        #perform any operations needed prior to display of the visible page
+        if self.GetPageCount():
+            self.__display_page(self.GetPage(max(self.GetSelection(), 0)))
         
         if currently_visible or force:    
             self.Show(True)
     
     
-    def on_element_delete(self, evnt):
+    def on_tree_changed(self, evnt):
+        """
+        Event handler for AvoPlotTreeChanged events. Removes the control panels
+        of any deleted elements and shows those of the newly selected element
+        (if there is one). The event is then passed through to all the control 
+        panels currently in the control panel which have been set up.
         """
-        Event handler for element delete events. Removes any control panels 
-        associated with the deleted element from the notebook.
+        diff = evnt.diff
+        
+        for el in diff.deleted:
+            self.element_deleted(el)
         
-        If the element is not the currently selected element, then the event
-        gets passed through to all pages currently in the control panel
+        if diff.selected is not None:
+            self.element_selected(diff.selected)
+        
+        #pass the event through to all the pages in the control panel
+        for i in range(self.GetPageCount()):
+            p = self.GetPage(i)
+            if p.is_built():
+                wx.PostEvent(p.control_panel, evnt)
+    
+    
+    def element_deleted(self, el):
+        """
+        Removes any control panels associated with the deleted element from the
+        notebook and destroys their pages.
         """
-        el = evnt.element
-
         if el == self._current_element:
             while self.GetPageCount():
-                # get rid of the old pages and reparent them back to whatever
-                #window was their parent before they were added to the notebook
+                # get rid of the old pages 
                 p = self.GetPage(0)
                 self.RemovePage(0)
                 p.Show(False)
             
             self._current_element = None
-        else:
-            for i in range(self.GetPageCount()):
-                p = self.GetPage(i)
-                wx.PostEvent(p, evnt)
+            self.__pending_display = set()
+        
+        #destroy the pages of the deleted element's control panels (this also
+        #destroys any of the control panels which have been set up)
+        for p in el.get_control_panels():
+            page = self.__pages.pop(id(p), None)
+            if page is not None:
+                page.Destroy()
         
         #remove any stored layouts relating to this element.
-        try:
-            self.__layouts.pop(el.get_avoplot_id())
-        except KeyError:
-            pass
-    
-    
-    def on_element_add(self, evnt):
-        """
-        Event handler for element add events. Passes the event through to
-        all pages currently in the control panel
-        """
-        for i in range(self.GetPageCount()):
-            p = self.GetPage(i)
-            wx.PostEvent(p, evnt)
+        self.__layouts.pop(el.get_avoplot_id(), None)
+        self.__selections.pop(el.get_avoplot_id(), None)
     
     
-    def on_element_select(self, evnt):
+    def element_selected(self, el):
         """
-        Event handler for element select events. Adds any relevant control 
-        panels for the newly selected element to the notebook.
+        Adds any relevant control panels for the newly selected element to the
+        notebook.
         """
-
-        el = evnt.element
-
         if el != self._current_element: 
             self.set_control_panels(el)
             self._current_element = el
         
-        #pass the event through to all the pages in the control panel
-        for i in range(self.GetPageCount()):
-            p = self.GetPage(i)
-            wx.PostEvent(p, evnt)
-        
@@ -66,18 +66,182 @@ all_available_markers = [
                      ]
 
 
+class AnimatedLines:
+    def __init__(self, mpl_lines, update_command, commit_delay=500):
+        """
+        Class to animate matplotlib.lines.Line2D objects to allow fast editing 
+        of their style properties. Rather than redrawing the whole figure each 
+        time a property is changed, the background of the axes (without the 
+        lines) is cached and only the lines themselves are redrawn. Once no 
+        changes have been made for commit_delay milliseconds, the animation is
+        stopped and update_command is called to do a full redraw. The general
+        usage of the class is as follows:
+        
+        #create the animator passing it the lines and the full redraw command
+        animator = AnimatedLines([line1, line2], series.update)
+        
+        #make changes to the lines here e.g.:
+        line1.set_linewidth(3)
+        
+        #each time you want the changes to be drawn - call style_changed()
+        animator.style_changed()
+        
+        If the lines cannot be animated (for example, gridlines are not 
+        children of the axes and so cannot be excluded from the cached 
+        background) then style_changed() just calls update_command.
+        """
+        self.__lines = list(mpl_lines)
+        self.__update_command = update_command
+        self.__commit_delay = commit_delay
+        
+        self.__is_animated = False
+        self.__commit_timer = None
+        self.__redraw_callback_id = None
+        self.__bkgd_cache = None
+        self.__mpl_axes = None
+    
+    
+    def can_animate(self):
+        """
+        Returns True if the lines can be redrawn using blitting, False 
+        otherwise. All the lines must be children of the same axes, and must 
+        not already be animated by something else.
+        """
+        if self.__is_animated:
+            return True
+        
+        if not self.__lines:
+            return False
+        
+        ax = self.__lines[0].axes
+        if ax is None or ax.figure.canvas is None:
+            return False
+        
+        for l in self.__lines:
+            if l.axes is not ax or l.get_animated() or l not in ax.lines:
+                return False
+        return True
+    
+    
+    def style_changed(self):
+        """
+        Should be called each time a property of the lines is changed. Redraws
+        the lines using blitting and (re)starts the timer for the full redraw.
+        """
+        if not self.can_animate():
+            self.__update_command()
+            return
+        
+        if not self.__is_animated:
+            self.start_line_animation()
+        
+        self.redraw_lines()
+        
+        if self.__commit_timer is None:
+            self.__commit_timer = wx.CallLater(self.__commit_delay, 
+                                               self.__commit)
+        else:
+            self.__commit_timer.Restart(self.__commit_delay)
+    
+    
+    def start_line_animation(self):
+        """
+        Starts the animation of the lines. This sets the lines to be animated 
+        (so that they are not included in full redraws of the figure), redraws
+        the figure without them and caches the resulting background.
+        """
+        if self.__is_animated:
+            return
+        
+        self.__is_animated = True
+        self.__mpl_axes = self.__lines[0].axes
+        canvas = self.__mpl_axes.figure.canvas
+        
+        for l in self.__lines:
+            l.set_animated(True)
+        
+        #register a callback for draw events in the mpl canvas - if the canvas
+        #has been redrawn then we need to re-cache the background region
+        self.__redraw_callback_id = canvas.mpl_connect('draw_event', 
+                                                       self.__cache_bkgd)
+        
+        #draw everything except the lines - this will call __cache_bkgd
+        canvas.draw()
+    
+    
+    def stop_line_animation(self):
+        """
+        Stops the animation of the lines, deletes the background cache and 
+        removes the draw event callback. Note that this does not redraw the 
+        figure.
+        """
+        if not self.__is_animated:
+            return
+        
+        self.__mpl_axes.figure.canvas.mpl_disconnect(self.__redraw_callback_id)
+        self.__redraw_callback_id = None
+        
+        for l in self.__lines:
+            l.set_animated(False)
+        
+        #let the cached background get garbage collected
+        self.__bkgd_cache = None
+        self.__is_animated = False
+    
+    
+    def __cache_bkgd(self, *args):
+        """
+        Event handler for canvas draw events. Caches the background of the axes
+        and then draws the lines back over the top of it.
+        """
+        canvas = self.__mpl_axes.figure.canvas
+        self.__bkgd_cache = canvas.copy_from_bbox(self.__mpl_axes.bbox)
+        self.redraw_lines()
+    
+    
+    def redraw_lines(self):
+        """
+        Restores the axes background from the cache and then draws the 
+        animated lines over the top.
+        """
+        if self.__bkgd_cache is None:
+            return
+        
+        canvas = self.__mpl_axes.figure.canvas
+        canvas.restore_region(self.__bkgd_cache)
+        
+        for l in self.__lines:
+            self.__mpl_axes.draw_artist(l)
+        
+        canvas.blit(self.__mpl_axes.bbox)
+    
+    
+    def __commit(self):
+        """
+        Called by the commit timer once the lines have stopped changing. Stops
+        the animation and does a full redraw.
+        """
+        self.__commit_timer = None
+        self.stop_line_animation()
+        self.__update_command()
+        
+        
+
 class LineStyleEditorPanel(wx.Panel):
     
     def __init__(self, parent, mpl_lines, update_command, 
                  linestyles=all_available_lines):
         """
         Panel with controls to allow the user to change the style of a series
-        line.
+        line. Changes are drawn using blitting (see AnimatedLines) and 
+        update_command is called to do a full redraw once the user has 
+        finished making changes.
         """    
         wx.Panel.__init__(self, parent, wx.ID_ANY)
         self.mpl_lines = mpl_lines
         self.parent = parent
         self.update_command = update_command
+        self.line_animator = AnimatedLines(mpl_lines, update_command)
         self.__available_lines = linestyles
         
         self.__line_symbol_to_idx_map = {}
@@ -164,7 +328,7 @@ class LineStyleEditorPanel(wx.Panel):
         """
         for l in self.mpl_lines:
             l.set_alpha(self.line_alpha_ctrl.GetValue())
-        self.update_command()
+        self.line_animator.style_changed()
     
         
     def on_line_colour_change(self, evnt):
@@ -173,7 +337,7 @@ class LineStyleEditorPanel(wx.Panel):
         """
         for l in self.mpl_lines:
             l.set_color(evnt.GetColour().GetAsString(wx.C2S_HTML_SYNTAX))
-        self.update_command()
+        self.line_animator.style_changed()
         
     
     def on_linestyle(self, evnt):
@@ -186,7 +350,7 @@ class LineStyleEditorPanel(wx.Panel):
         for l in self.mpl_lines:
             l.set_linestyle(new_line.mpl_symbol)
         
-        self.update_command()
+        self.line_animator.style_changed()
         
         
     def on_linewidth(self, evnt):
@@ -196,7 +360,7 @@ class LineStyleEditorPanel(wx.Panel):
         for l in self.mpl_lines:
             l.set_linewidth(self.line_weight_ctrl.GetValue())
         
-        self.update_command()
+        self.line_animator.style_changed()
                 
     
     def update_line_controls(self, current_line):
@@ -223,7 +387,9 @@ class MarkerStyleEditorPanel(wx.Panel):
     def __init__(self, parent, mpl_lines, update_command, markers=all_available_markers):
         """
         Panel with controls to allow the user to change the markers used to plot
-        a data series.
+        a data series. Changes are drawn using blitting (see AnimatedLines) 
+        and update_command is called to do a full redraw once the user has 
+        finished making changes.
         """
         
         wx.Panel.__init__(self, parent, wx.ID_ANY)
@@ -232,6 +398,7 @@ class MarkerStyleEditorPanel(wx.Panel):
         self.parent = parent
         self.mpl_lines = mpl_lines
         self.update_command = update_command
+        self.line_animator = AnimatedLines(mpl_lines, update_command)
         
         #build some mappings between marker properties and their indices in the list
         #of available markers
@@ -324,7 +491,7 @@ class MarkerStyleEditorPanel(wx.Panel):
         """
         for l in self.mpl_lines:
             l.set_markerfacecolor(evnt.GetColour().GetAsString(wx.C2S_HTML_SYNTAX))
-        self.update_command()
+        self.line_animator.style_changed()
     
     
     def on_marker_edgecolour(self, evnt):
@@ -333,7 +500,7 @@ class MarkerStyleEditorPanel(wx.Panel):
         """
         for l in self.mpl_lines:
             l.set_markeredgecolor(evnt.GetColour().GetAsString(wx.C2S_HTML_SYNTAX))
-        self.update_command()
+        self.line_animator.style_changed()
         
         
     def on_marker_edgewidth(self, evnt):
@@ -342,7 +509,7 @@ class MarkerStyleEditorPanel(wx.Panel):
         """
         for l in self.mpl_lines:
             l.set_markeredgewidth(self.marker_edgewidth_ctrl.GetValue())
-        self.update_command()
+        self.line_animator.style_changed()
             
             
     def on_marker(self, evnt):
@@ -354,7 +521,7 @@ class MarkerStyleEditorPanel(wx.Panel):
         self.update_marker_controls(new_marker)
         for l in self.mpl_lines:
             l.set_marker(new_marker.mpl_symbol)
-        self.update_command()
+        self.line_animator.style_changed()
     
     
     def on_markersize(self, evnt):
@@ -363,7 +530,7 @@ class MarkerStyleEditorPanel(wx.Panel):
         """
         for l in self.mpl_lines:
             l.set_markersize(self.marker_size_ctrl.GetValue())
-        self.update_command()
+        self.line_animator.style_changed()
     
     
     def update_marker_controls(self, current_marker):
@@ -103,10 +103,7 @@ class MainFrame(wx.Frame):
         self._mgr.Update()
 
         #register the event handlers
-        self.Bind(core.EVT_AVOPLOT_ELEM_SELECT, self.on_avoplot_event)
-        self.Bind(core.EVT_AVOPLOT_ELEM_ADD, self.on_avoplot_event)
-        self.Bind(core.EVT_AVOPLOT_ELEM_RENAME, self.on_avoplot_event)
-        self.Bind(core.EVT_AVOPLOT_ELEM_DELETE, self.on_avoplot_event)
+        self.Bind(core.EVT_AVOPLOT_TREE_CHANGED, self.on_avoplot_event)
         
         menu.EVT_AVOPLOT_CTRL_PANEL_STATE(self, self.on_show_ctrl_panel)
         menu.EVT_AVOPLOT_NAV_PANEL_STATE(self, self.on_show_nav_panel)  
@@ -176,20 +173,23 @@ class MainFrame(wx.Frame):
     
     def on_avoplot_event(self, evnt):
         """
-        All AvoPlot events (see the 'core' module) are posted to the MainFrame
-        where they are handled by this method. All it does is to repost the 
-        event to all the GUI components so that they can react as needed.
+        All AvoPlot element changes (see the 'core' module) are delivered to 
+        the MainFrame as a single AvoPlotTreeChangedEvent per idle cycle, 
+        where they are handled by this method. All it does is to pass the 
+        event to all the GUI components so that they can apply the changes in
+        one go. The event is processed immediately (rather than posted) since 
+        any deleted elements will be destroyed once it has been handled.
         """
         #pass the event on to all the GUI elements
-        wx.PostEvent(self.nav_panel, evnt)
-        wx.PostEvent(self.ctrl_panel, evnt)
-        wx.PostEvent(self.menu, evnt)
-        wx.PostEvent(self.toolbar, evnt)
+        self.nav_panel.GetEventHandler().ProcessEvent(evnt)
+        self.ctrl_panel.GetEventHandler().ProcessEvent(evnt)
+        self.menu.GetEventHandler().ProcessEvent(evnt)
+        self.toolbar.GetEventHandler().ProcessEvent(evnt)
         
         #this has to come last since fig.Destroy() will get called inside the
         # plots panel event handler and
         #so subsequent access to fig will raise an exception
-        wx.PostEvent(self.plots_panel, evnt) 
+        self.plots_panel.GetEventHandler().ProcessEvent(evnt)
    
 
         
@@ -201,9 +201,9 @@ class MainFrame(wx.Frame):
         parent that isn't None, will have their delete() method called before 
         the program exits.
         """
-        #unregister handlers for selection changed events to prevent on_select
-        #handlers from attempting to access destroyed frames
-        self.Unbind(core.EVT_AVOPLOT_ELEM_SELECT)
+        #unregister handlers for element events to prevent the GUI components 
+        #from attempting to access destroyed frames
+        self.Unbind(core.EVT_AVOPLOT_TREE_CHANGED)
         
         self.session.delete()
         
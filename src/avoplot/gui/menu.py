@@ -20,6 +20,8 @@ import avoplot
 import avoplot.plugins
 from avoplot import core
 from avoplot import figure
+from avoplot.subplots import AvoPlotXYSubplot
+from avoplot.gui import batch_fit
 
 #define some new events to be used when panes are hidden/restored
 AvoPlotCtrlPanelChangeState, EVT_AVOPLOT_CTRL_PANEL_STATE = wx.lib.newevent.NewEvent()
@@ -79,6 +81,13 @@ def get_subplot_right_click_menu(subplot):
         callback = CallbackWrapper(p.plot_into_subplot, subplot)
         wx.EVT_MENU(subplot.get_figure().parent,entry.GetId(), callback)
     
+    if isinstance(subplot, AvoPlotXYSubplot):
+        menu.AppendSeparator()
+        entry = menu.Append(-1, "Batch fit...", "Fit the same model to many "
+                            "data series at once")
+        callback = CallbackWrapper(batch_fit.run_batch_fit, subplot)
+        wx.EVT_MENU(subplot.get_figure().parent,entry.GetId(), callback)
+    
     return menu
         
 
@@ -95,33 +104,40 @@ class MainMenu(wx.MenuBar):
         self.create_view_menu()
         self.create_help_menu()
         
-        core.EVT_AVOPLOT_ELEM_ADD(self, self.on_element_add)
-        core.EVT_AVOPLOT_ELEM_DELETE(self, self.on_element_delete)
-        core.EVT_AVOPLOT_ELEM_SELECT(self, self.on_element_select)
+        core.EVT_AVOPLOT_TREE_CHANGED(self, self.on_tree_changed)
     
     
+    def on_tree_changed(self, evnt):
+        """
+        Event handler for AvoPlotTreeChanged events. Updates the menu entries 
+        to reflect the changes to the element tree.
+        """
+        diff = evnt.diff
+        
+        for el in diff.deleted:
+            self.element_deleted(el)
+        
+        for el in diff.added:
+            self.element_added(el)
+        
+        if diff.selected is not None:
+            self.element_selected(diff.selected)
+    
     
-    def on_element_select(self, evnt):
+    def element_selected(self, el):
         """
-        Event handler for AvoPlotElementSelect events. Just keeps track of which
-        element is currently selected.
+        Keeps track of which element is currently selected.
         """
-        el = evnt.element
-
         if isinstance(el, figure.AvoPlotFigure):
             self.__current_figure = el 
     
     
-    def on_element_add(self, evnt):
+    def element_added(self, el):
         """
-        Event handler for AvoPlotElementAdd events. Enables menu entries when 
-        there are a sufficient number of figures open for it to make sense to do
-        so. For example - you can't split the display if you only have one
-        figure open.
+        Enables menu entries when there are a sufficient number of figures open
+        for it to make sense to do so. For example - you can't split the display
+        if you only have one figure open.
         """
-        
-        el = evnt.element
-        
         if isinstance(el, figure.AvoPlotFigure):
             self.__current_figure = el
             #self.save_data_entry.Enable(enable=True)
@@ -134,13 +150,12 @@ class MainMenu(wx.MenuBar):
             self.unsplit.Enable(enable=True)
     
     
-    def on_element_delete(self, evnt):
+    def element_deleted(self, el):
         """
-        Event handler for AvoPlotElementDelete events. Disables menu entries when 
-        there are an insufficient number of figures open for them to make sense.
-        For example - you can't save a figure if there are none open.
+        Disables menu entries when there are an insufficient number of figures
+        open for them to make sense. For example - you can't save a figure if 
+        there are none open.
         """
-        el = evnt.element
         if isinstance(el, figure.AvoPlotFigure):
             if el == self.__current_figure:
                 self.__current_figure = None
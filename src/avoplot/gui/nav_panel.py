@@ -17,9 +17,34 @@
 import wx
 from wx.lib.agw import customtreectrl
 import warnings
+import collections
 from avoplot import core
 from avoplot import series
 
+
+#maximum number of tree items shown directly below an element's tree item - 
+#if an element has more children than this, then they are shown in groups
+#of this size instead
+CHUNK_SIZE = 500
+
+#maximum number of tree items which will be created when automatically 
+#expanding the tree to show newly added elements
+AUTO_EXPAND_LIMIT = 500
+
+
+class _NodeGroup(object):
+    """
+    A group of (up to CHUNK_SIZE) child elements, which is shown as a single
+    tree item below the tree item of their parent element. The tree items for
+    the elements are only created when the group's item is expanded.
+    """
+    def __init__(self, parent_id, elements):
+        self.parent_id = parent_id
+        self.elements = list(elements)
+        self.node = None
+        self.populated = False
+
+
 class RightClickMenu(wx.Menu):
     """
     Popup menu displayed when elements in the navigation panel are
@@ -71,22 +96,33 @@ class NavigationPanel(wx.ScrolledWindow):
         self.SetScrollbars(0,0,0,0)
         
         self.v_sizer.Add(self.tree,1,wx.EXPAND)
-        self.__current_selection_id = None
+        self.__current_selection = None
+        
+        #the tree is populated lazily - tree items are only created for the 
+        #children of an element when its item is first expanded. These are the
+        #ids of the elements whose children have tree items, the groups of the
+        #children of elements with too many children to show directly, and the
+        #group that each grouped element belongs to
+        self.__populated = set()
+        self.__groups = {}
+        self.__el_group_mapping = {}
         
         #add the session element as the root node
         root = self.tree.AddRoot(session.get_name(), 
                                  data=wx.TreeItemData(session))
         self.__el_id_mapping = {session.get_avoplot_id():root}
         
+        #the root node is hidden, so its children must always be shown
+        self.__populate(root)
+        
         #bind avoplot events
-        core.EVT_AVOPLOT_ELEM_SELECT(self, self.on_element_select)
-        core.EVT_AVOPLOT_ELEM_DELETE(self, self.on_element_delete)
-        core.EVT_AVOPLOT_ELEM_ADD(self, self.on_element_add)
-        core.EVT_AVOPLOT_ELEM_RENAME(self, self.on_element_rename)
+        core.EVT_AVOPLOT_TREE_CHANGED(self, self.on_tree_changed)
         
         #bind wx events
         wx.EVT_TREE_SEL_CHANGED(self, self.tree.GetId(), self.on_tree_select_el)
         wx.EVT_TREE_ITEM_MENU(self, self.tree.GetId(), self.on_tree_el_menu)
+        wx.EVT_TREE_ITEM_EXPANDING(self, self.tree.GetId(), 
+                                   self.on_tree_expanding)
         
         #do the layout 
         self.SetSizer(self.v_sizer)
@@ -98,9 +134,7 @@ class NavigationPanel(wx.ScrolledWindow):
         """
         Event handler for the delete option in the right click menu.
         """
-        el_id = self.__el_id_mapping[self.__current_selection_id]
-        el = self.tree.GetPyData(el_id).GetData()
-        el.delete()   
+        self.__current_selection.delete()   
     
     
     def on_rclick_menu_rename(self, evnt):
@@ -109,8 +143,7 @@ class NavigationPanel(wx.ScrolledWindow):
         
         Opens a dialog box for the user to enter the new element name.
         """
-        el_id = self.__el_id_mapping[self.__current_selection_id]
-        el = self.tree.GetPyData(el_id).GetData()
+        el = self.__current_selection
         
         current_name = el.get_name()
         
@@ -130,9 +163,7 @@ class NavigationPanel(wx.ScrolledWindow):
         """
         Event handler for the export option in the right click menu.
         """
-        el_id = self.__el_id_mapping[self.__current_selection_id]
-        el = self.tree.GetPyData(el_id).GetData()
-        el.export()
+        self.__current_selection.export()
     
     
     def on_tree_el_menu(self, evnt):
@@ -140,8 +171,11 @@ class NavigationPanel(wx.ScrolledWindow):
         Event handler for right click events on elements in the navigation 
         panel - opens a popup menu for the element clicked.
         """
-        el_id = self.__el_id_mapping[self.__current_selection_id]
-        el = self.tree.GetPyData(el_id).GetData()
+        el = self.__current_selection
+        
+        #groups of elements don't have a menu
+        if el is None:
+            return
         
         if not hasattr(el, 'export'):
             if self._rclick_menu.export_entry in self._rclick_menu.GetMenuItems():
@@ -162,81 +196,334 @@ class NavigationPanel(wx.ScrolledWindow):
         #get the avoplot element and set it selected
         tree_node_id = evnt.GetItem()
         el = self.tree.GetPyData(tree_node_id).GetData()
-        self.__current_selection_id = el.get_avoplot_id()
+        
+        if isinstance(el, _NodeGroup):
+            self.__current_selection = None
+            return
+        
+        self.__current_selection = el
         el.set_selected()
     
+    
+    def on_tree_expanding(self, evnt):
+        """
+        Event handler for tree item expanding events. Creates the tree items 
+        for the children of the item being expanded, if they have not been 
+        created already.
+        """
+        node = evnt.GetItem()
+        self.__populate(node)
         
-    def on_element_select(self, evnt):
+        if not self.tree.GetChildrenCount(node, False):
+            #the element's children have all been deleted since the item was
+            #created
+            self.tree.SetItemHasChildren(node, False)
+    
+    
+    def __add_element_node(self, parent_node, el):
         """
-        Event handler for AvoPlotElementSelect events. Selects the tree item 
-        corresponding to the element which has been selected.
+        Appends a tree item for the element to parent_node. Tree items for
+        the element's children are not created until the item is expanded.
         """
-        el = evnt.element
+        node = self.tree.AppendItem(parent_node, el.get_name(), 
+                                    data=wx.TreeItemData(el))
+        self.__el_id_mapping[el.get_avoplot_id()] = node
         
-        #if the element is our current selection, then do nothing
-        if el.get_avoplot_id() == self.__current_selection_id:
+        if el.get_child_elements():
+            self.tree.SetItemHasChildren(node, True)
+        
+        return node
+    
+    
+    def __add_group_node(self, parent_node, group):
+        """
+        Appends a tree item for the group of elements to parent_node. Tree 
+        items for the elements are not created until the item is expanded.
+        """
+        group.node = self.tree.AppendItem(parent_node, "", 
+                                          data=wx.TreeItemData(group))
+        self.tree.SetItemHasChildren(group.node, True)
+        
+        for el in group.elements:
+            self.__el_group_mapping[el.get_avoplot_id()] = group
+        
+        self.__groups.setdefault(group.parent_id, []).append(group)
+    
+    
+    def __relabel_groups(self, parent_id):
+        """
+        Sets the labels of the tree items of the groups of children of the 
+        element with id parent_id to show the range of children in each group.
+        """
+        start = 1
+        for group in self.__groups[parent_id]:
+            stop = start + len(group.elements) - 1
+            self.tree.SetItemText(group.node, "[%d - %d]"%(start, stop))
+            start = stop + 1
+    
+    
+    def __populate(self, node):
+        """
+        Creates the tree items for the children of node (which may be the item
+        of an element, or of a group of elements), if they have not been 
+        created already. Elements with more than CHUNK_SIZE children have 
+        their children split into groups.
+        """
+        data = self.tree.GetPyData(node).GetData()
+        
+        if isinstance(data, _NodeGroup):
+            if not data.populated:
+                data.populated = True
+                for el in data.elements:
+                    self.__add_element_node(node, el)
             return
         
-        #if the element exists in the tree then select it
-        if self.__el_id_mapping.has_key(el.get_avoplot_id()):
-            self.tree.SelectItem(self.__el_id_mapping[el.get_avoplot_id()])
-            self.__current_selection_id = el.get_avoplot_id()
-            return 
+        el_id = data.get_avoplot_id()
+        if el_id in self.__populated:
+            return
+        self.__populated.add(el_id)
         
-        else:
+        children = data.get_child_elements()
+        if len(children) <= CHUNK_SIZE:
+            for c in children:
+                self.__add_element_node(node, c)
+            return
+        
+        children = list(children)
+        for i in range(0, len(children), CHUNK_SIZE):
+            self.__add_group_node(node, _NodeGroup(el_id, 
+                                                   children[i:i + CHUNK_SIZE]))
+        self.__relabel_groups(el_id)
+    
+    
+    def __forget_children(self, node):
+        """
+        Removes the tree items below node (recursively) from the mappings of 
+        elements to tree items. This does not delete the items themselves.
+        """
+        child, cookie = self.tree.GetFirstChild(node)
+        while child is not None:
+            data = self.tree.GetPyData(child).GetData()
+            
+            if isinstance(data, _NodeGroup):
+                for el in data.elements:
+                    self.__el_group_mapping.pop(el.get_avoplot_id(), None)
+            else:
+                el_id = data.get_avoplot_id()
+                self.__el_id_mapping.pop(el_id, None)
+                self.__populated.discard(el_id)
+                self.__groups.pop(el_id, None)
+            
+            self.__forget_children(child)
+            child, cookie = self.tree.GetNextChild(node, cookie)
+    
+    
+    def __repopulate(self, node):
+        """
+        Deletes all the tree items below node (the tree item of an element) 
+        and creates them again, so that the children get grouped if there are
+        now too many of them.
+        """
+        el_id = self.tree.GetPyData(node).GetData().get_avoplot_id()
+        
+        self.__forget_children(node)
+        self.tree.DeleteChildren(node)
+        self.__populated.discard(el_id)
+        self.__groups.pop(el_id, None)
+        
+        self.__populate(node)
+    
+    
+    def __get_node(self, el):
+        """
+        Returns the tree item for the element, creating the tree items for it 
+        and its ancestors if they have not been created yet. Returns None if 
+        the element is not part of the tree.
+        """
+        el_id = el.get_avoplot_id()
+        if self.__el_id_mapping.has_key(el_id):
+            return self.__el_id_mapping[el_id]
+        
+        parent = el.get_parent_element()
+        if parent is None:
+            return None
+        
+        parent_node = self.__get_node(parent)
+        if parent_node is None:
+            return None
+        
+        self.__populate(parent_node)
+        
+        group = self.__el_group_mapping.get(el_id)
+        if group is not None:
+            self.__populate(group.node)
+        
+        return self.__el_id_mapping.get(el_id)
+    
+    
+    def __expand_new_nodes(self, nodes):
+        """
+        Expands the tree items in nodes and then their descendants (breadth 
+        first), until AUTO_EXPAND_LIMIT tree items have been created. Groups
+        of elements are never expanded automatically.
+        """
+        root = self.tree.GetRootItem()
+        budget = AUTO_EXPAND_LIMIT
+        queue = collections.deque(nodes)
+        
+        while queue and budget > 0:
+            node = queue.popleft()
+            if isinstance(self.tree.GetPyData(node).GetData(), _NodeGroup):
+                continue
+            
+            self.__populate(node)
+            budget -= self.tree.GetChildrenCount(node, False)
+            
+            #the root node is hidden and so cannot be expanded
+            if node != root:
+                self.tree.Expand(node)
+            
+            child, cookie = self.tree.GetFirstChild(node)
+            while child is not None:
+                queue.append(child)
+                child, cookie = self.tree.GetNextChild(node, cookie)
+    
+        
+    def on_tree_changed(self, evnt):
+        """
+        Event handler for AvoPlotTreeChanged events. Applies all the changes
+        in the event's TreeDiff to the tree, with the tree frozen so that it
+        is only redrawn once.
+        """
+        diff = evnt.diff
+        
+        self.tree.Freeze()
+        try:
+            for el in diff.deleted:
+                self.element_deleted(el)
+            
+            expand_nodes = []
+            for el in diff.added:
+                parent_node = self.element_added(el)
+                if parent_node is not None and parent_node not in expand_nodes:
+                    expand_nodes.append(parent_node)
+            
+            self.__expand_new_nodes(expand_nodes)
+            
+            for el in diff.renamed:
+                self.element_renamed(el)
+            
+            if diff.selected is not None:
+                self.element_selected(diff.selected)
+        finally:
+            self.tree.Thaw()
+    
+    
+    def element_selected(self, el):
+        """
+        Selects the tree item corresponding to the element which has been 
+        selected, creating it (and expanding its ancestors) if necessary.
+        """
+        #if the element is our current selection, then do nothing
+        if el is self.__current_selection:
+            return
+        
+        node = self.__get_node(el)
+        if node is None:
             warnings.warn("element not in tree"+str(el))
+            return
+        
+        self.tree.EnsureVisible(node)
+        self.tree.SelectItem(node)
+        self.__current_selection = el
 
                
-    def on_element_delete(self, evnt):
+    def element_deleted(self, el):
         """
-        Event handler for AvoPlotElementDelete events. Removes the tree item 
-        corresponding to the element which has been deleted.
+        Removes the tree item corresponding to the element which has been 
+        deleted (if it has one), and removes it from its group.
         """
-        el = evnt.element
-        if self.__el_id_mapping.has_key(el.get_avoplot_id()):
-            tree_item = self.__el_id_mapping.pop(el.get_avoplot_id())
+        el_id = el.get_avoplot_id()
+        
+        if el is self.__current_selection:
+            self.__current_selection = None
+        
+        if self.__el_id_mapping.has_key(el_id):
+            tree_item = self.__el_id_mapping.pop(el_id)
+            self.__forget_children(tree_item)
+            self.__populated.discard(el_id)
+            self.__groups.pop(el_id, None)
             self.tree.Delete(tree_item)
+        
+        group = self.__el_group_mapping.pop(el_id, None)
+        if group is not None:
+            group.elements.remove(el)
+            groups = self.__groups[group.parent_id]
+            
+            if not group.elements:
+                groups.remove(group)
+                self.tree.Delete(group.node)
+            
+            if groups:
+                self.__relabel_groups(group.parent_id)
+            else:
+                del self.__groups[group.parent_id]
     
         
-    def on_element_add(self, evnt):
+    def element_added(self, el):
         """
-        Event handler for AvoPlotElementAdd events. Adds a tree item 
-        for the element which has been added and all its children (recursively).
+        Adds a tree item for the element which has been added, if the tree 
+        items for its siblings have already been created. Otherwise the item 
+        will be created when its parent's item is expanded. Returns the tree
+        item of the element's parent, or None if the parent is not in the tree.
         """
-        el = evnt.element
-
-        parent_id = el.get_parent_element().get_avoplot_id()
-        if self.__el_id_mapping.has_key(parent_id):
-            parent_node = self.__el_id_mapping[parent_id]
-            
-            #add the elements children to the tree recursively
-            self._add_all_child_nodes(parent_node, el)
-            
-            self.tree.ExpandAllChildren(parent_node)
+        parent = el.get_parent_element()
+        if parent is None:
+            #the element has been removed from the tree again
+            return None
+        
+        parent_id = parent.get_avoplot_id()
+        if not self.__el_id_mapping.has_key(parent_id):
+            return None
+        
+        parent_node = self.__el_id_mapping[parent_id]
+        el_id = el.get_avoplot_id()
+        
+        if (parent_id not in self.__populated or 
+            self.__el_id_mapping.has_key(el_id) or 
+            self.__el_group_mapping.has_key(el_id)):
+            #either the item will be created when the parent is expanded, or
+            #it has been already
+            self.tree.SetItemHasChildren(parent_node, True)
+            return parent_node
+        
+        if not self.__groups.has_key(parent_id):
+            if self.tree.GetChildrenCount(parent_node, False) < CHUNK_SIZE:
+                self.__add_element_node(parent_node, el)
+            else:
+                #too many children to show them all directly
+                self.__repopulate(parent_node)
+            return parent_node
+        
+        group = self.__groups[parent_id][-1]
+        if len(group.elements) >= CHUNK_SIZE:
+            group = _NodeGroup(parent_id, [])
+            self.__add_group_node(parent_node, group)
+        
+        group.elements.append(el)
+        self.__el_group_mapping[el_id] = group
+        if group.populated:
+            self.__add_element_node(group.node, el)
+        
+        self.__relabel_groups(parent_id)
+        
+        return parent_node
 
         
-    def on_element_rename(self, evnt):
+    def element_renamed(self, el):
         """
-        Event handler for AvoPlotElementRename events. Renames the tree item 
-        for the element which has been renamed.       
+        Renames the tree item for the element which has been renamed.       
         """
-        el = evnt.element
         if self.__el_id_mapping.has_key(el.get_avoplot_id()):
             tree_node = self.__el_id_mapping[el.get_avoplot_id()]
             self.tree.SetItemText(tree_node, el.get_name())
-        
-            
-    def _add_all_child_nodes(self, parent_node, element):
-        """
-        Creates tree items recursively for all child elements below element, and 
-        also adds a tree item for element to parent_node.
-        """
-        if not self.__el_id_mapping.has_key(element.get_avoplot_id()):
-            node = self.tree.AppendItem(parent_node, element.get_name(), 
-                                        data=wx.TreeItemData(element))
-            self.__el_id_mapping[element.get_avoplot_id()] = node
-        else:
-            node = self.__el_id_mapping[element.get_avoplot_id()]
-        
-        for c in element.get_child_elements():
-            self._add_all_child_nodes(node, c)
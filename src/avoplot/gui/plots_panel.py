@@ -17,11 +17,12 @@
 
 import wx
 from wx.lib.agw import aui
+import matplotlib.lines
 
 from avoplot import figure
 from avoplot import core
+from avoplot import picking
 from avoplot.gui import menu
-import avoplot
 
 
 class PlotsPanel(aui.AuiNotebook):
@@ -38,14 +39,12 @@ class PlotsPanel(aui.AuiNotebook):
         
         self.__mplartist_to_element_map = {}
         
-        self.__picking_enabled = False
-        self.__pick_evnts_to_process = []
+        #index of all the lines in all the figures, used to find which line
+        #(if any) has been clicked on
+        self.__pick_index = picking.PickIndex()
         
         #register avoplot event handlers
-        core.EVT_AVOPLOT_ELEM_SELECT(self, self.on_select_element)
-        core.EVT_AVOPLOT_ELEM_ADD(self, self.on_new_element)
-        core.EVT_AVOPLOT_ELEM_DELETE(self, self.on_delete_element)
-        core.EVT_AVOPLOT_ELEM_RENAME(self, self.on_rename_element)        
+        core.EVT_AVOPLOT_TREE_CHANGED(self, self.on_tree_changed)
         
         #register wx event handlers
         self.Bind(aui.EVT_AUINOTEBOOK_PAGE_CLOSE, self.on_tab_close)
@@ -78,7 +77,7 @@ class PlotsPanel(aui.AuiNotebook):
         figure object associated with the tab that has just been closed, relying
         on the event handlers for the AvoPlotElementDelete event to actually
         destroy the window when it is finished with (this is done by 
-        on_delete_element() in this class)
+        element_deleted() in this class)
         """
         #don't let the notebook actually close the tab, otherwise it will 
         #destroy the window as well
@@ -91,12 +90,37 @@ class PlotsPanel(aui.AuiNotebook):
         fig.delete() 
         
     
-    def on_new_element(self, evnt):
+    def on_tree_changed(self, evnt):
         """
-        Event handler for AvoPlotElementAdd events. Adds a page to the notebook
-        for newly created figure objects.
+        Event handler for AvoPlotTreeChanged events. Applies all the changes in
+        the event's TreeDiff to the notebook, with the notebook frozen so that
+        it is only redrawn once.
+        """
+        diff = evnt.diff
+        
+        self.Freeze()
+        try:
+            for el in diff.deleted:
+                self.element_deleted(el)
+            
+            for el in diff.added:
+                self.element_added(el)
+            
+            for el in diff.renamed:
+                self.element_renamed(el)
+            
+            if diff.selected is not None:
+                self.element_selected(diff.selected)
+        finally:
+            self.Thaw()
+    
+    
+    def element_added(self, el):
+        """
+        Adds the element's artists to the picking map (and its lines to the 
+        pick index), and adds a page to the notebook for newly created figure 
+        objects.
         """
-        el = evnt.element
         
         #add the element to the mapping
         artists = el.get_mpl_artists()
@@ -104,55 +128,71 @@ class PlotsPanel(aui.AuiNotebook):
         for a in artists:
             assert not self.__mplartist_to_element_map.has_key(a), "multiple elements cannot share the same artists"
             self.__mplartist_to_element_map[a] = el
+            
+            if isinstance(a, matplotlib.lines.Line2D):
+                self.__pick_index.add_line(a)
         
         if isinstance(el, figure.AvoPlotFigure):
-            el.canvas.mpl_connect('pick_event', self.on_pick)
+            el.canvas.mpl_connect('button_press_event', self.on_button_press)
             self.AddPage(el, el.get_name())
     
     
-    def on_pick(self, evnt):
-        #because pick events are generated for everything under the click (i.e. data series and subplot etc)
-        #on pick needs to store events in a temporary list which then gets parsed by an OnIdle handler.
+    def pick(self, mouseevent):
+        """
+        Returns the element under the mouse for the matplotlib mouse event, or
+        None if there isn't one. Series have priority over the subplots that 
+        they are plotted in, and the topmost axes are searched first.
+        """
+        mpl_figure = mouseevent.canvas.figure
         
-        self.__pick_evnts_to_process.append(evnt)
-        avoplot.call_on_idle(self.process_picks)
+        for axes in reversed(mpl_figure.axes):
+            if not axes.contains(mouseevent)[0]:
+                continue
+            
+            line = self.__pick_index.pick(axes, mouseevent.x, mouseevent.y)
+            if line is not None:
+                return self.__mplartist_to_element_map[line]
         
+        if mouseevent.inaxes is not None:
+            return self.__mplartist_to_element_map.get(mouseevent.inaxes)
+        
+        return None
+    
     
-    def process_picks(self):   
-         
-        if not self.__pick_evnts_to_process:
+    def on_button_press(self, mouseevent):
+        """
+        Event handler for matplotlib mouse button press events. Selects (left
+        click) or opens the right click menu of (right click) the element 
+        under the mouse.
+        """
+        el = self.pick(mouseevent)
+        if el is None:
             return
         
-        #TODO - the evnt processed should come from the highest level pick event
-        #e.g. series should have priority over subplots etc. Does this happen anyway?
-        evnt = self.__pick_evnts_to_process.pop()
-        self.__pick_evnts_to_process = []
-        el = self.__mplartist_to_element_map[evnt.artist]
-        
         fig = el
-        
         while not isinstance(fig, figure.AvoPlotFigure):
             fig = fig.get_parent_element()
+            if fig is None:
+                return
         
-        if fig is None or fig._picking_enabled:    
+        if fig._picking_enabled:    
             
-            if evnt.mouseevent.button == 1:
+            if mouseevent.button == 1:
                 wx.CallAfter(el.set_selected)
             
-            elif evnt.mouseevent.button ==3:
+            elif mouseevent.button ==3:
                 wx.CallAfter(el.on_right_click)
     
     
-    def on_select_element(self, evnt):
+    def element_selected(self, el):
         """
-        Event handler for AvoPlotElementSelect events. Changes the currently
-        selected notebook page to that containing the newly selected element.
+        Changes the currently selected notebook page to that containing the 
+        newly selected element.
         
         If the selected element is not a figure, then the figure which contains
         the element is selected.
         
         """
-        el = evnt.element
         while not isinstance(el, figure.AvoPlotFigure):
             el = el.get_parent_element()
             if el is None:
@@ -168,20 +208,19 @@ class PlotsPanel(aui.AuiNotebook):
                     self.SetSelection(idx)                 
     
     
-    def on_delete_element(self, evnt):
+    def element_deleted(self, el):
         """
-        Event handler for AvoPlotElementDelete events. If the element is a figure
-        then the notebook page associated with the figure is deleted - note that
-        this destroys the window, and so future attempts to access the figure
-        object will cause an exception.
+        Removes the element's artists from the picking map and the pick index.
+        If the element is a figure then the notebook page associated with the
+        figure is removed.
         """
-        el = evnt.element
         
         #remove the element from the mapping
         artists = el.get_mpl_artists()
         if artists:
             for a in artists:
                 self.__mplartist_to_element_map.pop(a)
+                self.__pick_index.remove_line(a)
         
         if isinstance(el, figure.AvoPlotFigure):
             idx = self.GetPageIndex(el)
@@ -189,12 +228,11 @@ class PlotsPanel(aui.AuiNotebook):
                 self.RemovePage(idx)
             
             
-    def on_rename_element(self, evnt):
+    def element_renamed(self, el):
         """
-        Event handler for AvoPlotElementRename events. If the element is a 
-        figure then the relevant notebook page is renamed accordingly.
+        If the element is a figure then the relevant notebook page is renamed
+        accordingly.
         """
-        el = evnt.element
         if isinstance(el, figure.AvoPlotFigure):
             idx = self.GetPageIndex(el)
             if idx >= 0:
@@ -226,7 +264,7 @@ class PlotsPanel(aui.AuiNotebook):
         notebook pages. Opens a rename dialog and then sets the name of the 
         relevant figure object. Note that this generates an AvoPlotElementRename
         event and the actual renaming of the notebook tab is left up to the event
-        handler for this event - on_rename_element()
+        handler for this event - element_renamed()
         """
         idx = self.GetSelection()
         fig = self.GetPage(idx)
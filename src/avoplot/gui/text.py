@@ -22,6 +22,7 @@ objects
 
 import wx
 import matplotlib.text
+import matplotlib.transforms
 
 from avoplot.gui import dialog
 
@@ -71,8 +72,9 @@ class AnimatedText:
     def start_text_animation(self):
         """
         Start the animation of the text. This must be called before you call 
-        redraw_text. This creates a cache of the figure background and registers
-        a callback to update the cache if the background gets changed. 
+        redraw_text. This hides the text from full redraws of the figure, 
+        creates a cache of the figure background and registers a callback to 
+        update the cache if the background gets changed. 
         """
         
         #we have to protect against this method being called again
@@ -83,14 +85,29 @@ class AnimatedText:
     
     
     def __start_text_animation(self):
-        self.__caching_in_progress = False
+        
+        #stop_text_animation() may have been called before we got here
+        if self.__redraw_callback_id != -1:
+            return
+        
+        #hide the text objects from full redraws of the figure by setting their
+        #alpha values to zero - note that using set_visible(False) or 
+        #set_animated(True) instead leads to problems with layout. The real 
+        #alpha values are only used while the text is being drawn by 
+        #__draw_text()
+        self.__real_alphas = [t.get_alpha() for t in self.__text_objects]
+        for t in self.__text_objects:
+            t.set_alpha(0)
+        
+        self.__text_extents = None
         
         #register a callback for draw events in the mpl canvas - if the canvas
         #has been redrawn then we need to re-cache the background region
         self.__redraw_callback_id = self.__mpl_fig.canvas.mpl_connect('draw_event', self.__cache_bkgd)
         
-        #now cache the background region
-        self.__cache_bkgd()
+        #now draw the figure without the text, which will cache the background
+        #region via the draw event callback
+        self.__mpl_fig.canvas.draw()
     
     
     def stop_text_animation(self):
@@ -102,67 +119,90 @@ class AnimatedText:
                                                        "called before "
                                                        "start_text_animation()")
         
+        if self.__redraw_callback_id == -1:
+            #animation was never actually started
+            self.__redraw_callback_id = None
+            return
+        
         #disconnect the event handler for canvas draw events
         self.__mpl_fig.canvas.mpl_disconnect(self.__redraw_callback_id)
         self.__redraw_callback_id = None
         
+        #restore the real alpha values of the text - what is on the screen is 
+        #already correct, so there is no need for a redraw
+        for t, alpha in zip(self.__text_objects, self.__real_alphas):
+            t.set_alpha(alpha)
+        
         #let the cached background get garbage collected
         self.__bkgd_cache = None
+        self.__text_extents = None
     
     
     def __cache_bkgd(self, *args):
-        
-        #This method is a bit of a hack! Since canvas.draw still renders some
-        #matplotlib artists even if they are marked as animated, we instead 
-        #set the alpha value of the artists to zero, then draw everything and
-        #store the resulting canvas in a cache which can be used later to 
-        #restore regions of the background. The *real* alpha values of the 
-        #artists is then restored and the canvas is redrawn. This causes flicker
-        #of the animated artists - but at least it seems to work.
-        if self.__caching_in_progress:
-            self.__caching_in_progress = False
-            return
-        
-        self.__caching_in_progress = True
-        
-        #record the alpha values of the text objects so they can be restored
-        prev_alphas = [t.get_alpha() for t in self.__text_objects]
-        
-        #hide the text objects by setting their alpha values to zero - note that 
-        #using set_visible(False) instead leads to problems with layout.
-        for t in self.__text_objects:
-            t.set_alpha(0)
-            
-        self.__mpl_fig.canvas.draw()
+        """
+        Event handler for canvas draw events. Since the text objects are hidden 
+        whilst they are being animated, the canvas already contains just the 
+        background and can be copied directly into the cache (no additional 
+        draw is required). The text is then drawn over the top.
+        """
         self.__bkgd_cache = self.__mpl_fig.canvas.copy_from_bbox(self.__mpl_fig.bbox)
         
-        #now unhide the text by restoring its alpha value
-        for i,t in enumerate(self.__text_objects):
-            t.set_alpha(prev_alphas[i])
+        #the whole canvas has just been drawn, so there are no old text 
+        #extents that need to be blitted
+        self.__text_extents = None
+        self.__draw_text()
+    
+    
+    def __draw_text(self):
+        """
+        Draws the text objects (with their real alpha values) onto the canvas
+        and then blits the region covered by both the old and the new text to
+        the screen.
+        """
+        new_extents = []
+        for t, alpha in zip(self.__text_objects, self.__real_alphas):
+            t.set_alpha(alpha)
             self.__mpl_fig.draw_artist(t)
-            
-        self.__mpl_fig.canvas.blit(self.__mpl_fig.bbox)
+            new_extents.append(t.get_window_extent())
+            t.set_alpha(0)
+        
+        blit_extents = list(new_extents)
+        if self.__text_extents is not None:
+            blit_extents += self.__text_extents
+        self.__text_extents = new_extents
+        
+        #blit just the area that has changed (padded by a couple of pixels to 
+        #allow for antialiasing) rather than the whole figure
+        blit_bbox = matplotlib.transforms.Bbox.union(blit_extents)
+        blit_bbox = matplotlib.transforms.Bbox.from_extents(blit_bbox.x0 - 2,
+                                                            blit_bbox.y0 - 2,
+                                                            blit_bbox.x1 + 2,
+                                                            blit_bbox.y1 + 2)
+        blit_bbox = matplotlib.transforms.Bbox.intersection(blit_bbox, 
+                                                            self.__mpl_fig.bbox)
+        if blit_bbox is not None:
+            self.__mpl_fig.canvas.blit(blit_bbox)
          
     
     def redraw_text(self):
         """
-        Restores the whole background region from the cache and then draws the 
+        Restores the background region from the cache and then draws the 
         animated text objects over the top. You should call this every time you
         change the text and want the changes to be drawn to the screen.
         """
-        assert self.__bkgd_cache is not None, ("redraw_text() called before "
-                                               "__bkgd_cache was set. Have you "
-                                               "called start_text_animation()?")
+        assert self.__redraw_callback_id is not None, ("redraw_text() called "
+                                                       "before "
+                                                       "start_text_animation()")
+        if self.__bkgd_cache is None:
+            #the background has not been cached yet - the text will be drawn
+            #when it is
+            return
         
-        #restore the whole figure background from the cached backgroud
+        #restore the figure background from the cached backgroud
         self.__mpl_fig.canvas.restore_region(self.__bkgd_cache)
         
-        #now draw just the text objects (which have changed)
-        for t in self.__text_objects:
-            self.__mpl_fig.draw_artist(t)
-        
-        #blit the updated display to the screen  
-        self.__mpl_fig.canvas.blit(self.__mpl_fig.bbox)
+        #now draw just the text objects (which have changed) and blit them
+        self.__draw_text()
         
         
 
@@ -54,9 +54,7 @@ class MainToolbar(wx.ToolBar):
         self.enable_plot_tools(False)
         
         #register avoplot event handlers
-        core.EVT_AVOPLOT_ELEM_ADD(self, self.on_element_add)
-        core.EVT_AVOPLOT_ELEM_SELECT(self, self.on_element_select)
-        core.EVT_AVOPLOT_ELEM_DELETE(self, self.on_element_delete)
+        core.EVT_AVOPLOT_TREE_CHANGED(self, self.on_tree_changed)
         
         #register events
         wx.EVT_TOOL(self.parent, self.new_tool.GetId(), self.on_new)
@@ -69,16 +67,32 @@ class MainToolbar(wx.ToolBar):
         wx.EVT_TOOL(self.parent, self.add_subplot_tool.GetId(), self.on_add_subplot)
     
     
-    def on_element_add(self, evnt):
+    def on_tree_changed(self, evnt):
         """
-        Event handler for new element events. If the element is not a figure
-        then nothing gets done. For figures, their zoom and pan settings are
+        Event handler for AvoPlotTreeChanged events. Updates the state of the
+        tools to reflect the changes to the element tree.
+        """
+        diff = evnt.diff
+        
+        for el in diff.deleted:
+            self.element_deleted(el)
+        
+        for el in diff.added:
+            self.element_added(el)
+        
+        if diff.selected is not None:
+            self.element_selected(diff.selected)
+    
+    
+    def element_added(self, el):
+        """
+        Called for each new element. If the element is not a figure then 
+        nothing gets done. For figures, their zoom and pan settings are
         updated depending on the toggle state of the zoom/pan tools.
         
         This method also enables the plot navigation tools if they were 
         previously disabled.
         """
-        el = evnt.element
         if isinstance(el, figure.AvoPlotFigure):
             if not self.__all_figures:
                 self.enable_plot_tools(True)
@@ -100,13 +114,12 @@ class MainToolbar(wx.ToolBar):
             self.set_pan_state(False)
     
     
-    def on_element_delete(self, evnt):
+    def element_deleted(self, el):
         """
-        Event handler for element delete events.If the element is not a figure
-        then nothing gets done. If the element being deleted was the last figure
+        Called for each deleted element. If the element is not a figure then 
+        nothing gets done. If the element being deleted was the last figure
         in the session, then this disables the plot navigation tools. 
         """
-        el = evnt.element
         if isinstance(el, figure.AvoPlotFigure):
             self.__all_figures.remove(el)
             if not self.__all_figures:
@@ -114,13 +127,11 @@ class MainToolbar(wx.ToolBar):
                 self.enable_plot_tools(False)
                 
     
-    def on_element_select(self, evnt):
+    def element_selected(self, el):
         """
-        Event handler for element select events. Keeps track of what the 
-        currently selected element is and updates the state of the history 
-        buttons.
+        Called when an element is selected. Keeps track of what the currently
+        selected element is and updates the state of the history buttons.
         """
-        el = evnt.element
         if isinstance(el, figure.AvoPlotFigure):
             self.__active_figure = el
             
@@ -0,0 +1,334 @@
+#Copyright (C) Nial Peters 2013
+#
+#This file is part of AvoPlot.
+#
+#AvoPlot is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#AvoPlot is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with AvoPlot.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The headless module renders plots of data files straight to image files (PNG,
+PDF, SVG etc.) using matplotlib's Agg backend. No wx windows (or wx.App) are
+created, so it can be used to plot large numbers of files on machines without
+a display. Files are rendered in parallel across a pool of processes. This is
+used by the --render option of the AvoPlot script.
+"""
+
+import os.path
+import itertools
+import multiprocessing
+
+from avoplot import file_loaders
+
+#formats that figures can be rendered to
+OUTPUT_FORMATS = ['png', 'pdf', 'svg', 'eps', 'ps']
+
+
+class RenderError(Exception):
+    """
+    Exception raised when a file cannot be rendered for some reason
+    """
+    pass
+
+
+
+class RenderOptions(object):
+    
+    def __init__(self, output_dir=None, output_format='png', loader_name=None,
+                 xcol=None, ycols=None, style='-', title=None,
+                 figsize=(8.0, 6.0), dpi=100):
+        """
+        Options controlling how files are rendered.
+
+        output_dir is the directory to save the images in (None saves them
+        alongside the data files), output_format is one of OUTPUT_FORMATS and
+        loader_name is the name of the file loader to use (None chooses one
+        automatically).
+
+        xcol is the column to use for the x data, and ycols is a list of the
+        columns to plot against it. Columns may be given either by name
+        ('A', 'B' ... as shown in the GUI) or by the title in the file's
+        header. By default the first column is used for x, and all the other
+        numeric columns are plotted.
+
+        style is a matplotlib format string for the lines (e.g. 'r.') and title
+        is the title of the plots (None uses the file names). figsize is the
+        (width, height) of the figures in inches and dpi their resolution.
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError("Unsupported output format \'%s\'. Expecting "
+                             "one of %s."%(output_format, 
+                                           ', '.join(OUTPUT_FORMATS)))
+
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.loader_name = loader_name
+        self.xcol = xcol
+        self.ycols = ycols
+        self.style = style
+        self.title = title
+        self.figsize = tuple(figsize)
+        self.dpi = dpi
+    
+    
+    def get_output_filename(self, filename):
+        """
+        Returns the name of the image file that the data file filename should
+        be rendered to.
+        """
+        output_dir = self.output_dir
+        if output_dir is None:
+            output_dir = os.path.dirname(os.path.abspath(filename))
+
+        basename = os.path.splitext(os.path.basename(filename))[0]
+        return os.path.join(output_dir, "%s.%s"%(basename, self.output_format))
+
+
+
+def get_column(contents, name):
+    """
+    Returns the file_loaders.ColumnData object for the column of contents (a
+    file_loaders.FileContents object) given by name. This can either be the
+    name of the column as shown in the GUI ('A', 'B' ...) or its title. Raises
+    RenderError if the column does not exist or does not contain numbers.
+    """
+    try:
+        column = contents.get_column_by_name(name)
+    except KeyError:
+        matches = [c for c in contents.get_columns() if c.title == name]
+        if not matches:
+            raise RenderError("No column called \'%s\' in %s"%(name,
+                                                              contents.filename))
+        column = matches[0]
+
+    if column.get_data_type() != 'number':
+        raise RenderError("Column \'%s\' in %s does not contain numeric "
+                          "data"%(name, contents.filename))
+    return column
+
+
+
+def get_column_label(contents, idx):
+    """
+    Returns the label to use for column number idx of contents - this is its
+    title if it has one, or its name otherwise.
+    """
+    title = contents.get_column_by_index(idx).title
+    if title and not title.isspace():
+        return title
+    return contents.get_col_name(idx)
+
+
+
+def load_series(filename, options):
+    """
+    Loads the data file filename and returns a tuple (xlabel, series) where
+    series is a list of (label, xdata, ydata) tuples of the data to be plotted,
+    as chosen by options (a RenderOptions instance).
+    """
+    contents = file_loaders.load_file(filename, loader_name=options.loader_name)
+    columns = contents.get_columns()
+
+    if not columns:
+        raise RenderError("No data found in %s"%filename)
+
+    #work out which columns to use
+    if options.xcol is not None:
+        xcol = get_column(contents, options.xcol)
+    elif len(columns) > 1 and columns[0].get_data_type() == 'number':
+        xcol = columns[0]
+    else:
+        #plot the data against its index
+        xcol = None
+
+    if options.ycols:
+        ycols = [get_column(contents, c) for c in options.ycols]
+    else:
+        ycols = [c for c in columns
+                 if c is not xcol and c.get_data_type() == 'number']
+
+    if not ycols:
+        raise RenderError("No numeric data to plot in %s"%filename)
+
+    labels = dict([(id(c), get_column_label(contents, i))
+                   for i, c in enumerate(columns)])
+
+    series = []
+    for c in ycols:
+        ydata = c.get_data()
+        if xcol is None:
+            xdata = range(len(ydata))
+        else:
+            xdata = xcol.get_data()
+        series.append((labels[id(c)], xdata, ydata))
+
+    if xcol is None:
+        xlabel = "Index"
+    else:
+        xlabel = labels[id(xcol)]
+
+    return xlabel, series
+
+
+
+def get_output_filenames(filenames, options):
+    """
+    Returns a list of the names of the image files that each of filenames
+    should be rendered to (see RenderOptions.get_output_filename()). Files
+    whose images would have the same name (e.g. run1/data.txt and 
+    run2/data.txt rendered into the same output directory) are given a numeric
+    suffix (data.png, data_1.png ...) so that they do not overwrite each other.
+    """
+    def _key(name):
+        return os.path.normcase(os.path.abspath(name))
+    
+    output_filenames = [options.get_output_filename(f) for f in filenames]
+    
+    #the suffixed names must not clash with any of the un-suffixed ones either
+    unsuffixed = set([_key(f) for f in output_filenames])
+    used = set()
+    
+    for i, output_filename in enumerate(output_filenames):
+        if _key(output_filename) in used:
+            root, ext = os.path.splitext(output_filename)
+            n = 1
+            while True:
+                candidate = "%s_%d%s"%(root, n, ext)
+                if (_key(candidate) not in used and 
+                    _key(candidate) not in unsuffixed):
+                    break
+                n += 1
+            output_filenames[i] = candidate
+        
+        used.add(_key(output_filenames[i]))
+    
+    return output_filenames
+
+
+
+def render_file(filename, options, output_filename=None):
+    """
+    Plots the data in filename (as chosen by options - a RenderOptions
+    instance) and saves the figure as an image file, using the Agg backend.
+    The image is saved as output_filename, or as 
+    options.get_output_filename(filename) if this is None. Returns the name of
+    the image file.
+    """
+    #matplotlib is only imported here so that importing this module (e.g. in
+    #the AvoPlot script to get OUTPUT_FORMATS) does not load a backend before
+    #the GUI has chosen its own
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    
+    xlabel, series = load_series(filename, options)
+
+    figure = Figure(figsize=options.figsize, dpi=options.dpi)
+    FigureCanvasAgg(figure)
+
+    #use the same white background as AvoPlotFigure
+    figure.set_facecolor((1, 1, 1))
+
+    axes = figure.add_subplot(111)
+    for label, xdata, ydata in series:
+        axes.plot(xdata, ydata, options.style, label=label)
+
+    axes.set_xlabel(xlabel)
+    if len(series) == 1:
+        axes.set_ylabel(series[0][0])
+    else:
+        axes.legend(loc='best')
+
+    if options.title is not None:
+        axes.set_title(options.title)
+    else:
+        axes.set_title(os.path.basename(filename))
+
+    if output_filename is None:
+        output_filename = options.get_output_filename(filename)
+    figure.savefig(output_filename, format=options.output_format, dpi=options.dpi,
+                   facecolor=figure.get_facecolor())
+
+    return output_filename
+
+
+
+def _render_worker(args):
+    """
+    Renders a single file in a worker process. args should be a tuple of
+    (filename, output filename, options). Returns a tuple of (filename, output
+    filename, error message), where either the output filename or the error
+    message will be None.
+    """
+    filename, output_filename, options = args
+    try:
+        return filename, render_file(filename, options, output_filename), None
+
+    except Exception, e:
+        #return the error rather than raising it, so that the rest of the files
+        #still get rendered
+        return filename, None, "%s: %s"%(e.__class__.__name__, e)
+
+
+
+def render_files(filenames, options, processes=None, callback=None):
+    """
+    Renders each of the files in filenames (see render_file()), spread across
+    a pool of processes (the number of processes defaults to the number of
+    CPUs). Returns a list of (filename, output filename, error message)
+    tuples in the order that the files were finished. If callback is not None,
+    then it is called with each of these tuples as soon as the file is
+    finished. Files which cannot be rendered do not stop the others from
+    being rendered. Files whose images would have the same name are given
+    unique names (see get_output_filenames()).
+    """
+    output_filenames = get_output_filenames(filenames, options)
+    tasks = [(f, o, options) for f, o in zip(filenames, output_filenames)]
+    results = []
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(tasks))
+
+    if processes <= 1:
+        for result in itertools.imap(_render_worker, tasks):
+            results.append(result)
+            if callback is not None:
+                callback(result)
+        return results
+
+    #send the files to the workers in chunks, so that the overhead is small
+    #even for very large numbers of files
+    chunksize = max(1, len(tasks) // (4 * processes))
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        results_iter = pool.imap_unordered(_render_worker, tasks, chunksize)
+
+        while len(results) < len(tasks):
+            #use a timeout, otherwise the main process cannot be interrupted
+            #(e.g. by Ctrl-C) while it is waiting for results
+            try:
+                result = results_iter.next(timeout=0.5)
+            except multiprocessing.TimeoutError:
+                continue
+
+            results.append(result)
+            if callback is not None:
+                callback(result)
+    except:
+        pool.terminate()
+        raise
+
+    pool.close()
+    pool.join()
+
+    return results
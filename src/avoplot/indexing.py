@@ -0,0 +1,334 @@
+#Copyright (C) Nial Peters 2013
+#
+#This file is part of AvoPlot.
+#
+#AvoPlot is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#AvoPlot is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with AvoPlot.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The indexing module provides index structures which allow fast lookups of
+points in large data series. The indexes are built once (normally lazily by the
+data series that they belong to) and can then be queried many times without
+having to scan the whole of the data.
+"""
+
+import numpy
+import scipy.spatial
+import matplotlib.path
+
+
+class SortedIndex(object):
+
+    def __init__(self, values):
+        """
+        Index of a 1D array of values which allows nearest value and range
+        queries to be made in O(log n) time using binary searches. If the
+        values are already sorted in ascending order then they are used as they
+        are, otherwise a sort permutation is computed (once) and stored
+        alongside a sorted copy of the values. NaN values are ignored by all
+        queries.
+
+        Note that all indices returned by the index refer to positions in the
+        original (unsorted) values array.
+        """
+        values = numpy.asarray(values, dtype='float')
+
+        if len(values) < 2 or numpy.all(values[1:] >= values[:-1]):
+            self.__order = None
+            self.__sorted_values = values
+        else:
+            #use a stable sort so that points with equal values stay in order
+            self.__order = numpy.argsort(values, kind='mergesort')
+            self.__sorted_values = values[self.__order]
+
+        #argsort puts any NaNs at the end of the sorted array - we just ignore
+        #them by only searching the valid part of the array
+        n_nans = numpy.count_nonzero(numpy.isnan(self.__sorted_values))
+        self.__valid_values = self.__sorted_values[:len(values) - n_nans]
+    
+    
+    def __len__(self):
+        return len(self.__sorted_values)
+    
+    
+    def is_sorted(self):
+        """
+        Returns True if the values the index was built from were already sorted
+        in ascending order, False otherwise.
+        """
+        return self.__order is None
+    
+    
+    def get_sort_order(self):
+        """
+        Returns the array of indices which sorts the original values, or None
+        if the values were already sorted.
+        """
+        return self.__order
+    
+    
+    def __to_original_idx(self, sorted_idx):
+        """
+        Converts an index into the sorted values to an index into the original
+        values.
+        """
+        if self.__order is None:
+            return sorted_idx
+        return self.__order[sorted_idx]
+    
+    
+    def nearest(self, value):
+        """
+        Returns the index (in the original values array) of the value which
+        is closest to value. Raises ValueError if the index contains no
+        (non-NaN) values.
+        """
+        n = len(self.__valid_values)
+        if n == 0:
+            raise ValueError("Cannot search an index with no valid values.")
+
+        i = numpy.searchsorted(self.__valid_values, value)
+
+        #the nearest value is either the one we found, or the one before it
+        if i == n:
+            i -= 1
+        elif i > 0:
+            if value - self.__valid_values[i - 1] <= self.__valid_values[i] - value:
+                i -= 1
+
+        return self.__to_original_idx(i)
+    
+    
+    def get_range(self, low, high):
+        """
+        Returns a tuple (start, stop) of the positions in the sorted values
+        of the values which lie within the closed interval [low, high]. If the
+        values were already sorted (see is_sorted()) then these are also the
+        positions in the original values.
+        """
+        start = numpy.searchsorted(self.__valid_values, low, side='left')
+        stop = numpy.searchsorted(self.__valid_values, high, side='right')
+        return start, max(start, stop)
+    
+    
+    def indices_in_range(self, low, high):
+        """
+        Returns a sorted array of the indices (in the original values array) of
+        all the values within the closed interval [low, high].
+        """
+        start, stop = self.get_range(low, high)
+        if self.__order is None:
+            return numpy.arange(start, stop)
+        return numpy.sort(self.__order[start:stop])
+
+
+
+class NearestNeighbourIndex(object):
+
+    def __init__(self, xvalues, yvalues):
+        """
+        Index of 2D (x,y) points allowing nearest neighbour queries in
+        O(log n) time, using a k-d tree. Since x and y may have completely
+        different scales, the points are normalised by the range of the data
+        in each dimension before being put into the tree (so distances are
+        measured as they would appear on axes showing the whole data series).
+        Points where either x or y is not finite are ignored.
+
+        Note that all indices returned by the index refer to positions in the
+        original values arrays.
+        """
+        xvalues = numpy.asarray(xvalues, dtype='float')
+        yvalues = numpy.asarray(yvalues, dtype='float')
+
+        finite = numpy.logical_and(numpy.isfinite(xvalues),
+                                   numpy.isfinite(yvalues))
+        if numpy.all(finite):
+            self.__idxs = None
+        else:
+            self.__idxs = numpy.where(finite)[0]
+            xvalues = xvalues[self.__idxs]
+            yvalues = yvalues[self.__idxs]
+
+        self.__tree = None
+        self.__offset = (0.0, 0.0)
+        self.__scale = (1.0, 1.0)
+
+        if len(xvalues) == 0:
+            return
+
+        self.__offset = (xvalues.min(), yvalues.min())
+        self.__scale = (xvalues.max() - self.__offset[0] or 1.0,
+                        yvalues.max() - self.__offset[1] or 1.0)
+
+        points = numpy.empty((len(xvalues), 2), dtype='float')
+        points[:, 0] = (xvalues - self.__offset[0]) / self.__scale[0]
+        points[:, 1] = (yvalues - self.__offset[1]) / self.__scale[1]
+        self.__tree = scipy.spatial.cKDTree(points)
+    
+    
+    def nearest(self, x, y):
+        """
+        Returns the index (in the original values arrays) of the point which
+        is closest to (x, y). Raises ValueError if the index contains no
+        (finite) points.
+        """
+        if self.__tree is None:
+            raise ValueError("Cannot search an index with no valid points.")
+
+        dist, i = self.__tree.query([(x - self.__offset[0]) / self.__scale[0],
+                                     (y - self.__offset[1]) / self.__scale[1]])
+        if self.__idxs is None:
+            return int(i)
+        return self.__idxs[i]
+
+
+
+class GridIndex(object):
+    
+    def __init__(self, xvalues, yvalues, points_per_cell=16):
+        """
+        2D spatial index which buckets (x,y) points into a regular grid of 
+        cells, sized so that there are on average points_per_cell points in 
+        each cell. The points are sorted by cell, so that the points in a row
+        of cells are contiguous in the index. Rectangle queries then only need 
+        to look at the points in the cells which overlap the rectangle. Points 
+        where either x or y is not finite are ignored.
+        
+        Note that all indices returned by the index refer to positions in the
+        original values arrays.
+        """
+        self.__xvalues = numpy.asarray(xvalues, dtype='float')
+        self.__yvalues = numpy.asarray(yvalues, dtype='float')
+        
+        finite_idxs = numpy.where(numpy.logical_and(numpy.isfinite(self.__xvalues),
+                                                    numpy.isfinite(self.__yvalues)))[0]
+        
+        n = len(finite_idxs)
+        self.__n_cols = self.__n_rows = max(1, int(numpy.sqrt(n / float(points_per_cell))))
+        
+        if n == 0:
+            self.__origin = (0.0, 0.0)
+            self.__cell_size = (1.0, 1.0)
+            self.__order = finite_idxs
+            self.__cell_starts = numpy.zeros(self.__n_cols * self.__n_rows + 1, 
+                                             dtype='int')
+            return
+        
+        x = self.__xvalues[finite_idxs]
+        y = self.__yvalues[finite_idxs]
+        
+        self.__origin = (x.min(), y.min())
+        self.__cell_size = (((x.max() - self.__origin[0]) / self.__n_cols) or 1.0,
+                            ((y.max() - self.__origin[1]) / self.__n_rows) or 1.0)
+        
+        cells = (self.__get_rows(y) * self.__n_cols) + self.__get_cols(x)
+        
+        #sort the points by the cell that they are in, and record where the 
+        #points for each cell start in the sorted order
+        cell_order = numpy.argsort(cells, kind='mergesort')
+        self.__order = finite_idxs[cell_order]
+        counts = numpy.bincount(cells, minlength=self.__n_cols * self.__n_rows)
+        self.__cell_starts = numpy.concatenate(([0], numpy.cumsum(counts)))
+    
+    
+    def __get_cols(self, x):
+        """
+        Returns the column number(s) of the cell(s) containing x.
+        """
+        cols = numpy.floor((x - self.__origin[0]) / self.__cell_size[0])
+        return numpy.clip(cols, 0, self.__n_cols - 1).astype('int')
+    
+    
+    def __get_rows(self, y):
+        """
+        Returns the row number(s) of the cell(s) containing y.
+        """
+        rows = numpy.floor((y - self.__origin[1]) / self.__cell_size[1])
+        return numpy.clip(rows, 0, self.__n_rows - 1).astype('int')
+    
+    
+    def candidates_in_rect(self, xmin, ymin, xmax, ymax):
+        """
+        Returns an (unsorted) array of the indices of all the points in the 
+        cells which overlap the rectangle. This is a superset of the points 
+        within the rectangle - use indices_in_rect() to get the exact set.
+        """
+        col_min, col_max = self.__get_cols(numpy.array([xmin, xmax]))
+        row_min, row_max = self.__get_rows(numpy.array([ymin, ymax]))
+        
+        #the cells in each row of the rectangle are contiguous in the sorted
+        #order, so we just need one slice per row
+        candidates = []
+        for row in range(row_min, row_max + 1):
+            start = self.__cell_starts[row * self.__n_cols + col_min]
+            stop = self.__cell_starts[row * self.__n_cols + col_max + 1]
+            if stop > start:
+                candidates.append(self.__order[start:stop])
+        
+        if not candidates:
+            return numpy.array([], dtype='int')
+        return numpy.concatenate(candidates)
+    
+    
+    def indices_in_rect(self, xmin, ymin, xmax, ymax):
+        """
+        Returns a sorted array of the indices of all the points within the 
+        closed rectangle [xmin, xmax] x [ymin, ymax].
+        """
+        candidates = self.candidates_in_rect(xmin, ymin, xmax, ymax)
+        x = self.__xvalues[candidates]
+        y = self.__yvalues[candidates]
+        inside = numpy.logical_and(numpy.logical_and(x >= xmin, x <= xmax),
+                                   numpy.logical_and(y >= ymin, y <= ymax))
+        return numpy.sort(candidates[inside])
+    
+    
+    def indices_in_polygon(self, vertices):
+        """
+        Returns a sorted array of the indices of all the points within the 
+        polygon defined by vertices (a sequence of (x, y) pairs). Only the
+        points in the cells which overlap the bounding box of the polygon are
+        tested.
+        """
+        vertices = numpy.asarray(vertices, dtype='float')
+        if len(vertices) < 3:
+            return numpy.array([], dtype='int')
+        
+        xmin, ymin = vertices.min(axis=0)
+        xmax, ymax = vertices.max(axis=0)
+        candidates = self.candidates_in_rect(xmin, ymin, xmax, ymax)
+        
+        points = numpy.empty((len(candidates), 2), dtype='float')
+        points[:, 0] = self.__xvalues[candidates]
+        points[:, 1] = self.__yvalues[candidates]
+        
+        path = matplotlib.path.Path(numpy.concatenate((vertices, vertices[:1])), 
+                                    closed=True)
+        inside = path.contains_points(points)
+        
+        return numpy.sort(candidates[inside])
+    
+    
+    def indices_in_rects(self, rects):
+        """
+        Returns a sorted array of the (unique) indices of all the points within
+        any of the (xmin, ymin, xmax, ymax) closed rectangles in rects.
+        """
+        if not rects:
+            return numpy.array([], dtype='int')
+        
+        if len(rects) == 1:
+            return self.indices_in_rect(*rects[0])
+        
+        return numpy.unique(numpy.concatenate([self.indices_in_rect(*r) 
+                                               for r in rects]))
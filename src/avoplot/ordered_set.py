@@ -87,3 +87,117 @@ class OrderedSet(collections.MutableSet):
         self.clear()                    # remove circular references
 
 ## end of http://code.activestate.com/recipes/576694/ }}}
+
+
+
+#placeholder for removed keys in CompactOrderedSet
+_REMOVED = object()
+
+
+class CompactOrderedSet(collections.MutableSet):
+    """
+    Insertion ordered set which stores its members in a list, with a dict 
+    mapping each member to its position in the list. This uses much less 
+    memory than the linked list used by OrderedSet, and provides O(1) access
+    to the first and last members. 
+    
+    Removed members are replaced by a placeholder in the list (so that the 
+    positions of the other members do not change), and the list is compacted
+    once more than half of it is placeholders. Placeholders at the end of the 
+    list are removed straight away. Adding, removing and finding the last 
+    member are therefore all (amortised) O(1).
+    """
+    def __init__(self, iterable=None):
+        self.__keys = []
+        self.__positions = {}
+        self.__n_removed = 0
+        if iterable is not None:
+            self |= iterable
+    
+    def __len__(self):
+        return len(self.__positions)
+    
+    def __contains__(self, key):
+        return key in self.__positions
+    
+    def add(self, key):
+        if key not in self.__positions:
+            self.__positions[key] = len(self.__keys)
+            self.__keys.append(key)
+    
+    def discard(self, key):
+        pos = self.__positions.pop(key, None)
+        if pos is None:
+            return
+        
+        keys = self.__keys
+        keys[pos] = _REMOVED
+        self.__n_removed += 1
+        
+        #trim any placeholders from the end of the list
+        while keys and keys[-1] is _REMOVED:
+            keys.pop()
+            self.__n_removed -= 1
+        
+        if self.__n_removed > 16 and self.__n_removed > len(keys) // 2:
+            self.__compact()
+    
+    def __compact(self):
+        """
+        Removes all the placeholders from the list of keys. Note that this 
+        creates a new list, so that any iterators over the old one are not 
+        affected.
+        """
+        self.__keys = [k for k in self.__keys if k is not _REMOVED]
+        self.__positions = dict((k, i) for i, k in enumerate(self.__keys))
+        self.__n_removed = 0
+    
+    def __iter__(self):
+        for k in self.__keys:
+            if k is not _REMOVED:
+                yield k
+    
+    def __reversed__(self):
+        for k in reversed(self.__keys):
+            if k is not _REMOVED:
+                yield k
+    
+    def first(self):
+        """
+        Returns the first member of the set. Raises KeyError if the set is 
+        empty.
+        """
+        if not self.__positions:
+            raise KeyError('set is empty')
+        return next(iter(self))
+    
+    def last(self):
+        """
+        Returns the last member of the set in O(1) time. Raises KeyError if the
+        set is empty.
+        """
+        if not self.__positions:
+            raise KeyError('set is empty')
+        
+        #there are never placeholders at the end of the list
+        return self.__keys[-1]
+    
+    def pop(self, last=True):
+        key = self.last() if last else self.first()
+        self.discard(key)
+        return key
+    
+    def clear(self):
+        self.__keys = []
+        self.__positions = {}
+        self.__n_removed = 0
+    
+    def __repr__(self):
+        if not self:
+            return '%s()' % (self.__class__.__name__,)
+        return '%s(%r)' % (self.__class__.__name__, list(self))
+    
+    def __eq__(self, other):
+        if isinstance(other, (OrderedSet, CompactOrderedSet)):
+            return len(self) == len(other) and list(self) == list(other)
+        return set(self) == set(other)
@@ -0,0 +1,250 @@
+#Copyright (C) Nial Peters 2013
+#
+#This file is part of AvoPlot.
+#
+#AvoPlot is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#AvoPlot is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with AvoPlot.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The picking module provides the PickIndex class, which finds the line under a
+mouse click without having to hit-test every line in the figure. Each line is
+split into chunks of consecutive points and the bounding box of each chunk is
+stored, so that only the chunks close to the click need to be tested exactly.
+"""
+
+import numpy
+import collections
+
+from avoplot.stats import ranges_to_indices
+
+#distance (in pixels) from a line within which a click counts as a hit
+PICK_TOLERANCE = 10.0
+
+#number of points in each chunk of a line
+CHUNK_SIZE = 256
+
+
+class LineGeometry(object):
+    
+    def __init__(self, line, chunk_size=CHUNK_SIZE):
+        """
+        Holds the data of a matplotlib line, along with the bounding box (in
+        data coordinates) of each chunk of chunk_size consecutive points. Each
+        chunk's bounding box also includes the first point of the next chunk,
+        so that it contains all of the line segments starting in the chunk.
+        """
+        self.line = line
+        self.xy = line.get_xydata()
+        self.chunk_size = chunk_size
+
+        n = len(self.xy)
+        if n == 0:
+            self.chunk_bboxes = numpy.empty((0, 4), dtype='float')
+            self.bbox = numpy.array([numpy.nan] * 4)
+            return
+
+        xy = numpy.asarray(self.xy, dtype='float')
+        starts = numpy.arange(0, n, chunk_size)
+
+        mins = numpy.fmin.reduceat(xy, starts, axis=0)
+        maxs = numpy.fmax.reduceat(xy, starts, axis=0)
+
+        #extend each chunk (except the last) to the first point of the next
+        next_points = xy[starts[1:]]
+        mins[:-1] = numpy.fmin(mins[:-1], next_points)
+        maxs[:-1] = numpy.fmax(maxs[:-1], next_points)
+
+        self.chunk_bboxes = numpy.hstack((mins, maxs))
+        self.bbox = numpy.concatenate((numpy.fmin.reduce(mins, axis=0),
+                                       numpy.fmax.reduce(maxs, axis=0)))
+    
+    
+    def is_stale(self):
+        """
+        Returns True if the line's data has changed since the geometry was
+        computed, False otherwise.
+        """
+        return self.line.get_xydata() is not self.xy
+    
+    
+    def hit_test(self, x, y, rect, tolerance):
+        """
+        Returns True if the display point (x, y) lies within tolerance pixels
+        of the line (or of one of its markers). rect is the
+        (xmin, ymin, xmax, ymax) rectangle in data coordinates which contains
+        all points within tolerance of (x, y) - only the chunks which overlap
+        it are tested.
+        """
+        n = len(self.xy)
+        chunks = numpy.where(_overlaps(self.chunk_bboxes, rect))[0]
+        if len(chunks) == 0:
+            return False
+
+        starts = chunks * self.chunk_size
+        stops = numpy.minimum(starts + self.chunk_size, n)
+
+        #indices of the points in the candidate chunks, and of the end points
+        #of the segments which start in them
+        idxs = ranges_to_indices(numpy.column_stack((starts, stops)))
+        seg_idxs = idxs[idxs < n - 1]
+
+        #only transform the points that we need into display coordinates
+        pts_idxs = numpy.union1d(idxs, seg_idxs + 1)
+        pixels = self.line.get_transform().transform(self.xy[pts_idxs])
+
+        click = numpy.array([x, y], dtype='float')
+        tol_sq = tolerance ** 2
+
+        if self.line.get_marker() not in (None, 'None', 'none', ' ', ''):
+            marker_pixels = pixels[numpy.searchsorted(pts_idxs, idxs)]
+            dist_sq = ((marker_pixels - click) ** 2).sum(axis=1)
+            if numpy.any(dist_sq <= tol_sq):
+                return True
+
+        if (self.line.get_linestyle() in (None, 'None', 'none', ' ', '') or
+            len(seg_idxs) == 0):
+            return False
+
+        #distance from the click to the closest point on each segment
+        seg_starts = numpy.searchsorted(pts_idxs, seg_idxs)
+        a = pixels[seg_starts]
+        d = pixels[seg_starts + 1] - a
+        len_sq = (d ** 2).sum(axis=1)
+        t = ((click - a) * d).sum(axis=1) / numpy.where(len_sq > 0, len_sq, 1.0)
+        t = numpy.clip(t, 0.0, 1.0)
+        closest = a + t[:, numpy.newaxis] * d
+        dist_sq = ((closest - click) ** 2).sum(axis=1)
+
+        return bool(numpy.any(dist_sq <= tol_sq))
+
+
+
+def _overlaps(bboxes, rect):
+    """
+    Returns a boolean array which is True for each of the (xmin, ymin, xmax,
+    ymax) rows of bboxes which overlaps the (xmin, ymin, xmax, ymax) rect.
+    Rows containing NaNs never overlap.
+    """
+    return numpy.logical_and(
+                numpy.logical_and(bboxes[:, 0] <= rect[2], bboxes[:, 2] >= rect[0]),
+                numpy.logical_and(bboxes[:, 1] <= rect[3], bboxes[:, 3] >= rect[1]))
+
+
+
+class PickIndex(object):
+    
+    def __init__(self, tolerance=PICK_TOLERANCE):
+        """
+        Index of the lines in a set of matplotlib axes, which finds the line
+        closest to the top of the plot within tolerance pixels of a click. The
+        bounding boxes of all the lines in each axes are kept in an array, so
+        that the lines near the click can be found with a single vectorised
+        test. Only these candidates are then hit-tested exactly. The geometry
+        of lines whose data has changed is recomputed when they are next
+        picked.
+        """
+        self.__tolerance = tolerance
+        
+        #dict of axes : ordered dict of line : LineGeometry (in the order that
+        #the lines were added), dict of line : axes, and dict of axes : tuple 
+        #of (list of LineGeometry objects, array of their bounding boxes) 
+        #which is None if it needs rebuilding
+        self.__geometry = {}
+        self.__line_axes = {}
+        self.__bboxes = {}
+    
+    
+    def add_line(self, line):
+        """
+        Adds a matplotlib line (which must already belong to a set of axes) to
+        the index.
+        """
+        axes = line.axes
+        self.__geometry.setdefault(axes, collections.OrderedDict())[line] = LineGeometry(line)
+        self.__line_axes[line] = axes
+        self.__bboxes[axes] = None
+    
+    
+    def remove_line(self, line):
+        """
+        Removes a matplotlib line from the index. Lines not in the index are
+        ignored.
+        """
+        axes = self.__line_axes.pop(line, None)
+        if axes is None:
+            return
+        
+        geometry = self.__geometry[axes]
+        del geometry[line]
+        
+        if geometry:
+            self.__bboxes[axes] = None
+        else:
+            del self.__geometry[axes]
+            del self.__bboxes[axes]
+    
+    
+    def __get_bboxes(self, axes):
+        """
+        Returns a tuple of (list of LineGeometry objects, array of their 
+        bounding boxes) for the lines in axes, recomputing the geometry of any
+        lines whose data has changed.
+        """
+        geometry = self.__geometry[axes]
+        
+        for line, g in geometry.items():
+            if g.is_stale():
+                geometry[line] = LineGeometry(line)
+                self.__bboxes[axes] = None
+        
+        if self.__bboxes[axes] is None:
+            geoms = geometry.values()
+            bboxes = numpy.array([g.bbox for g in geoms], 
+                                 dtype='float').reshape(-1, 4)
+            self.__bboxes[axes] = (geoms, bboxes)
+        
+        return self.__bboxes[axes]
+    
+    
+    def pick(self, axes, x, y):
+        """
+        Returns the line in axes within tolerance of the display point (x, y),
+        or None if there isn't one. If several lines are within tolerance,
+        then the one which is drawn on top is returned.
+        """
+        if not self.__geometry.has_key(axes):
+            return None
+        
+        geometry, bboxes = self.__get_bboxes(axes)
+        
+        #the rectangle around the click in data coordinates
+        tol = self.__tolerance
+        corners = axes.transData.inverted().transform([(x - tol, y - tol),
+                                                       (x + tol, y + tol)])
+        rect = (corners[:, 0].min(), corners[:, 1].min(),
+                corners[:, 0].max(), corners[:, 1].max())
+        
+        candidates = numpy.where(_overlaps(bboxes, rect))[0]
+        
+        #test the lines which are drawn last first
+        candidates = sorted(candidates, 
+                            key=lambda i: (geometry[i].line.get_zorder(), i),
+                            reverse=True)
+        
+        for i in candidates:
+            g = geometry[i]
+            if g.line.get_visible() and g.hit_test(x, y, rect, tol):
+                return g.line
+        
+        return None
+
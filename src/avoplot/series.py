@@ -16,6 +16,7 @@
 #along with AvoPlot.  If not, see <http://www.gnu.org/licenses/>.
 import wx
 import os
+import copy
 import numpy
 import time
 import threading
@@ -26,6 +27,7 @@ import math
 import scipy.optimize
 import collections
 
+import avoplot
 from avoplot.subplots import AvoPlotXYSubplot
 from avoplot import controls
 from avoplot import core
@@ -33,8 +35,89 @@ from avoplot import subplots
 from avoplot import figure
 from avoplot import fitting
 from avoplot import data_selection
+from avoplot import indexing
+from avoplot import stats
 from avoplot.gui import linestyle_editor
 from avoplot.persist import PersistentStorage
+from matplotlib.dates import date2num
+
+
+def _to_datetime64(values):
+    """
+    Returns values as a numpy datetime64 array (with microsecond resolution) 
+    if they are dates (either datetime objects or datetime64 values). Returns
+    None if they are not dates, or cannot be represented as datetime64 values
+    (for example, timezone aware datetime objects).
+    """
+    values = numpy.asarray(values)
+    
+    if values.dtype.kind == 'M':
+        return values.astype('datetime64[us]')
+    
+    if (values.dtype == object and len(values) > 0 and 
+        isinstance(values[0], datetime)):
+        try:
+            return values.astype('datetime64[us]')
+        except (TypeError, ValueError):
+            return None
+    
+    return None
+
+
+
+def _is_dates(values):
+    """
+    Returns True if values is an array of dates, False otherwise.
+    """
+    values = numpy.asarray(values)
+    return values.dtype.kind == 'M' or (len(values) > 0 and 
+                                        isinstance(values[0], datetime))
+
+
+
+def _to_numeric(values):
+    """
+    Returns values as an array of floats. Dates are converted to matplotlib 
+    date numbers. Rather than calling date2num on every element, the dates are
+    converted to datetime64 and then offset from the date number of the first
+    element - so there is no per-element Python conversion.
+    """
+    dates = _to_datetime64(values)
+    
+    if dates is None:
+        if _is_dates(values):
+            #can't be represented as datetime64 - so have to convert them
+            #one at a time
+            return numpy.array([date2num(d) for d in values])
+        return numpy.asarray(values, dtype='float')
+    
+    if len(dates) == 0:
+        return numpy.array([], dtype='float')
+    
+    first = date2num(dates[0].astype(object))
+    return first + (dates - dates[0]).astype('float') / 86400e6
+
+
+
+def _format_column(values):
+    """
+    Returns an array of strings of the values formatted for export. Numbers
+    are formatted as "%f" and dates as str(datetime) would format them. 
+    """
+    dates = _to_datetime64(values)
+    
+    if dates is None:
+        if _is_dates(values):
+            return numpy.array([str(d) for d in values])
+        return numpy.char.mod("%f", numpy.asarray(values, dtype='float'))
+    
+    #only include the microseconds if there are any (like str(datetime))
+    if numpy.all(dates.astype('datetime64[s]') == dates):
+        unit = 's'
+    else:
+        unit = 'us'
+    return numpy.char.replace(numpy.datetime_as_string(dates, unit=unit), 'T', ' ')
+
 
 
 class DataSeriesBase(core.AvoPlotElementBase):
@@ -68,19 +151,7 @@ class DataSeriesBase(core.AvoPlotElementBase):
         the series is contained within, or None if the series does not yet 
         belong to a figure.
         """
-        #look up the list of parents recursively until we find a figure object
-        parent = self.get_parent_element()
-        while not isinstance(parent, figure.AvoPlotFigure):
-            if parent is None:
-                return None
-            parent = parent.get_parent_element()
-            
-            #sanity check - there should always be a figure object somewhere
-            #in the ancestry of a series object.
-            if isinstance(parent, core.AvoPlotSession):
-                raise RuntimeError("Reached the root element before an "
-                                   "AvoPlotFigure instance was found.")
-        return parent
+        return self.get_ancestor(figure.AvoPlotFigure)
     
     
     def get_subplot(self):
@@ -90,19 +161,7 @@ class DataSeriesBase(core.AvoPlotElementBase):
         the series is contained within, or None if the series does not yet 
         belong to a subplot.
         """
-        #look up the list of parents recursively until we find a figure object
-        parent = self.get_parent_element()
-        while not isinstance(parent, subplots.AvoPlotSubplotBase):
-            if parent is None:
-                return None
-            parent = parent.get_parent_element()
-            
-            #sanity check - there should always be a figure object somewhere
-            #in the ancestry of a series object.
-            if isinstance(parent, core.AvoPlotSession):
-                raise RuntimeError("Reached the root element before an "
-                                   "AvoPlotFigure instance was found.")
-        return parent
+        return self.get_ancestor(subplots.AvoPlotSubplotBase)
         
     
     def delete(self, update=True):
@@ -128,10 +187,10 @@ class DataSeriesBase(core.AvoPlotElementBase):
         
         self.__plotted = True
         
+        #note that the lines are not made pickable - clicks on them are found
+        #using the PlotsPanel's pick index instead (see avoplot.picking)
         self._mpl_lines = self.plot(subplot)
         
-        for l in self._mpl_lines:
-            l.set_picker(10.0)
         #self.setup_controls(subplot.get_figure())
     
     
@@ -192,6 +251,7 @@ class XYDataSeries(DataSeriesBase):
     """
     def __init__(self, name, xdata=None, ydata=None):
         super(XYDataSeries, self).__init__(name)
+        self.__data_version = 0
         self.set_xy_data(xdata, ydata)
         self.add_control_panel(XYSeriesControls(self))
         self.add_control_panel(XYSeriesFittingControls(self))
@@ -247,6 +307,18 @@ class XYDataSeries(DataSeriesBase):
         self.__xdata = numpy.array(xdata)[data_idxs]
         self.__ydata = numpy.array(ydata)[data_idxs]
         
+        #invalidate any cached data and indexes - these get rebuilt the next 
+        #time they are needed
+        self.__processed_data = None
+        self.__numeric_data = None
+        self.__x_index = None
+        self.__y_index = None
+        self.__xy_index = None
+        self.__grid_index = None
+        self.__stats_engine = None
+        self.__fit_cache = {}
+        self.__data_version += 1
+        
         if self.is_plotted():
             #update the the data in the plotted line
             line, = self.get_mpl_lines()
@@ -261,6 +333,23 @@ class XYDataSeries(DataSeriesBase):
         """
         return (self.__xdata, self.__ydata)
     
+    def get_data_version(self):
+        """
+        Returns the version number of the data held by the series. This is
+        incremented every time the data is changed using set_xy_data().
+        """
+        return self.__data_version
+    
+    
+    def get_fit_cache(self):
+        """
+        Returns the dict used to cache the results of fits to the series, 
+        keyed by fitting.get_fit_cache_key(). The cache is emptied whenever 
+        the data is changed using set_xy_data().
+        """
+        return self.__fit_cache
+    
+    
     def get_length(self):
         """
         Returns the number of data points in the series. 
@@ -283,6 +372,120 @@ class XYDataSeries(DataSeriesBase):
         """
         xdata, ydata = super(XYDataSeries, self).preprocess(xdata, ydata)
         return xdata, ydata
+    
+    
+    def __get_processed_data(self):
+        """
+        Returns a tuple (xdata, ydata) of the pre-processed data. This is 
+        computed the first time it is needed and then cached (as read-only 
+        arrays) until the data is changed using set_xy_data().
+        """
+        if self.__processed_data is None:
+            xdata, ydata = self.get_data()
+            xdata.flags.writeable = False
+            ydata.flags.writeable = False
+            self.__processed_data = (xdata, ydata)
+        return self.__processed_data
+    
+    
+    def get_numeric_data(self):
+        """
+        Returns a tuple (xdata, ydata) of the pre-processed data as (read-only)
+        arrays of floats. Any dates are converted to matplotlib date numbers. 
+        This is computed the first time it is needed and then cached until the
+        data is changed using set_xy_data().
+        """
+        if self.__numeric_data is None:
+            xdata, ydata = self.__get_processed_data()
+            xdata = _to_numeric(xdata)
+            ydata = _to_numeric(ydata)
+            xdata.flags.writeable = False
+            ydata.flags.writeable = False
+            self.__numeric_data = (xdata, ydata)
+        return self.__numeric_data
+    
+    
+    def get_data_point(self, idx):
+        """
+        Returns a tuple (x, y) of the data point at index idx in the 
+        (pre-processed) data, without copying the whole of the data arrays.
+        """
+        xdata, ydata = self.__get_processed_data()
+        return xdata[idx], ydata[idx]
+    
+    
+    def get_x_index(self):
+        """
+        Returns an avoplot.indexing.SortedIndex of the (pre-processed) x data
+        of the series. The index is built the first time it is needed and then
+        cached until the data is changed using set_xy_data().
+        """
+        if self.__x_index is None:
+            self.__x_index = indexing.SortedIndex(self.get_numeric_data()[0])
+        return self.__x_index
+    
+    
+    def get_y_index(self):
+        """
+        Returns an avoplot.indexing.SortedIndex of the (pre-processed) y data
+        of the series. The index is built the first time it is needed and then
+        cached until the data is changed using set_xy_data().
+        """
+        if self.__y_index is None:
+            self.__y_index = indexing.SortedIndex(self.get_numeric_data()[1])
+        return self.__y_index
+    
+    
+    def get_xy_index(self):
+        """
+        Returns an avoplot.indexing.NearestNeighbourIndex of the (pre-processed)
+        data of the series. The index is built the first time it is needed and
+        then cached until the data is changed using set_xy_data().
+        """
+        if self.__xy_index is None:
+            self.__xy_index = indexing.NearestNeighbourIndex(*self.get_numeric_data())
+        return self.__xy_index
+    
+    
+    def get_grid_index(self):
+        """
+        Returns an avoplot.indexing.GridIndex of the (pre-processed) data of 
+        the series, for fast rectangular region queries. The index is built the
+        first time it is needed and then cached until the data is changed using
+        set_xy_data().
+        """
+        if self.__grid_index is None:
+            self.__grid_index = indexing.GridIndex(*self.get_numeric_data())
+        return self.__grid_index
+    
+    
+    def get_statistics_engine(self):
+        """
+        Returns an avoplot.stats.StatisticsEngine for the (pre-processed) y data
+        of the series, which can be used to calculate statistics of selected 
+        ranges of the data. The engine is created the first time it is needed
+        and then cached until the data is changed using set_xy_data().
+        """
+        if self.__stats_engine is None:
+            self.__stats_engine = stats.StatisticsEngine(self.get_numeric_data()[1])
+        return self.__stats_engine
+    
+    
+    def find_nearest_x(self, x):
+        """
+        Returns the index of the data point whose x value is closest to x. 
+        Uses a binary search of the cached x index (see get_x_index()).
+        """
+        return self.get_x_index().nearest(x)
+    
+    
+    def find_nearest_point(self, x, y):
+        """
+        Returns the index of the data point closest to (x, y). Distances are 
+        measured relative to the range of the data in each dimension (see 
+        avoplot.indexing.NearestNeighbourIndex).
+        """
+        return self.get_xy_index().nearest(x, y)
         
     
     def plot(self, subplot):
@@ -311,28 +514,14 @@ class XYDataSeries(DataSeriesBase):
         if export_dialog.ShowModal() == wx.ID_OK:
             path = export_dialog.GetPath()
             persistant_storage.set_value("series_export_last_dir_used", os.path.dirname(path))
-            xdata, ydata = self.get_data()
+            xdata, ydata = self.__get_processed_data()
+            
+            #format the whole of each column at once, rather than row by row
+            lines = numpy.char.add(numpy.char.add(_format_column(xdata), '\t'),
+                                   numpy.char.add(_format_column(ydata), '\n'))
             
             with open(path, 'w') as fp:
-                
-                if isinstance(xdata[0], datetime):
-                    if isinstance(ydata[0], datetime):
-                        for i in range(len(xdata)):                   
-                            fp.write("%s\t%s\n" %(str(xdata[i]), str(ydata[i])))
-                        
-                    else:
-                        for i in range(len(xdata)):                   
-                            fp.write("%s\t%f\n" %(str(xdata[i]), ydata[i]))
-                
-                else:
-                    if isinstance(ydata[0], datetime):
-                        for i in range(len(xdata)):                 
-                            fp.write("%f\t%s\n" %(xdata[i], str(ydata[i])))
-
-                    else:
-                        for i in range(len(xdata)): 
-                            fp.write("%f\t%f\n" %(xdata[i], ydata[i]))
-
+                fp.writelines(lines)
         
         export_dialog.Destroy()            
 
@@ -485,13 +674,74 @@ class RealtimeXYDataSeries(XYDataSeries):
         
 
 class FitDataSeries(XYDataSeries):
-    def __init__(self, s, xdata, ydata, fit_params):
+    def __init__(self, s, xdata, ydata, fit_params, model=None, cache_key=None):
+        """
+        Data series representing a fit to the series s. If model (a 
+        fitting.FitModel instance) is specified, then xdata and ydata are 
+        ignored and the fit curve is instead evaluated from the model over the
+        visible part of the x axis, at the resolution of the screen. It is 
+        re-evaluated each time the x limits of the axes change.
+        
+        cache_key is the key of the fit in the fit cache of s (see 
+        fitting.get_fit_cache_key()), if there is one.
+        """
+        self.model = model
+        self.cache_key = cache_key
+        self.__xlim_cid = None
+        self.__mpl_axes = None
+        
+        if model is not None:
+            xdata, ydata = model.evaluate(500)
+        
         super(FitDataSeries, self).__init__(s.get_name() + ' Fit', xdata, ydata)
         self.fit_params = fit_params
         self.add_control_panel(FitParamsCtrl(self))
         
         s.add_subseries(self)
     
+    
+    def _plot(self, subplot):
+        """
+        Overrides the base class method in order to register a callback for 
+        changes to the x limits of the axes.
+        """
+        super(FitDataSeries, self)._plot(subplot)
+        
+        if self.model is not None:
+            self.__mpl_axes = subplot.get_mpl_axes()
+            self.__xlim_cid = self.__mpl_axes.callbacks.connect('xlim_changed', 
+                                                                self.__on_xlim_changed)
+            self.__on_xlim_changed(self.__mpl_axes)
+    
+    
+    def __on_xlim_changed(self, ax):
+        """
+        Callback for changes to the x limits of the axes. Re-evaluates the model
+        over the visible range with one point per pixel.
+        """
+        view_min, view_max = sorted(ax.get_xlim())
+        model_min, model_max = self.model.get_x_range()
+        xmin = max(view_min, model_min)
+        xmax = min(view_max, model_max)
+        
+        if xmin >= xmax:
+            #the fit is not visible - no need to do anything
+            return
+        
+        n_points = max(100, int(ax.bbox.width))
+        self.set_xy_data(*self.model.evaluate(n_points, xmin, xmax))
+    
+    
+    def delete(self, update=True):
+        """
+        Overrides the base class method in order to remove the x limits 
+        callback.
+        """
+        if self.__xlim_cid is not None:
+            self.__mpl_axes.callbacks.disconnect(self.__xlim_cid)
+            self.__xlim_cid = None
+        super(FitDataSeries, self).delete(update=update)
+    
     @staticmethod
     def get_supported_subplot_type():
         return AvoPlotXYSubplot
@@ -518,8 +768,14 @@ class FitParamsCtrl(controls.AvoPlotControlPanelBase):
         label_text = wx.StaticText(self, -1, self.fit_params[0][0]+':')
         self.Add(label_text, 0, wx.ALIGN_TOP|wx.ALL,border=10)
         
-        for name, value in self.fit_params[1:]:
-            label_text = wx.StaticText(self, -1, ''.join(["   ",name,": ","%0.3e"%value]))
+        for param in self.fit_params[1:]:
+            text = ''.join(["   ",param[0],": ","%0.3e"%param[1]])
+            
+            #parameters may also have a (lower, upper) confidence interval
+            if len(param) > 2:
+                text += "  [%0.3e, %0.3e]"%param[2]
+            
+            label_text = wx.StaticText(self, -1, text)
             self.Add(label_text, 0, wx.ALIGN_TOP|wx.ALL,border=5)
         
         
@@ -549,51 +805,141 @@ class XYSeriesFittingControls(controls.AvoPlotControlPanelBase):
         
         self.fit_type = wx.Choice(self, wx.ID_ANY, choices=[ft.name for ft in fitting.get_fitting_tools()])
         fit_type_static_sizer.Add(self.fit_type,1, wx.ALIGN_RIGHT)
+        bootstrap_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        bootstrap_sizer.Add(wx.StaticText(self, wx.ID_ANY, "Bootstrap samples:"), 0, wx.ALIGN_CENTER_VERTICAL)
+        self.bootstrap_spin = wx.SpinCtrl(self, wx.ID_ANY, min=0, max=100000, initial=0)
+        self.bootstrap_spin.SetToolTipString("Number of bootstrap resamples "
+                                             "used to estimate confidence "
+                                             "intervals on the fit parameters"
+                                             " (0 = no confidence intervals)")
+        bootstrap_sizer.Add(self.bootstrap_spin, 0, wx.LEFT, border=5)
+        fit_type_static_sizer.Add(bootstrap_sizer, 0, wx.ALIGN_RIGHT|wx.TOP, border=5)
+        fit_buttons_sizer = wx.BoxSizer(wx.HORIZONTAL)
         fit_button = wx.Button(self, -1, "Fit")
-        fit_type_static_sizer.Add(fit_button, 0, wx.ALIGN_BOTTOM | wx.ALIGN_CENTER_HORIZONTAL)
+        self.cancel_fit_button = wx.Button(self, wx.ID_ANY, "Cancel")
+        self.cancel_fit_button.Enable(False)
+        fit_buttons_sizer.Add(fit_button, 0)
+        fit_buttons_sizer.Add(self.cancel_fit_button, 0, wx.LEFT, border=5)
+        fit_type_static_sizer.Add(fit_buttons_sizer, 0, wx.ALIGN_BOTTOM | wx.ALIGN_CENTER_HORIZONTAL)
+        self.fit_progress = wx.Gauge(self, wx.ID_ANY, 100, size=(-1, 10))
+        fit_type_static_sizer.Add(self.fit_progress, 0, wx.EXPAND|wx.TOP, border=5)
+        self.fit_status_txt = wx.StaticText(self, wx.ID_ANY, "")
+        fit_type_static_sizer.Add(self.fit_status_txt, 0, wx.ALIGN_LEFT)
         self.Add(fit_type_static_sizer, 0, wx.EXPAND|wx.ALIGN_CENTER_HORIZONTAL|wx.ALL, border=5)
         
         wx.EVT_BUTTON(self, fit_button.GetId(), self.on_fit)
+        wx.EVT_BUTTON(self, self.cancel_fit_button.GetId(), self.on_cancel_fit)
         wx.EVT_CHOICE(self, self.fit_type.GetId(), self.on_tool_choice)
         
+        #fits are run in background threads - keep track of the running ones
+        #(and their fit cache keys) and pulse the progress bar while there 
+        #are any
+        self.__fit_jobs = {}
+        self.__progress_timer = wx.Timer(self)
+        wx.EVT_TIMER(self, self.__progress_timer.GetId(), self.on_progress_timer)
+        wx.EVT_WINDOW_DESTROY(self, self.on_destroy)
+        
         stats_static_sizer = wx.StaticBoxSizer(wx.StaticBox(self, wx.ID_ANY, 'Statistics'), wx.VERTICAL)
         self.samples_txt = wx.StaticText(self, wx.ID_ANY, "\tNum. Samples:")
         self.mean_txt = wx.StaticText(self, wx.ID_ANY, "\tMean:")
         self.stddev_txt = wx.StaticText(self, wx.ID_ANY, "\tStd. Dev.:")
         self.min_txt = wx.StaticText(self, wx.ID_ANY, "\tMin. Value:")
         self.max_txt = wx.StaticText(self, wx.ID_ANY, "\tMax. Value:")
+        self.median_txt = wx.StaticText(self, wx.ID_ANY, "\tMedian:")
         stats_static_sizer.Add(self.samples_txt, 0, wx.ALIGN_LEFT)
         stats_static_sizer.Add(self.mean_txt, 0, wx.ALIGN_LEFT)
         stats_static_sizer.Add(self.stddev_txt, 0, wx.ALIGN_LEFT)
         stats_static_sizer.Add(self.min_txt, 0, wx.ALIGN_LEFT)
         stats_static_sizer.Add(self.max_txt, 0, wx.ALIGN_LEFT)
+        stats_static_sizer.Add(self.median_txt, 0, wx.ALIGN_LEFT)
         self.calc_button = wx.Button(self, wx.ID_ANY, "Calculate")
         stats_static_sizer.Add(self.calc_button, 0, wx.ALIGN_CENTER_HORIZONTAL)
+        self.live_stats_checkbox = wx.CheckBox(self, wx.ID_ANY, "Live update")
+        self.live_stats_checkbox.SetToolTipString("Update the statistics while "
+                                                  "the selection is being made")
+        stats_static_sizer.Add(self.live_stats_checkbox, 0, wx.ALIGN_CENTER_HORIZONTAL|wx.TOP, border=5)
         self.Add(stats_static_sizer, 0, wx.EXPAND|wx.ALIGN_CENTER_HORIZONTAL|wx.ALL, border=5)
         
         wx.EVT_BUTTON(self, self.calc_button.GetId(), self.on_calculate)
+        wx.EVT_CHECKBOX(self, self.live_stats_checkbox.GetId(), self.on_live_stats)
+        
+        self.__live_stats_timer = None
         
         self.span = None
     
     def on_calculate(self, evnt):
-        mask = self.selection_panel.get_selection()
-        selected_idxs = numpy.where(mask)
-        raw_x, raw_y = self.series.get_data()
-        
-        n_samples = len(selected_idxs[0])
-        self.samples_txt.SetLabel("\tNum. Samples: %d"%n_samples)
-        
-        if n_samples > 0: #if not an empty selection
-            self.mean_txt.SetLabel("\tMean: %e"%numpy.mean(raw_y[selected_idxs]))
-            self.stddev_txt.SetLabel("\tStd. Dev.: %e"%numpy.std(raw_y[selected_idxs]))
-            self.min_txt.SetLabel("\tMin. Value: %e"%numpy.min(raw_y[selected_idxs]))
-            self.max_txt.SetLabel("\tMax. Value: %e"%numpy.max(raw_y[selected_idxs]))
+        selection = self.selection_panel.get_selection()
+        self.show_statistics(selection.get_ranges())
+    
+    
+    def on_live_stats(self, evnt):
+        """
+        Event handler for the live update checkbox. Turns live updating of the
+        statistics on or off.
+        """
+        if self.live_stats_checkbox.IsChecked():
+            self.selection_panel.set_live_callback(self.on_selection_changed)
+            self.on_calculate(None)
+        else:
+            self.selection_panel.set_live_callback(None)
+    
+    
+    def on_selection_changed(self):
+        """
+        Callback for changes to the selection when live updating is turned on.
+        This gets called at mouse-move rate while the selection is being 
+        dragged out, so the statistics are only recalculated at most once per
+        frame (and always for the latest selection).
+        """
+        if self.__live_stats_timer is None:
+            self.__live_stats_timer = wx.CallLater(1000 / 30, 
+                                                   self.__update_live_stats)
+    
+    
+    def __update_live_stats(self):
+        self.__live_stats_timer = None
+        
+        #the control panel may have been destroyed since the timer was started
+        if not self:
+            return
+        
+        #calculating the median is O(number of selected points), so leave it
+        #until the selection has been released rather than doing it for every
+        #frame of the drag
+        selection = self.selection_panel.get_selection()
+        in_progress = self.selection_panel.is_selection_in_progress()
+        self.show_statistics(selection.get_ranges(), 
+                             include_median=not in_progress)
+    
+    
+    def show_statistics(self, ranges, include_median=True):
+        """
+        Calculates the statistics of the (start, stop) index ranges of the 
+        series using the series' statistics engine, and displays them. If
+        include_median is False then the median is not calculated and is shown
+        as being out of date.
+        """
+        engine = self.series.get_statistics_engine()
+        selection_stats = engine.get_statistics(ranges)
+        
+        if selection_stats is not None: #if not an empty selection
+            self.samples_txt.SetLabel("\tNum. Samples: %d"%selection_stats.n_samples)
+            self.mean_txt.SetLabel("\tMean: %e"%selection_stats.mean)
+            self.stddev_txt.SetLabel("\tStd. Dev.: %e"%selection_stats.std_dev)
+            self.min_txt.SetLabel("\tMin. Value: %e"%selection_stats.min)
+            self.max_txt.SetLabel("\tMax. Value: %e"%selection_stats.max)
+            if include_median:
+                self.median_txt.SetLabel("\tMedian: %e"%engine.get_percentile(ranges, 50))
+            else:
+                self.median_txt.SetLabel("\tMedian: (updated on release)")
             
         else:
+            self.samples_txt.SetLabel("\tNum. Samples: 0")
             self.mean_txt.SetLabel("\tMean:")
             self.stddev_txt.SetLabel("\tStd. Dev.:")
             self.min_txt.SetLabel("\tMin. Value:")
             self.max_txt.SetLabel("\tMax. Value:")
+            self.median_txt.SetLabel("\tMedian:")
     
     def on_tool_choice(self, evnt):
         self.__current_tool_idx = self.fit_type.GetCurrentSelection()
@@ -601,19 +947,138 @@ class XYSeriesFittingControls(controls.AvoPlotControlPanelBase):
             
     def on_fit(self, evnt):
         
-        mask = self.selection_panel.get_selection()
-        selected_idxs = numpy.where(mask)
-        raw_x, raw_y = self.series.get_data()
+        selection = self.selection_panel.get_selection()
+        raw_x, raw_y = self.series.get_numeric_data()
         
         fitting_tool = fitting.get_fitting_tools()[self.__current_tool_idx]
         
-        fit_x_data, fit_y_data, fit_params = fitting_tool.fit(raw_x[selected_idxs], 
-                                                              raw_y[selected_idxs])
+        #the tools are shared between all the series, so work on a copy of the
+        #tool when changing its settings
+        fitting_tool = copy.copy(fitting_tool)
+        fitting_tool.set_bootstrap(self.bootstrap_spin.GetValue())
+        
+        #if we have already done this fit then there is no need to do it again
+        key = fitting.get_fit_cache_key(self.series.get_data_version(), 
+                                        selection.get_ranges(), fitting_tool)
+        fit_cache = self.series.get_fit_cache()
+        if fit_cache.has_key(key):
+            self.__show_fit(key, fit_cache[key])
+            return
+        
+        if key in self.__fit_jobs.values():
+            #this fit is already running
+            return
+        
+        #run the fit in a background thread so that the GUI stays responsive -
+        #the results get plotted (in the main thread) once it is finished
+        job = fitting.FitJob(fitting_tool, selection.take(raw_x), 
+                             selection.take(raw_y),
+                             lambda j, r: wx.CallAfter(self.on_fit_finished, j, r),
+                             lambda j, e: wx.CallAfter(self.on_fit_failed, j, e))
+        self.__fit_jobs[job] = key
+        job.start()
+        self.__update_fit_status()
+    
+    
+    def on_cancel_fit(self, evnt):
+        """
+        Event handler for the cancel button. Cancels all the running fits.
+        """
+        for job in self.__fit_jobs:
+            job.cancel()
+    
+    
+    def on_destroy(self, evnt):
+        """
+        Event handler for the panel being destroyed (e.g. because the series 
+        has been deleted). Cancels all the running fits, since there is no 
+        longer anywhere to show their results.
+        """
+        if evnt.GetEventObject() is self:
+            for job in self.__fit_jobs:
+                job.cancel()
+            self.__progress_timer.Stop()
+        evnt.Skip()
+    
+    
+    def on_fit_finished(self, job, result):
+        """
+        Called (in the main thread) when a fit job completes. Plots the fit.
+        """
+        #the panel may have been destroyed since the fit was started
+        if not self:
+            return
+        
+        key = self.__fit_jobs.pop(job)
+        self.__update_fit_status()
+        
+        #the series may have been deleted while the fit was running
+        if self.series.get_subplot() is None:
+            return
+        
+        #don't cache the result if the data has changed since the fit started
+        if key[0] == self.series.get_data_version():
+            self.series.get_fit_cache()[key] = result
         
-        FitDataSeries(self.series, fit_x_data, fit_y_data, fit_params)
+        self.__show_fit(key, result)
+    
+    
+    def __show_fit(self, key, result):
+        """
+        Plots the fit result (a (FitModel, fit_params) tuple) as a child series
+        of the series, unless that fit is already plotted.
+        """
+        for child in self.series.get_child_elements():
+            if isinstance(child, FitDataSeries) and child.cache_key == key:
+                return
+        
+        model, fit_params = result
+        FitDataSeries(self.series, None, None, fit_params, model=model, 
+                      cache_key=key)
         self.series.update()
     
     
+    def on_fit_failed(self, job, exception):
+        """
+        Called (in the main thread) when a fit job fails or is cancelled.
+        """
+        #the panel may have been destroyed since the fit was started
+        if not self:
+            return
+        
+        del self.__fit_jobs[job]
+        self.__update_fit_status()
+        
+        if not isinstance(exception, fitting.FittingCancelled):
+            wx.MessageBox("Fitting failed: %s"%exception, avoplot.PROG_SHORT_NAME, 
+                          wx.ICON_ERROR)
+    
+    
+    def on_progress_timer(self, evnt):
+        """
+        Event handler for the progress bar timer.
+        """
+        self.fit_progress.Pulse()
+    
+    
+    def __update_fit_status(self):
+        """
+        Updates the fit status text, progress bar and cancel button to reflect
+        the number of fits which are currently running.
+        """
+        n_jobs = len(self.__fit_jobs)
+        self.cancel_fit_button.Enable(n_jobs > 0)
+        
+        if n_jobs > 0:
+            self.fit_status_txt.SetLabel("Fitting (%d running)..."%n_jobs)
+            if not self.__progress_timer.IsRunning():
+                self.__progress_timer.Start(100)
+        else:
+            self.fit_status_txt.SetLabel("")
+            self.__progress_timer.Stop()
+            self.fit_progress.SetValue(0)
+    
+    
     def on_control_panel_active(self):
         """
         This gets called automatically when the control panel is selected.
@@ -0,0 +1,328 @@
+#Copyright (C) Nial Peters 2013
+#
+#This file is part of AvoPlot.
+#
+#AvoPlot is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#AvoPlot is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with AvoPlot.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The stats module provides the StatisticsEngine class, which precomputes
+summaries of a data series so that statistics of any selected range (or union
+of ranges) of the series can be calculated without having to scan the selected
+data.
+"""
+
+import numpy
+import collections
+
+
+#new data type to hold the results of statistics queries
+Statistics = collections.namedtuple('Statistics', ['n_samples', 'mean',
+                                                   'std_dev', 'min', 'max'])
+
+
+def ranges_to_indices(ranges):
+    """
+    Returns an array of all the indices in the (start, stop) ranges (where stop
+    is not included in the range). This is vectorised, so is fast even if 
+    there are a large number of ranges.
+    """
+    ranges = numpy.asarray(ranges, dtype='int').reshape(-1, 2)
+    lengths = numpy.maximum(ranges[:, 1] - ranges[:, 0], 0)
+    
+    #each index is its position in the output, offset by the difference 
+    #between the start of its range and the start of its range in the output
+    offsets = ranges[:, 0] - (numpy.cumsum(lengths) - lengths)
+    return numpy.arange(lengths.sum()) + numpy.repeat(offsets, lengths)
+
+
+
+class StatisticsEngine(object):
+
+    def __init__(self, values, block_size=64):
+        """
+        Precomputes prefix sums, prefix sums of squares and a block-based
+        sparse table of minimum and maximum values for the 1D array values.
+        The number of samples, mean, standard deviation, min and max of any
+        (start, stop) range of the values can then be found in O(1) time (plus
+        a scan of at most 2*block_size values at the ends of the range).
+        NaN values are ignored.
+
+        Percentiles are found using the rank of each value in a sorted copy of
+        the values. The ranks are sorted within blocks of about 4*sqrt(n) 
+        values (but at least 16*block_size), so that the number of selected values below a given rank can be counted
+        with one binary search per complete block in the selection (see 
+        get_percentile()). These are created the first time that they are 
+        needed.
+        """
+        self.__values = numpy.asarray(values, dtype='float')
+        self.__block_size = block_size
+        self.__sorted_values = None
+        self.__ranks = None
+        self.__rank_keys = None
+        
+        #this block size balances the number of complete blocks that need 
+        #searching against the number of values at the ends of the ranges that
+        #need sorting
+        n = max(len(self.__values), 1)
+        self.__rank_block_size = max(16 * block_size,
+                                     2 ** int(numpy.ceil(numpy.log2(4 * numpy.sqrt(n)))))
+
+        valid = numpy.logical_not(numpy.isnan(self.__values))
+        self.__n_valid = numpy.concatenate(([0], numpy.cumsum(valid)))
+
+        #the sums are of the values minus their mean, which keeps the sums of
+        #squares from losing precision for data with a large offset
+        if self.__n_valid[-1] > 0:
+            self.__shift = self.__values[valid].mean()
+        else:
+            self.__shift = 0.0
+        shifted = numpy.where(valid, self.__values - self.__shift, 0.0)
+        self.__sums = numpy.concatenate(([0.0], numpy.cumsum(shifted)))
+        self.__sums_sq = numpy.concatenate(([0.0], numpy.cumsum(shifted ** 2)))
+        del shifted
+
+        #sparse tables of the min and max of each block of values - level j
+        #of a table holds the min (max) of 2**j consecutive blocks
+        self.__min_table = [self.__block_reduce(numpy.fmin)]
+        self.__max_table = [self.__block_reduce(numpy.fmax)]
+
+        span = 1
+        while 2 * span <= len(self.__min_table[0]):
+            prev_min = self.__min_table[-1]
+            prev_max = self.__max_table[-1]
+            self.__min_table.append(numpy.fmin(prev_min[:-span], prev_min[span:]))
+            self.__max_table.append(numpy.fmax(prev_max[:-span], prev_max[span:]))
+            span *= 2
+    
+    
+    def __block_reduce(self, func):
+        """
+        Returns an array of func applied to each block of the values (func
+        should be numpy.fmin or numpy.fmax).
+        """
+        n_full_blocks = len(self.__values) // self.__block_size
+        full_length = n_full_blocks * self.__block_size
+
+        blocks = func.reduce(self.__values[:full_length].reshape(n_full_blocks,
+                                                                 self.__block_size),
+                             axis=1)
+
+        if full_length < len(self.__values):
+            blocks = numpy.concatenate((blocks,
+                                        [func.reduce(self.__values[full_length:])]))
+        return blocks
+    
+    
+    def __range_extreme(self, start, stop, func, table):
+        """
+        Returns func (numpy.fmin or numpy.fmax) of values[start:stop], using
+        the sparse table for all of the complete blocks in the range.
+        """
+        bs = self.__block_size
+
+        #first and last (exclusive) complete blocks in the range
+        first_block = -(-start // bs)
+        last_block = stop // bs
+
+        if last_block - first_block < 1:
+            #range is too short to contain any complete blocks
+            return func.reduce(self.__values[start:stop])
+
+        level = int(numpy.log2(last_block - first_block))
+        span = 2 ** level
+        result = func(table[level][first_block], table[level][last_block - span])
+
+        if start < first_block * bs:
+            result = func(result, func.reduce(self.__values[start:first_block * bs]))
+        if last_block * bs < stop:
+            result = func(result, func.reduce(self.__values[last_block * bs:stop]))
+
+        return result
+    
+    
+    def __len__(self):
+        return len(self.__values)
+    
+    
+    def get_interval_statistics(self, start, stop):
+        """
+        Returns a Statistics named tuple for values[start:stop], or None if
+        there are no (non-NaN) values in the range.
+        """
+        return self.get_statistics([(start, stop)])
+    
+    
+    def get_statistics(self, ranges):
+        """
+        Returns a Statistics named tuple for the union of the (start, stop)
+        ranges of the values, or None if there are no (non-NaN) values in the
+        ranges. The ranges should be sorted and should not overlap. The sums 
+        are found with a single vectorised lookup regardless of the number of
+        ranges, but the min and max require a lookup per range. If there are 
+        very many ranges then the min and max are instead computed directly 
+        from the selected values.
+        """
+        ranges = numpy.asarray(ranges, dtype='int').reshape(-1, 2)
+        starts = ranges[:, 0]
+        stops = ranges[:, 1]
+
+        n = (self.__n_valid[stops] - self.__n_valid[starts]).sum()
+        if n == 0:
+            return None
+
+        s1 = (self.__sums[stops] - self.__sums[starts]).sum() / n
+        s2 = (self.__sums_sq[stops] - self.__sums_sq[starts]).sum() / n
+
+        mean = self.__shift + s1
+        std_dev = numpy.sqrt(max(s2 - s1 ** 2, 0.0))
+
+        ranges = ranges[stops > starts]
+        
+        if len(ranges) > 1000:
+            #reduce each of the ranges in one go - reduceat reduces between 
+            #consecutive indices, so every other result is one of our ranges
+            idxs = ranges.ravel()
+            if idxs[-1] == len(self.__values):
+                idxs = idxs[:-1]
+            min_val = numpy.fmin.reduce(numpy.fmin.reduceat(self.__values, idxs)[::2])
+            max_val = numpy.fmax.reduce(numpy.fmax.reduceat(self.__values, idxs)[::2])
+        else:
+            min_val = numpy.fmin.reduce([self.__range_extreme(a, b, numpy.fmin,
+                                                              self.__min_table)
+                                         for a, b in ranges])
+            max_val = numpy.fmax.reduce([self.__range_extreme(a, b, numpy.fmax,
+                                                              self.__max_table)
+                                         for a, b in ranges])
+
+        return Statistics(int(n), mean, std_dev, min_val, max_val)
+    
+    
+    def __build_rank_index(self):
+        """
+        Creates the sorted copy of the (non-NaN) values, the rank of each value
+        in it and the ranks sorted within each block. The sorted ranks of block
+        i are offset by i*(n+1) (where n is the number of values), so that all 
+        the blocks can be searched in one go.
+        """
+        n = len(self.__values)
+        bs = self.__rank_block_size
+        
+        #argsort puts any NaNs at the end, so they get the highest ranks
+        order = numpy.argsort(self.__values, kind='mergesort')
+        self.__sorted_values = self.__values[order[:self.__n_valid[-1]]]
+        
+        self.__ranks = numpy.empty(n, dtype='int64')
+        self.__ranks[order] = numpy.arange(n)
+        del order
+        
+        #pad the last block with ranks which will never be counted
+        n_blocks = -(-n // bs)
+        blocks = numpy.empty(n_blocks * bs, dtype='int64')
+        blocks[:n] = self.__ranks
+        blocks[n:] = n
+        blocks = numpy.sort(blocks.reshape(n_blocks, bs), axis=1)
+        
+        blocks += (numpy.arange(n_blocks, dtype='int64') * (n + 1))[:, numpy.newaxis]
+        self.__rank_keys = blocks.ravel()
+    
+    
+    def __select(self, k, full_blocks, partial_ranks):
+        """
+        Returns the k-th smallest (counting from zero) of the selected values,
+        where the selection is made up of the complete blocks full_blocks plus 
+        the values with the (sorted) ranks partial_ranks. This is a binary 
+        search over the ranks, each step of which counts the selected values 
+        below a rank with a single vectorised search of the blocks.
+        """
+        n1 = len(self.__values) + 1
+        block_offsets = full_blocks * n1
+        block_starts = full_blocks * self.__rank_block_size
+        
+        lo = 0
+        hi = len(self.__sorted_values) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            
+            #number of selected values with rank <= mid
+            count = ((numpy.searchsorted(self.__rank_keys, block_offsets + mid + 1) - 
+                      block_starts).sum() +
+                     numpy.searchsorted(partial_ranks, mid + 1))
+            
+            if count >= k + 1:
+                hi = mid
+            else:
+                lo = mid + 1
+        
+        return self.__sorted_values[lo]
+    
+    
+    def get_percentile(self, ranges, q):
+        """
+        Returns the q-th percentile (0 <= q <= 100) of the union of the
+        (start, stop) ranges of the values, or None if there are no (non-NaN)
+        values in the ranges. Values between the closest ranks are linearly 
+        interpolated (as numpy.percentile). If the ranges cover all of the 
+        values, then the percentile is looked up directly from a sorted copy of
+        the values. Otherwise it is found by a binary search over the ranks 
+        of the values, which takes O(log(n)) searches of the complete blocks 
+        in the ranges, plus a sort of the ranks of the (at most 2 blocks per 
+        range) values at the ends of the ranges. No selected values are 
+        copied other than those at the ends of the ranges.
+        """
+        ranges = numpy.asarray(ranges, dtype='int').reshape(-1, 2)
+        ranges = ranges[ranges[:, 1] > ranges[:, 0]]
+        
+        m = (self.__n_valid[ranges[:, 1]] - self.__n_valid[ranges[:, 0]]).sum()
+        if m == 0:
+            return None
+        
+        #linear interpolation between the closest ranks (as numpy.percentile)
+        pos = (m - 1) * q / 100.0
+        lower = int(numpy.floor(pos))
+        upper = min(lower + 1, m - 1)
+        
+        if self.__ranks is None:
+            self.__build_rank_index()
+        
+        if (ranges[:, 1] - ranges[:, 0]).sum() == len(self.__values):
+            lower_val = self.__sorted_values[lower]
+            upper_val = self.__sorted_values[upper]
+        
+        else:
+            #split the ranges into the complete blocks that they contain and 
+            #the partial blocks at their ends
+            bs = self.__rank_block_size
+            first_blocks = -(-ranges[:, 0] // bs)
+            last_blocks = ranges[:, 1] // bs
+            has_blocks = last_blocks > first_blocks
+            
+            full_blocks = ranges_to_indices(numpy.column_stack((first_blocks[has_blocks],
+                                                                last_blocks[has_blocks])))
+            
+            partial = numpy.concatenate((
+                    ranges[numpy.logical_not(has_blocks)],
+                    numpy.column_stack((ranges[has_blocks, 0], 
+                                        first_blocks[has_blocks] * bs)),
+                    numpy.column_stack((last_blocks[has_blocks] * bs, 
+                                        ranges[has_blocks, 1]))))
+            partial_ranks = numpy.sort(self.__ranks[ranges_to_indices(partial)])
+            
+            lower_val = self.__select(lower, full_blocks, partial_ranks)
+            if upper == lower:
+                upper_val = lower_val
+            else:
+                upper_val = self.__select(upper, full_blocks, partial_ranks)
+        
+        return lower_val + (upper_val - lower_val) * (pos - lower)
+
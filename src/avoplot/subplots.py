@@ -25,6 +25,7 @@ from avoplot import controls
 from avoplot import plugins
 import threading
 import time
+import contextlib
 import wx
 import numpy
 from wx.lib.agw import floatspin
@@ -56,6 +57,12 @@ class AvoPlotSubplotBase(core.AvoPlotElementBase):
     __metaclass__ = MetaCallMyInit
     
     def __init__(self, fig, name='subplot'):
+        #these need to be set before calling the base class __init__ method, 
+        #since that will generate a rename event (see _post_event())
+        self.__batch_depth = 0
+        self.__held_events = []
+        self.__update_required = False
+        
         super(AvoPlotSubplotBase, self).__init__(name)
         self.set_parent_element(fig)
     
@@ -67,6 +74,83 @@ class AvoPlotSubplotBase(core.AvoPlotElementBase):
         """
         #assert isinstance(data, series.DataSeriesBase)
         data.set_parent_element(self)
+    
+    
+    def add_data_series_many(self, series_list):
+        """
+        Adds all the data series in series_list to the subplot, redrawing the 
+        subplot only once all of them have been added. This is much faster than
+        calling add_data_series() for each series in turn.
+        """
+        with self.batch():
+            for s in series_list:
+                self.add_data_series(s)
+    
+    
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Context manager for making lots of changes to the subplot in one go. 
+        Any redraws and element events (add, rename etc.) requested by the 
+        subplot or its children inside the with block are held back until the
+        block exits, at which point the events are posted and the subplot is 
+        redrawn once. For example:
+        
+        with subplot.batch():
+            for s in lots_of_series:
+                subplot.add_data_series(s)
+        
+        Batches may be nested, in which case nothing happens until the 
+        outermost batch exits.
+        """
+        self.__batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.__batch_depth -= 1
+            
+            if not self.__batch_depth:
+                held_events = self.__held_events
+                self.__held_events = []
+                for evnt in held_events:
+                    super(AvoPlotSubplotBase, self)._post_event(evnt)
+                
+                if self.__update_required:
+                    self.__update_required = False
+                    self.update()
+    
+    
+    def is_batching(self):
+        """
+        Returns True if the subplot is currently inside a batch() block, False
+        otherwise.
+        """
+        return self.__batch_depth > 0
+    
+    
+    def _defer_update(self):
+        """
+        Should be called at the start of the update() method of subclasses. If 
+        the subplot is currently inside a batch() block then this records that
+        an update is needed once the batch completes and returns True (in which
+        case update() should return without redrawing). Otherwise it returns 
+        False.
+        """
+        if self.__batch_depth:
+            self.__update_required = True
+            return True
+        return False
+    
+    
+    def _post_event(self, evnt):
+        """
+        Overrides the AvoPlotElementBase class's method in order to hold back
+        events while the subplot is inside a batch() block.
+        """
+        if self.__batch_depth:
+            self.__held_events.append(evnt)
+        else:
+            super(AvoPlotSubplotBase, self)._post_event(evnt)
         
         
     def set_parent_element(self, parent):
@@ -94,19 +178,7 @@ class AvoPlotSubplotBase(core.AvoPlotElementBase):
         get_figure().get_mpl_figure() to get the matplotlib figureobject that 
         the subplot is associated with.
         """
-        #look up the list of parents recursively until we find a figure object
-        parent = self.get_parent_element()
-        while not isinstance(parent, figure.AvoPlotFigure):
-            if parent is None:
-                return None
-            parent = parent.get_parent_element()
-            
-            #sanity check - there should always be a figure object somewhere
-            #in the ancestry of a series object.
-            if isinstance(parent, core.AvoPlotSession):
-                raise RuntimeError("Reached the root element before an "
-                                   "AvoPlotFigure instance was found.")
-        return parent
+        return self.get_ancestor(figure.AvoPlotFigure)
     
     
 #     def on_mouse_button(self, evnt):
@@ -130,8 +202,6 @@ class AvoPlotXYSubplot(AvoPlotSubplotBase):
         
         self.add_control_panel(XYSubplotControls(self))
         
-        self.__mpl_axes.set_picker(5.0)
-        
         
     def get_mpl_artists(self):
         """
@@ -213,13 +283,15 @@ class AvoPlotXYSubplot(AvoPlotSubplotBase):
     
     def update(self):
         """
-        Redraws the subplot.
+        Redraws the subplot. If the subplot is inside a batch() block, then the
+        redraw is postponed until the end of the block.
         """
+        if self._defer_update():
+            return
+        
         fig = self.get_figure()
-        if fig is not None:
-            canvas = fig.canvas
-            if canvas:
-                canvas.draw()
+        if fig is not None and fig.canvas:
+            fig.update()
         
 
 
@@ -279,7 +351,7 @@ class XYSubplotControls(controls.AvoPlotControlPanelBase):
         
         x_axis_ctrls_szr.Add(GridLinesCheckBox(self, ax.xaxis, self.subplot), 0 , wx.ALIGN_LEFT| wx.LEFT, border=10)
         
-        xtick_labels_chkbox = TickLabelsCheckBox(self, ax.xaxis)
+        xtick_labels_chkbox = TickLabelsCheckBox(self, ax.xaxis, self.subplot)
         xtick_labels_chkbox.set_checked(True)
         x_axis_ctrls_szr.Add(xtick_labels_chkbox, 0 , wx.ALIGN_LEFT| wx.LEFT| wx.BOTTOM, border=10)
         self.Add(x_axis_ctrls_szr, 0, wx.EXPAND|wx.ALL, border=5)
@@ -292,7 +364,7 @@ class XYSubplotControls(controls.AvoPlotControlPanelBase):
         
         y_axis_ctrls_szr.Add(GridLinesCheckBox(self, ax.yaxis, self.subplot), 0 , wx.ALIGN_LEFT| wx.LEFT, border=10)
         
-        ytick_labels_chkbox = TickLabelsCheckBox(self, ax.yaxis)
+        ytick_labels_chkbox = TickLabelsCheckBox(self, ax.yaxis, self.subplot)
         ytick_labels_chkbox.set_checked(True)
         y_axis_ctrls_szr.Add(ytick_labels_chkbox, 0 , wx.ALIGN_LEFT| wx.LEFT | wx.BOTTOM, border=10)
         
@@ -376,7 +448,7 @@ class InspectableXYSubplot(AvoPlotXYSubplot):
         if self.__enabled:
             return
         self.__enabled = True
-        self.series = list(self.get_child_elements())[0]
+        self.series = self.get_child_elements().first()
         self.visible = True
         
         #register the event handlers
@@ -449,10 +521,9 @@ class InspectableXYSubplot(AvoPlotXYSubplot):
         if self.background is None:
             self.update_background()
         
-        xdata, ydata = self.series.get_data()
-        data_loc = numpy.argmin(numpy.fabs(xdata - event.xdata))
+        data_loc = self.series.find_nearest_x(event.xdata)
         
-        l = self.ax.axvline(xdata[data_loc], linewidth=2)
+        l = self.ax.axvline(self.series.get_data_point(data_loc)[0], linewidth=2)
         
         self._selection_lines.append(l)
         self._selected_points.append(data_loc)
@@ -464,9 +535,7 @@ class InspectableXYSubplot(AvoPlotXYSubplot):
     
         
     def set_selection(self, xidx):
-        xdata, ydata = self.series.get_data()
-        
-        l = self.ax.axvline(xdata[xidx], linewidth=2)
+        l = self.ax.axvline(self.series.get_data_point(xidx)[0], linewidth=2)
         
         self._selection_lines.append(l)
         self._selected_points.append(xidx)
@@ -533,7 +602,7 @@ class GridLinesCheckBox(avoplot.gui.widgets.EditableCheckBox):
         Event handler for the gridlines checkbox.
         """
         self.mpl_axis.grid(b=evnt.IsChecked())
-        self.mpl_axis.figure.canvas.draw()
+        self.subplot.update()
   
             
     def on_edit_link(self, evnt):
@@ -544,17 +613,22 @@ class GridLinesCheckBox(avoplot.gui.widgets.EditableCheckBox):
         
 class TickLabelsCheckBox(avoplot.gui.widgets.EditableCheckBox):
     
-    def __init__(self, parent, mpl_axis):
+    def __init__(self, parent, mpl_axis, subplot=None):
         
         avoplot.gui.widgets.EditableCheckBox.__init__(self, parent, 
                                                       "Tick labels")
         self.mpl_axis = mpl_axis
+        self.subplot = subplot
     
     
     def on_checkbox(self, evnt):
         for label in self.mpl_axis.get_ticklabels():
             label.set_visible(evnt.IsChecked())
-        self.mpl_axis.figure.canvas.draw()
+        
+        if self.subplot is not None:
+            self.subplot.update()
+        else:
+            self.mpl_axis.figure.canvas.draw()
     
     
     def on_edit_link(self, evnt):
@@ -640,6 +714,9 @@ class RealtimeXYSubplot(AvoPlotXYSubplot):
     
     
     def update(self):
+        if self._defer_update():
+            return
+        
         super(RealtimeXYSubplot,self).update()
 
         #refresh the pixel buffer